@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Admin authentication
+Salted scrypt password checks run on a small worker pool, with per-client
+login throttling that turns brute force away before it costs a hash
+
+ADMIN_PASSWORD_HASH holds a Werkzeug password hash; make one with
+    python admin_auth.py hash
+Bare sha256 hex digests (the old format) are refused at startup.
+"""
+
+import argparse
+import asyncio
+import getpass
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from rate_limit import parse_limit
+
+logger = logging.getLogger(__name__)
+
+# Login attempts per client IP ('count/seconds', see rate_limit.py), checked
+# before hashing. There is deliberately no account-wide limit: anyone could
+# use it up and lock the admin out.
+ADMIN_LOGIN_RATE_LIMIT = os.getenv('ADMIN_LOGIN_RATE_LIMIT', '5/60')
+# Password checks run at once per process (each scrypt check takes ~32 MiB
+# and 100-150 ms of CPU), and how many more may wait for one
+ADMIN_AUTH_WORKERS = int(os.getenv('ADMIN_AUTH_WORKERS', 2))
+ADMIN_AUTH_MAX_PENDING = int(os.getenv('ADMIN_AUTH_MAX_PENDING', 8))
+PASSWORD_HASH_METHOD = 'scrypt'  # werkzeug's scrypt:32768:8:1 with a random salt
+
+# hash_password('admin123'), used (with a warning) when ADMIN_PASSWORD_HASH is unset
+DEFAULT_PASSWORD_HASH = (
+    'scrypt:32768:8:1$u6kF06hnJinKMbT2$e35c37dc33b77bba106e2fcdcedabe59ed997e3be617ce84f3df03165ac5975340f73af'
+    'd9981efd75721a92a89fe37268618f0428d387997d26c89326e39ed8e'
+)
+
+PASSWORD_HASH = re.compile(r'(scrypt|pbkdf2):[0-9:a-z]+\$[^$]+\$[0-9a-f]+')
+
+
+class LoginThrottled(Exception):
+    """Too many attempts (or checks in progress); retry after retry_after seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Login throttled, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def hash_password(password) -> str:
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password) -> bool:
+    """Check a password against a Werkzeug hash (compared with hmac.compare_digest)"""
+    return check_password_hash(password_hash, password)
+
+
+class AdminAuthenticator:
+    """
+    Checks admin logins. Each attempt first takes a token from the client's
+    bucket in `limiter` (a rate_limit.RateLimiter), so a throttled attempt
+    costs a dictionary lookup. Admitted attempts are
+    hashed on a pool of `workers` threads (hashlib.scrypt releases the GIL,
+    and the pool bounds the memory and CPU logins can take); when `workers
+    + max_pending` checks are already in progress the attempt is throttled
+    too, rather than queued.
+    """
+
+    def __init__(self, username, password_hash, limiter, client_limit=ADMIN_LOGIN_RATE_LIMIT,
+                 workers=ADMIN_AUTH_WORKERS, max_pending=ADMIN_AUTH_MAX_PENDING):
+        if not PASSWORD_HASH.fullmatch(password_hash):
+            # Includes the unsalted sha256 digests older versions used
+            raise ValueError("ADMIN_PASSWORD_HASH must be a salted hash from 'python admin_auth.py hash'")
+        if password_hash == DEFAULT_PASSWORD_HASH:
+            logger.warning("ADMIN_PASSWORD_HASH is not set, so the admin password is the default; "
+                           "set it to the output of 'python admin_auth.py hash'")
+        self.username = username
+        self.password_hash = password_hash
+        self.limiter = limiter
+        self.client_limit = parse_limit(client_limit)
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Threads don't survive fork, so each worker process starts its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='admin-auth')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _admit(self, client):
+        """Take this attempt's token and a hashing slot, or raise LoginThrottled"""
+        retry_after = self.limiter.hit('admin-login', client, *self.client_limit)
+        if retry_after:
+            logger.debug(f"Admin login throttled for {client}")
+            raise LoginThrottled(retry_after)
+        if not self._slots.acquire(blocking=False):
+            raise LoginThrottled(1)
+
+    def _check(self, username, password) -> bool:
+        try:
+            # The password is checked even for a wrong username, so both take as long
+            password_ok = verify_password(self.password_hash, password)
+            return hmac.compare_digest(username.encode(), self.username.encode()) and password_ok
+        finally:
+            self._slots.release()
+
+    def authenticate(self, username, password, client) -> bool:
+        """Whether the credentials are the admin's; raises LoginThrottled"""
+        self._admit(client)
+        return self._pool().submit(self._check, username, password).result()
+
+    async def authenticate_async(self, username, password, client) -> bool:
+        """authenticate() for asyncio handlers: the event loop keeps running while the hash is checked"""
+        self._admit(client)
+        return await asyncio.wrap_future(self._pool().submit(self._check, username, password))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Admin password hashes')
+    parser.add_argument('command', choices=['hash'], help='hash prompts for a password and prints '
+                                                          'the value for ADMIN_PASSWORD_HASH')
+    parser.parse_args()
+
+    password = getpass.getpass('Admin password: ')
+    if password != getpass.getpass('Repeat: '):
+        print('Passwords do not match', file=sys.stderr)
+        return 1
+    print(hash_password(password))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,17 +4,28 @@ Teknoledge Registration Backend
 Handles form submissions, stores in SQLite, and sends email notifications
 """
 
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, send_from_directory
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash
 from flask_cors import CORS
 import sqlite3
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime
 import os
 import logging
-import hashlib
 import secrets
+from db_pool import SQLitePool, DB_POOL_SIZE
+from sqlite_tuning import apply_pragmas
+from migrations import migrate
+from pagination import decode_cursor, keyset_page
+import registration_stats
+from response_cache import ResponseCache, SQLiteDataVersion
+from exports import stream_export, FORMATS as EXPORT_FORMATS
+from static_assets import AssetStore
+from rate_limit import client_ip
+from admin_auth import LoginThrottled
+from registration_core import (
+    DB_PATH, ADMIN_PAGE_SIZE, EXPORT_QUERY, EXPORT_FIELDS, EXPORT_HEADER, NOTIFICATION_MODE,
+    REGISTERED_MESSAGE, db_writer, notification_queue, registration_digest, validate_registration,
+    client_info, admin_auth, insert_registrations, delete_registration, dashboard_query,
+    send_notification_email, rate_limiter, REGISTER_RATE_LIMIT
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,143 +37,72 @@ CORS(app)  # Enable CORS for frontend requests
 # Secret key for sessions
 app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(32))
 
-# Database configuration
-DB_PATH = 'registrations.db'
+# Database configuration (registrations are written through registration_core.db_writer)
+db_pool = SQLitePool(DB_PATH, size=DB_POOL_SIZE, on_connect=apply_pragmas)
 
-# Admin credentials (in production, use environment variables)
-ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
-ADMIN_PASSWORD_HASH = os.getenv('ADMIN_PASSWORD_HASH', hashlib.sha256('admin123'.encode()).hexdigest())
+# Public read endpoints are cached per process (or in Redis, see
+# RESPONSE_CACHE_BACKEND) and invalidated whenever registrations change, in
+# whichever process wrote them (the key includes the database's data_version)
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', 10))
+response_cache = ResponseCache(namespace='registrations',
+                               versions={'registrations': SQLiteDataVersion(DB_PATH)})
 
-# Email configuration
-SMTP_SERVER = 'mail.teknoledg.com'  # Update with actual email server
-SMTP_PORT = 587  # or 465 for SSL
-EMAIL_USER = 'noreply@teknoledg.com'  # Update with actual email
-EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', '')  # Set via environment variable
-ADMIN_EMAIL = 'tim@teknoledg.com'
+# Pages and static files, served from memory (see static_assets.py)
+static_assets = AssetStore(pages=('index.html',))
 
 def init_database():
-    """Initialize the SQLite database with registrations table"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT NOT NULL UNIQUE,
-            name TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Initialize the SQLite database by applying pending schema migrations"""
+    with db_pool.connection() as conn:
+        migrate(conn, 'registrations')
     logger.info("Database initialized successfully")
 
-def send_notification_email(email, name, ip_address):
-    """Send notification email to admin"""
-    try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = ADMIN_EMAIL
-        msg['Subject'] = 'New Registration - Teknoledge Updates'
-        
-        # Email body
-        body = f"""
-        New user registration received:
-        
-        Email: {email}
-        Name: {name if name else 'Not provided'}
-        IP Address: {ip_address}
-        Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        
-        This user has registered for product updates.
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Send email
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_USER, ADMIN_EMAIL, text)
-        server.quit()
-        
-        logger.info(f"Notification email sent to {ADMIN_EMAIL}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send notification email: {str(e)}")
-        return False
-
 @app.route('/')
 def index():
     """Serve the main page"""
-    # Read and serve the main index.html file
-    try:
-        with open('../index.html', 'r', encoding='utf-8') as f:
-            content = f.read()
-        return content
-    except FileNotFoundError:
-        return "Main page not found. Please ensure index.html is in the parent directory.", 404
+    return static_assets.serve('index.html')
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
     """Serve CSS files"""
-    return send_from_directory('../css', filename)
+    return static_assets.serve(f'css/{filename}')
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
     """Serve JavaScript files"""
-    return send_from_directory('../js', filename)
+    return static_assets.serve(f'js/{filename}')
 
 @app.route('/images/<path:filename>')
 def serve_images(filename):
     """Serve image files"""
-    return send_from_directory('../images', filename)
+    return static_assets.serve(f'images/{filename}')
 
 @app.route('/api/register', methods=['POST'])
+@rate_limiter.limit('register', REGISTER_RATE_LIMIT)
 def register():
     """Handle registration form submissions"""
     try:
-        data = request.get_json()
-        email = data.get('email', '').strip()
-        name = data.get('name', '').strip()
-        
-        # Validate email
-        if not email or '@' not in email:
-            return jsonify({'success': False, 'message': 'Valid email is required'}), 400
+        try:
+            email, name = validate_registration(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
         # Get client info
-        ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', ''))
-        user_agent = request.headers.get('User-Agent', '')
-        
-        # Connect to database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        ip_address, user_agent = client_info(request.headers, request.remote_addr)
         
         try:
-            # Insert registration
-            cursor.execute('''
-                INSERT INTO registrations (email, name, ip_address, user_agent)
-                VALUES (?, ?, ?, ?)
-            ''', (email, name, ip_address, user_agent))
-            
-            conn.commit()
-            registration_id = cursor.lastrowid
+            # Insert registration (committed together with concurrent signups)
+            registration_id = db_writer.execute_many(insert_registrations, (email, name, ip_address, user_agent))
+            response_cache.invalidate('registrations')
             
-            # Send notification email
-            email_sent = send_notification_email(email, name, ip_address)
+            # Queue notification email (delivered in the background)
+            email_queued = send_notification_email(email, name, ip_address)
             
             logger.info(f"New registration: {email} (ID: {registration_id})")
             
             return jsonify({
                 'success': True,
-                'message': 'Thank you for registering! We\'ll notify you when we launch.',
-                'email_sent': email_sent
+                'message': REGISTERED_MESSAGE,
+                'email_queued': email_queued
             })
             
         except sqlite3.IntegrityError:
@@ -171,33 +111,23 @@ def register():
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
         return jsonify({'success': False, 'message': 'Registration failed. Please try again.'}), 500
-        
-    finally:
-        conn.close()
 
 @app.route('/api/stats', methods=['GET'])
+@response_cache.cached(ttl=STATS_CACHE_TTL, tags=('registrations',))
 def get_stats():
     """Get registration statistics (admin only)"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get total registrations
-        cursor.execute('SELECT COUNT(*) FROM registrations')
-        total = cursor.fetchone()[0]
-        
-        # Get recent registrations (last 24 hours)
-        cursor.execute('''
-            SELECT COUNT(*) FROM registrations 
-            WHERE timestamp > datetime('now', '-1 day')
-        ''')
-        recent = cursor.fetchone()[0]
-        
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Read from the trigger-maintained counters, not the raw table
+            stats = registration_stats.summary(cursor, 'sqlite')
         
         return jsonify({
-            'total_registrations': total,
-            'recent_registrations': recent
+            'total_registrations': stats['total'],
+            'recent_registrations': stats['last_24h'],
+            'weekly_registrations': stats['last_7d'],
+            'daily_registrations': stats['today']
         })
         
     except Exception as e:
@@ -220,10 +150,13 @@ def admin_login():
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '').strip()
         
-        # Hash the provided password
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
+        try:
+            authenticated = admin_auth.authenticate(username, password, client_ip(request))
+        except LoginThrottled as e:
+            flash(f'Too many login attempts, try again in {e.retry_after} seconds', 'error')
+            return render_template('admin_login.html'), 429, {'Retry-After': str(e.retry_after)}
         
-        if username == ADMIN_USERNAME and password_hash == ADMIN_PASSWORD_HASH:
+        if authenticated:
             session['admin_logged_in'] = True
             flash('Login successful!', 'success')
             return redirect(url_for('admin_dashboard'))
@@ -244,60 +177,32 @@ def admin_logout():
 def admin_dashboard():
     """Admin dashboard with registration data"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get pagination parameters
-        page = int(request.args.get('page', 1))
-        per_page = 20
-        offset = (page - 1) * per_page
-        
-        # Get total count
-        cursor.execute('SELECT COUNT(*) FROM registrations')
-        total_count = cursor.fetchone()[0]
-        
-        # Get registrations with pagination
-        cursor.execute('''
-            SELECT id, email, name, timestamp, ip_address, user_agent
-            FROM registrations
-            ORDER BY timestamp DESC
-            LIMIT ? OFFSET ?
-        ''', (per_page, offset))
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
         
-        registrations = cursor.fetchall()
+            direction, key = None, None
+            if request.args.get('cursor'):
+                try:
+                    direction, key = decode_cursor(request.args['cursor'])
+                except ValueError:
+                    flash('Invalid page link, showing the newest registrations', 'error')
         
-        # Calculate pagination info
-        total_pages = (total_count + per_page - 1) // per_page
-        has_prev = page > 1
-        has_next = page < total_pages
+            cursor.execute(*dashboard_query(direction, key))
         
-        # Get statistics
-        cursor.execute('SELECT COUNT(*) FROM registrations')
-        total_registrations = cursor.fetchone()[0]
+            registrations, next_cursor, prev_cursor = keyset_page(
+                cursor.fetchall(), ADMIN_PAGE_SIZE, direction, key=lambda row: (row[3], row[0])
+            )
         
-        cursor.execute('''
-            SELECT COUNT(*) FROM registrations 
-            WHERE timestamp > datetime('now', '-1 day')
-        ''')
-        recent_registrations = cursor.fetchone()[0]
-        
-        cursor.execute('''
-            SELECT COUNT(*) FROM registrations 
-            WHERE timestamp > datetime('now', '-7 days')
-        ''')
-        weekly_registrations = cursor.fetchone()[0]
-        
-        conn.close()
+            # Get statistics
+            stats = registration_stats.summary(cursor, 'sqlite')
         
         return render_template('admin_dashboard.html',
                              registrations=registrations,
-                             total_registrations=total_registrations,
-                             recent_registrations=recent_registrations,
-                             weekly_registrations=weekly_registrations,
-                             page=page,
-                             total_pages=total_pages,
-                             has_prev=has_prev,
-                             has_next=has_next)
+                             total_registrations=stats['total'],
+                             recent_registrations=stats['last_24h'],
+                             weekly_registrations=stats['last_7d'],
+                             next_cursor=next_cursor,
+                             prev_cursor=prev_cursor)
         
     except Exception as e:
         logger.error(f"Admin dashboard error: {str(e)}")
@@ -307,30 +212,21 @@ def admin_dashboard():
 @app.route('/admin/export')
 @admin_required
 def admin_export():
-    """Export registrations as CSV"""
+    """Stream registrations as CSV or JSON lines (?format=csv|jsonl, ?gzip=1)"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        flash(f'Unsupported export format: {fmt}', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT email, name, timestamp, ip_address
-            FROM registrations
-            ORDER BY timestamp DESC
-        ''')
-        
-        registrations = cursor.fetchall()
-        conn.close()
-        
-        # Create CSV content
-        csv_content = "Email,Name,Timestamp,IP Address\n"
-        for reg in registrations:
-            csv_content += f"{reg[0]},{reg[1] or ''},{reg[2]},{reg[3]}\n"
-        
-        from flask import Response
-        return Response(
-            csv_content,
-            mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=registrations.csv'}
+        return stream_export(
+            db_pool.connection(),
+            EXPORT_QUERY, (),
+            fields=EXPORT_FIELDS,
+            header=EXPORT_HEADER,
+            filename='registrations',
+            fmt=fmt,
+            gzip=request.args.get('gzip') == '1'
         )
         
     except Exception as e:
@@ -343,12 +239,8 @@ def admin_export():
 def admin_delete(reg_id):
     """Delete a registration"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM registrations WHERE id = ?', (reg_id,))
-        conn.commit()
-        conn.close()
+        db_writer.execute(delete_registration, reg_id)
+        response_cache.invalidate('registrations')
         
         flash('Registration deleted successfully!', 'success')
         
@@ -358,9 +250,34 @@ def admin_delete(reg_id):
     
     return redirect(url_for('admin_dashboard'))
 
-if __name__ == '__main__':
-    # Initialize database
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Connection pool, response cache, rate limit and notification queue metrics"""
+    return jsonify({
+        'db_pool': db_pool.stats(),
+        'db_writer': db_writer.stats(),
+        'response_cache': response_cache.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'notification_queue': notification_queue.stats()
+    })
+
+def init_app():
+    """One-time setup, run before any worker starts (see gunicorn.conf.py)"""
     init_database()
+    notification_queue.init_queue()
+    static_assets.load()
+
+def start_workers():
+    """Start this process's background threads (once per worker process)"""
+    notification_queue.start()
+    if NOTIFICATION_MODE == 'digest':
+        registration_digest.start()
+
+if __name__ == '__main__':
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
+    init_app()
+    start_workers()
     
     # Run the app
     port = int(os.getenv('PORT', 5000))
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Teknoledge Registration Backend (asyncio)
+The registration API and admin pages of app.py on Quart: a pending signup is
+a coroutine awaiting the shared group-commit writer rather than a blocked
+thread, reads go through aiosqlite and notification emails are delivered
+over aiosmtplib on the same event loop
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import sqlite3
+from contextlib import closing
+
+import aiosqlite
+from quart import Quart, Response, request, jsonify, render_template, session, redirect, url_for, flash
+from quart_cors import cors
+
+from sqlite_tuning import apply_pragmas
+from migrations import migrate
+from pagination import decode_cursor, keyset_page
+import registration_stats
+from exports import export_body_async, FORMATS as EXPORT_FORMATS
+from rate_limit import ConcurrencyGate, client_ip
+from admin_auth import LoginThrottled
+from registration_core import (
+    DB_PATH, ADMIN_PAGE_SIZE, EXPORT_QUERY, EXPORT_FIELDS, EXPORT_HEADER, NOTIFICATION_MODE,
+    REGISTERED_MESSAGE, db_writer, notification_queue, registration_digest, validate_registration,
+    client_info, admin_auth, insert_registrations, delete_registration, dashboard_query,
+    send_notification_email, rate_limiter, REGISTER_RATE_LIMIT
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = cors(Quart(__name__))  # Enable CORS for frontend requests
+
+# API requests beyond MAX_CONCURRENT_REQUESTS in flight get an immediate 503
+admission = ConcurrencyGate()
+app.asgi_app = admission.asgi(app.asgi_app)
+
+# Secret key for sessions
+app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(32))
+
+# Reads share one aiosqlite connection per process (SQLite reads are short
+# and WAL lets them run alongside the writer); writes go through db_writer
+read_conn = None
+delivery_task = None
+
+def init_app():
+    """One-time setup, run before any worker starts (see gunicorn.conf.py)"""
+    with closing(apply_pragmas(sqlite3.connect(DB_PATH))) as conn:
+        migrate(conn, 'registrations')
+    notification_queue.init_queue()
+    logger.info("Database initialized successfully")
+
+@app.before_serving
+async def startup():
+    """Open the read connection and start notification delivery on this loop"""
+    global read_conn, delivery_task
+    read_conn = await aiosqlite.Connection(lambda: apply_pragmas(sqlite3.connect(DB_PATH)), iter_chunk_size=64)
+    delivery_task = asyncio.create_task(notification_queue.deliver_async())
+    if NOTIFICATION_MODE == 'digest':
+        registration_digest.start()
+
+@app.after_serving
+async def shutdown():
+    global read_conn, delivery_task
+    delivery_task.cancel()
+    await asyncio.gather(delivery_task, return_exceptions=True)
+    await read_conn.close()
+    read_conn, delivery_task = None, None
+
+@app.route('/api/register', methods=['POST'])
+@rate_limiter.limit('register', REGISTER_RATE_LIMIT, request=request)
+async def register():
+    """Handle registration form submissions"""
+    try:
+        try:
+            email, name = validate_registration(await request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        # Get client info
+        ip_address, user_agent = client_info(request.headers, request.remote_addr)
+
+        try:
+            # Insert registration (committed together with concurrent signups)
+            registration_id = await asyncio.wrap_future(
+                db_writer.submit_many(insert_registrations, (email, name, ip_address, user_agent)))
+
+            # Queue notification email (delivered by deliver_async)
+            email_queued = await asyncio.to_thread(send_notification_email, email, name, ip_address)
+
+            logger.info(f"New registration: {email} (ID: {registration_id})")
+
+            return jsonify({
+                'success': True,
+                'message': REGISTERED_MESSAGE,
+                'email_queued': email_queued
+            })
+
+        except sqlite3.IntegrityError:
+            return jsonify({'success': False, 'message': 'Email already registered'}), 409
+
+    except Exception as e:
+        logger.error(f"Registration error: {str(e)}")
+        return jsonify({'success': False, 'message': 'Registration failed. Please try again.'}), 500
+
+@app.route('/api/stats', methods=['GET'])
+async def get_stats():
+    """Get registration statistics (admin only)"""
+    try:
+        # Read from the trigger-maintained counters, not the raw table
+        stats = await registration_stats.summary_async(read_conn, 'sqlite')
+
+        return jsonify({
+            'total_registrations': stats['total'],
+            'recent_registrations': stats['last_24h'],
+            'weekly_registrations': stats['last_7d'],
+            'daily_registrations': stats['today']
+        })
+
+    except Exception as e:
+        logger.error(f"Stats error: {str(e)}")
+        return jsonify({'error': 'Failed to get statistics'}), 500
+
+# Admin authentication decorator
+def admin_required(f):
+    async def decorated_function(*args, **kwargs):
+        if not session.get('admin_logged_in'):
+            return redirect(url_for('admin_login'))
+        return await f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+@app.route('/admin/login', methods=['GET', 'POST'])
+async def admin_login():
+    """Admin login page"""
+    if request.method == 'POST':
+        form = await request.form
+        username = form.get('username', '').strip()
+        password = form.get('password', '').strip()
+
+        try:
+            authenticated = await admin_auth.authenticate_async(username, password, client_ip(request))
+        except LoginThrottled as e:
+            await flash(f'Too many login attempts, try again in {e.retry_after} seconds', 'error')
+            return await render_template('admin_login.html'), 429, {'Retry-After': str(e.retry_after)}
+
+        if authenticated:
+            session['admin_logged_in'] = True
+            await flash('Login successful!', 'success')
+            return redirect(url_for('admin_dashboard'))
+        else:
+            await flash('Invalid credentials!', 'error')
+
+    return await render_template('admin_login.html')
+
+@app.route('/admin/logout')
+async def admin_logout():
+    """Admin logout"""
+    session.pop('admin_logged_in', None)
+    await flash('Logged out successfully!', 'info')
+    return redirect(url_for('admin_login'))
+
+@app.route('/admin')
+@admin_required
+async def admin_dashboard():
+    """Admin dashboard with registration data"""
+    try:
+        direction, key = None, None
+        if request.args.get('cursor'):
+            try:
+                direction, key = decode_cursor(request.args['cursor'])
+            except ValueError:
+                await flash('Invalid page link, showing the newest registrations', 'error')
+
+        async with read_conn.execute(*dashboard_query(direction, key)) as cursor:
+            rows = await cursor.fetchall()
+        registrations, next_cursor, prev_cursor = keyset_page(
+            rows, ADMIN_PAGE_SIZE, direction, key=lambda row: (row[3], row[0])
+        )
+
+        # Get statistics
+        stats = await registration_stats.summary_async(read_conn, 'sqlite')
+
+        return await render_template('admin_dashboard.html',
+                                     registrations=registrations,
+                                     total_registrations=stats['total'],
+                                     recent_registrations=stats['last_24h'],
+                                     weekly_registrations=stats['last_7d'],
+                                     next_cursor=next_cursor,
+                                     prev_cursor=prev_cursor)
+
+    except Exception as e:
+        logger.error(f"Admin dashboard error: {str(e)}")
+        await flash('Error loading dashboard data', 'error')
+        return await render_template('admin_dashboard.html', registrations=[], error=True)
+
+@app.route('/admin/export')
+@admin_required
+async def admin_export():
+    """Stream registrations as CSV or JSON lines (?format=csv|jsonl, ?gzip=1)"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        await flash(f'Unsupported export format: {fmt}', 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    try:
+        cursor = await read_conn.execute(EXPORT_QUERY)
+    except Exception as e:
+        logger.error(f"Export error: {str(e)}")
+        await flash('Error exporting data', 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    gzip = request.args.get('gzip') == '1'
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"registrations.{extension}"
+    if gzip:
+        mimetype = 'application/gzip'
+        filename += '.gz'
+
+    async def body():
+        try:
+            async for chunk in export_body_async(cursor, EXPORT_FIELDS, EXPORT_HEADER, fmt, gzip):
+                yield chunk
+        finally:
+            await cursor.close()
+
+    return Response(body(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/admin/delete/<int:reg_id>')
+@admin_required
+async def admin_delete(reg_id):
+    """Delete a registration"""
+    try:
+        await asyncio.wrap_future(db_writer.submit(delete_registration, reg_id))
+
+        await flash('Registration deleted successfully!', 'success')
+
+    except Exception as e:
+        logger.error(f"Delete error: {str(e)}")
+        await flash('Error deleting registration', 'error')
+
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/metrics')
+@admin_required
+async def admin_metrics():
+    """Writer, rate limit and notification queue metrics"""
+    return jsonify({
+        'db_writer': db_writer.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'admission': admission.stats(),
+        'notification_queue': await asyncio.to_thread(notification_queue.stats)
+    })
+
+if __name__ == '__main__':
+    # Development server; production runs under gunicorn with uvicorn workers
+    # (see gunicorn.conf.py)
+    init_app()
+
+    # Run the app
+    port = int(os.getenv('PORT', 5000))
+    debug = os.getenv('FLASK_ENV') == 'development'
+
+    logger.info(f"Starting Teknoledge async backend on port {port}")
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -4,17 +4,23 @@ Teknoledge Registration Backend - Existing Database Integration
 Integrates with your existing teknoledg.com database and email system
 """
 
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, send_from_directory
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash
 from flask_cors import CORS
 import mysql.connector
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import os
 import logging
-import hashlib
 import secrets
+from notifications import NotificationQueue, RegistrationDigest, SMTPSession, NOTIFY_QUEUE_PATH
+from db_pool import MySQLPool, DatabaseUnavailable, DB_POOL_SIZE
+from migrations import migrate
+from pagination import decode_cursor, keyset_page
+import registration_stats
+from response_cache import ResponseCache
+from exports import stream_export, FORMATS as EXPORT_FORMATS
+from static_assets import AssetStore
+from rate_limit import RateLimiter, client_ip
+from admin_auth import AdminAuthenticator, LoginThrottled, DEFAULT_PASSWORD_HASH
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,76 +40,77 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME', 'teknoledg_db'),
     'port': int(os.getenv('DB_PORT', 3306))
 }
+db_pool = MySQLPool(DB_CONFIG, size=DB_POOL_SIZE)
 
-# Admin credentials
+# Public read endpoints are cached per process (or in Redis, see
+# RESPONSE_CACHE_BACKEND) and invalidated whenever registrations change. MySQL
+# has no cheap data_version, so with the memory backend only the worker that
+# made a change drops its entries; the others serve them for up to the TTL
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', 10))
+response_cache = ResponseCache(namespace='registrations_mysql')
+
+# Pages and static files, served from memory (see static_assets.py)
+static_assets = AssetStore(pages=('index.html',))
+
+# Signups per client IP ('count/seconds', see rate_limit.py)
+REGISTER_RATE_LIMIT = os.getenv('REGISTER_RATE_LIMIT', '5/60')
+rate_limiter = RateLimiter()
+
+# Admin credentials (see admin_auth.py)
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
-ADMIN_PASSWORD_HASH = os.getenv('ADMIN_PASSWORD_HASH', hashlib.sha256('admin123'.encode()).hexdigest())
+ADMIN_PASSWORD_HASH = os.getenv('ADMIN_PASSWORD_HASH', DEFAULT_PASSWORD_HASH)
+admin_auth = AdminAuthenticator(ADMIN_USERNAME, ADMIN_PASSWORD_HASH, rate_limiter)
 
 # Email configuration using your existing email system
 SMTP_SERVER = os.getenv('SMTP_SERVER', 'mail.teknoledg.com')
 SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
 EMAIL_USER = os.getenv('EMAIL_USER', 'noreply@teknoledg.com')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', '')
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
 ADMIN_EMAIL = 'hello@thepersonaldataexchange.com'
 
-def get_db_connection():
-    """Get connection to existing database"""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except mysql.connector.Error as e:
-        logger.error(f"Database connection error: {e}")
-        return None
+# Notification mode: 'immediate' sends one email per registration, 'digest'
+# collects registrations and sends one summary per window or count threshold
+NOTIFICATION_MODE = os.getenv('NOTIFICATION_MODE', 'immediate')
+DIGEST_WINDOW_SECONDS = float(os.getenv('DIGEST_WINDOW_SECONDS', 3600))
+DIGEST_MAX_COUNT = int(os.getenv('DIGEST_MAX_COUNT', 100))
+
+# Notification emails are queued and sent by background workers
+notification_queue = NotificationQueue(
+    NOTIFY_QUEUE_PATH,
+    smtp_factory=lambda: SMTPSession(SMTP_SERVER, SMTP_PORT, EMAIL_USER, EMAIL_PASSWORD, use_tls=SMTP_USE_TLS),
+    sender=EMAIL_USER
+)
+registration_digest = RegistrationDigest(
+    notification_queue,
+    ADMIN_EMAIL,
+    subject_prefix='New Registrations',
+    window_seconds=DIGEST_WINDOW_SECONDS,
+    max_count=DIGEST_MAX_COUNT
+)
 
 def init_registrations_table():
     """Create registrations table in existing database if it doesn't exist"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-    
-    cursor = conn.cursor()
-    
     try:
-        # Create registrations table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS registrations (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                email VARCHAR(255) NOT NULL UNIQUE,
-                name VARCHAR(255),
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                ip_address VARCHAR(45),
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create index for better performance
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_email ON registrations(email)
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_timestamp ON registrations(timestamp)
-        ''')
-        
-        conn.commit()
-        logger.info("Registrations table initialized successfully")
-        return True
-        
+        with db_pool.connection() as conn:
+            migrate(conn, 'registrations_mysql')
+            logger.info("Registrations table initialized successfully")
+            return True
+            
+    except DatabaseUnavailable as e:
+        logger.error(f"Database connection error: {e}")
+        return False
     except mysql.connector.Error as e:
         logger.error(f"Error creating table: {e}")
         return False
-    finally:
-        conn.close()
 
 def send_notification_email(email, name, ip_address):
-    """Send notification email using your existing email system"""
+    """Queue notification email using your existing email system"""
     try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = ADMIN_EMAIL
-        msg['Subject'] = f"New Registration - {email}"
+        if NOTIFICATION_MODE == 'digest':
+            pending = registration_digest.add(email, name, ip_address)
+            logger.info(f"Registration {email} added to digest ({pending} pending)")
+            return True
         
         # Email body
         body = f"""
@@ -117,20 +124,13 @@ def send_notification_email(email, name, ip_address):
         This is an automated notification from the Teknoledge registration system.
         """
         
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Send email
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.send_message(msg)
-        server.quit()
+        message_id = notification_queue.enqueue(ADMIN_EMAIL, f"New Registration - {email}", body)
         
-        logger.info(f"Notification email sent for {email}")
+        logger.info(f"Notification email {message_id} queued for {email}")
         return True
         
     except Exception as e:
-        logger.error(f"Error sending email: {e}")
+        logger.error(f"Error queueing email: {e}")
         return False
 
 def admin_required(f):
@@ -145,24 +145,25 @@ def admin_required(f):
 @app.route('/')
 def serve_index():
     """Serve the main index.html file"""
-    return send_from_directory('..', 'index.html')
+    return static_assets.serve('index.html')
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
     """Serve CSS files"""
-    return send_from_directory('../css', filename)
+    return static_assets.serve(f'css/{filename}')
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
     """Serve JavaScript files"""
-    return send_from_directory('../js', filename)
+    return static_assets.serve(f'js/{filename}')
 
 @app.route('/images/<path:filename>')
 def serve_images(filename):
     """Serve image files"""
-    return send_from_directory('../images', filename)
+    return static_assets.serve(f'images/{filename}')
 
 @app.route('/api/register', methods=['POST'])
+@rate_limiter.limit('register', REGISTER_RATE_LIMIT)
 def register():
     """Handle registration form submission"""
     try:
@@ -177,77 +178,68 @@ def register():
         ip_address = request.remote_addr
         user_agent = request.headers.get('User-Agent', '')
         
-        # Connect to database
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'message': 'Database connection failed'}), 500
-        
-        cursor = conn.cursor()
-        
         try:
-            # Check if email already exists
-            cursor.execute("SELECT id FROM registrations WHERE email = %s", (email,))
-            if cursor.fetchone():
-                return jsonify({'success': False, 'message': 'Email already registered'}), 400
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # Check if email already exists
+                cursor.execute("SELECT id FROM registrations WHERE email = %s", (email,))
+                if cursor.fetchone():
+                    return jsonify({'success': False, 'message': 'Email already registered'}), 400
+                
+                # Insert new registration
+                cursor.execute("""
+                    INSERT INTO registrations (email, name, ip_address, user_agent)
+                    VALUES (%s, %s, %s, %s)
+                """, (email, name, ip_address, user_agent))
+                
+                conn.commit()
+                registration_id = cursor.lastrowid
+            response_cache.invalidate('registrations')
             
-            # Insert new registration
-            cursor.execute("""
-                INSERT INTO registrations (email, name, ip_address, user_agent)
-                VALUES (%s, %s, %s, %s)
-            """, (email, name, ip_address, user_agent))
-            
-            conn.commit()
-            registration_id = cursor.lastrowid
-            
-            # Send notification email
-            email_sent = send_notification_email(email, name, ip_address)
+            # Queue notification email (delivered in the background)
+            email_queued = send_notification_email(email, name, ip_address)
             
             logger.info(f"New registration: {email} (ID: {registration_id})")
             
             return jsonify({
                 'success': True,
                 'message': "Thank you for registering! We'll notify you when we launch.",
-                'email_sent': email_sent
+                'email_queued': email_queued
             })
             
+        except DatabaseUnavailable as e:
+            logger.error(f"Database connection error: {e}")
+            return jsonify({'success': False, 'message': 'Database connection failed'}), 500
         except mysql.connector.Error as e:
             logger.error(f"Database error: {e}")
             return jsonify({'success': False, 'message': 'Registration failed'}), 500
-        finally:
-            conn.close()
             
     except Exception as e:
         logger.error(f"Registration error: {e}")
         return jsonify({'success': False, 'message': 'An error occurred'}), 500
 
 @app.route('/api/stats')
+@response_cache.cached(ttl=STATS_CACHE_TTL, tags=('registrations',))
 def get_stats():
     """Get registration statistics"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-        
-        cursor = conn.cursor()
-        
-        # Get total registrations
-        cursor.execute("SELECT COUNT(*) FROM registrations")
-        total = cursor.fetchone()[0]
-        
-        # Get recent registrations (last 24 hours)
-        cursor.execute("""
-            SELECT COUNT(*) FROM registrations 
-            WHERE timestamp >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-        """)
-        recent = cursor.fetchone()[0]
-        
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Read from the trigger-maintained counters, not the raw table
+            stats = registration_stats.summary(cursor, 'mysql')
         
         return jsonify({
-            'total_registrations': total,
-            'recent_registrations': recent
+            'total_registrations': stats['total'],
+            'recent_registrations': stats['last_24h'],
+            'weekly_registrations': stats['last_7d'],
+            'daily_registrations': stats['today']
         })
         
+    except DatabaseUnavailable as e:
+        logger.error(f"Database connection error: {e}")
+        return jsonify({'error': 'Database connection failed'}), 500
     except Exception as e:
         logger.error(f"Stats error: {e}")
         return jsonify({'error': 'Failed to get statistics'}), 500
@@ -259,7 +251,13 @@ def admin_login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        if username == ADMIN_USERNAME and hashlib.sha256(password.encode()).hexdigest() == ADMIN_PASSWORD_HASH:
+        try:
+            authenticated = admin_auth.authenticate(username or '', password or '', client_ip(request))
+        except LoginThrottled as e:
+            flash(f'Too many login attempts, try again in {e.retry_after} seconds', 'error')
+            return render_template('admin_login.html'), 429, {'Retry-After': str(e.retry_after)}
+        
+        if authenticated:
             session['admin_logged_in'] = True
             flash('Login successful!', 'success')
             return redirect(url_for('admin_dashboard'))
@@ -280,103 +278,97 @@ def admin_logout():
 def admin_dashboard():
     """Admin dashboard with registration data"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            flash('Database connection failed!', 'error')
-            return render_template('admin_dashboard.html', registrations=[], stats={})
-        
-        cursor = conn.cursor()
-        
-        # Get pagination parameters
-        page = request.args.get('page', 1, type=int)
-        per_page = 20
-        offset = (page - 1) * per_page
-        
-        # Get registrations with pagination
-        cursor.execute("""
-            SELECT id, email, name, timestamp, ip_address
-            FROM registrations 
-            ORDER BY timestamp DESC 
-            LIMIT %s OFFSET %s
-        """, (per_page, offset))
-        
-        registrations = []
-        for row in cursor.fetchall():
-            registrations.append({
-                'id': row[0],
-                'email': row[1],
-                'name': row[2],
-                'timestamp': row[3],
-                'ip_address': row[4]
-            })
-        
-        # Get statistics
-        cursor.execute("SELECT COUNT(*) FROM registrations")
-        total = cursor.fetchone()[0]
-        
-        cursor.execute("""
-            SELECT COUNT(*) FROM registrations 
-            WHERE DATE(timestamp) = CURDATE()
-        """)
-        daily = cursor.fetchone()[0]
-        
-        cursor.execute("""
-            SELECT COUNT(*) FROM registrations 
-            WHERE timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-        """)
-        weekly = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        stats = {
-            'total': total,
-            'daily': daily,
-            'weekly': weekly
-        }
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Keyset pagination on (timestamp, id): each page is an index range
+            # scan from the cursor, however deep it is
+            per_page = 20
+            direction, key = None, None
+            if request.args.get('cursor'):
+                try:
+                    direction, key = decode_cursor(request.args['cursor'])
+                except ValueError:
+                    flash('Invalid page link, showing the newest registrations', 'error')
+            
+            columns = "SELECT id, email, name, timestamp, ip_address FROM registrations"
+            if direction == 'next':
+                cursor.execute(f"""
+                    {columns}
+                    WHERE (timestamp, id) < (%s, %s)
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s
+                """, (*key, per_page + 1))
+            elif direction == 'prev':
+                cursor.execute(f"""
+                    {columns}
+                    WHERE (timestamp, id) > (%s, %s)
+                    ORDER BY timestamp ASC, id ASC
+                    LIMIT %s
+                """, (*key, per_page + 1))
+            else:
+                cursor.execute(f"""
+                    {columns}
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s
+                """, (per_page + 1,))
+            
+            registrations, next_cursor, prev_cursor = keyset_page(
+                cursor.fetchall(), per_page, direction, key=lambda row: (row[3], row[0])
+            )
+            
+            # Get statistics
+            stats = registration_stats.summary(cursor, 'mysql')
         
         return render_template('admin_dashboard.html', 
                              registrations=registrations, 
-                             stats=stats, 
-                             page=page,
-                             per_page=per_page)
-        
+                             total_registrations=stats['total'],
+                             recent_registrations=stats['today'],
+                             recent_label='Today',
+                             weekly_registrations=stats['last_7d'],
+                             next_cursor=next_cursor,
+                             prev_cursor=prev_cursor)
+        
+    except DatabaseUnavailable as e:
+        logger.error(f"Database connection error: {e}")
+        flash('Database connection failed!', 'error')
+        return render_template('admin_dashboard.html', registrations=[])
     except Exception as e:
         logger.error(f"Admin dashboard error: {e}")
         flash('Error loading dashboard!', 'error')
-        return render_template('admin_dashboard.html', registrations=[], stats={})
+        return render_template('admin_dashboard.html', registrations=[])
 
 @app.route('/admin/export')
 @admin_required
 def admin_export():
-    """Export registrations as CSV"""
+    """Stream registrations as CSV or JSON lines (?format=csv|jsonl, ?gzip=1)"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        flash(f'Unsupported export format: {fmt}', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
     try:
-        conn = get_db_connection()
-        if not conn:
-            flash('Database connection failed!', 'error')
-            return redirect(url_for('admin_dashboard'))
-        
-        cursor = conn.cursor()
-        cursor.execute("""
+        return stream_export(
+            db_pool.connection(),
+            """
             SELECT email, name, timestamp, ip_address
             FROM registrations 
             ORDER BY timestamp DESC
-        """)
-        
-        # Create CSV content
-        csv_content = "Email,Name,Timestamp,IP Address\n"
-        for row in cursor.fetchall():
-            csv_content += f"{row[0]},{row[1] or ''},{row[2]},{row[3] or ''}\n"
-        
-        conn.close()
-        
-        # Return CSV file
-        from flask import Response
-        return Response(
-            csv_content,
-            mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=registrations.csv'}
+            """, (),
+            fields=('email', 'name', 'timestamp', 'ip_address'),
+            header=('Email', 'Name', 'Timestamp', 'IP Address'),
+            filename='registrations',
+            fmt=fmt,
+            gzip=request.args.get('gzip') == '1',
+            # An unbuffered result must be read to the end before the
+            # connection can go back to the pool (client disconnects)
+            cleanup=lambda conn: conn.consume_results()
         )
         
+    except DatabaseUnavailable as e:
+        logger.error(f"Database connection error: {e}")
+        flash('Database connection failed!', 'error')
+        return redirect(url_for('admin_dashboard'))
     except Exception as e:
         logger.error(f"Export error: {e}")
         flash('Export failed!', 'error')
@@ -387,30 +379,53 @@ def admin_export():
 def admin_delete(reg_id):
     """Delete a registration"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            flash('Database connection failed!', 'error')
-            return redirect(url_for('admin_dashboard'))
-        
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM registrations WHERE id = %s", (reg_id,))
-        conn.commit()
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM registrations WHERE id = %s", (reg_id,))
+            conn.commit()
+        response_cache.invalidate('registrations')
         
         flash('Registration deleted successfully!', 'success')
         
+    except DatabaseUnavailable as e:
+        logger.error(f"Database connection error: {e}")
+        flash('Database connection failed!', 'error')
     except Exception as e:
         logger.error(f"Delete error: {e}")
         flash('Delete failed!', 'error')
     
     return redirect(url_for('admin_dashboard'))
 
-if __name__ == '__main__':
-    # Initialize database table
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Connection pool, response cache, rate limit and notification queue metrics"""
+    return jsonify({
+        'db_pool': db_pool.stats(),
+        'response_cache': response_cache.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'notification_queue': notification_queue.stats()
+    })
+
+def init_app():
+    """One-time setup, run before any worker starts (see gunicorn.conf.py)"""
     if init_registrations_table():
         logger.info("Database integration successful")
     else:
         logger.error("Database integration failed")
+    notification_queue.init_queue()
+    static_assets.load()
+
+def start_workers():
+    """Start this process's background threads (once per worker process)"""
+    notification_queue.start()
+    if NOTIFICATION_MODE == 'digest':
+        registration_digest.start()
+
+if __name__ == '__main__':
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
+    init_app()
+    start_workers()
     
     # Run the app
     port = int(os.getenv('PORT', 5000))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Concurrent signups: Flask (gunicorn gthread) vs asyncio (Quart on uvicorn)
+
+Runs app.py and app_async.py under gunicorn.conf.py with one worker each
+(Flask with GUNICORN_THREADS threads) and holds N keep-alive connections
+posting fresh registrations for a fixed time. REGISTER_BATCH_DELAY_MS
+stands in for slow storage: each group commit takes at least that long,
+so a Flask worker has at most its thread count of signups in flight while
+the async worker has every open connection in flight and commits them in
+large batches. Needs the packages in requirements_async.txt.
+
+Usage:
+    python benchmarks/bench_async_register.py --connections 64 512 --seconds 10
+
+Sample run (Linux container, 1 CPU shared by server and clients, 8 threads,
+20 ms commits, 10 s):
+      server  connections    signups/s   p50 ms   p99 ms   errors
+       flask           64          232    274.5    395.6        0
+       async           64          475    126.9    244.0        0
+       flask          512          231   2787.4   3164.1        0
+       async          512          527    984.3   1380.0        0
+
+Flask tops out at threads / commit time whatever the load; the async worker
+is bounded by CPU instead (here shared with the load generator), and each
+queued signup costs a coroutine rather than a thread.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PORT = 5098
+
+
+async def wait_until_up(deadline=30):
+    started = time.monotonic()
+    while time.monotonic() - started < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+async def client(ids, stop, latencies, errors):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    try:
+        while not stop.is_set():
+            body = json.dumps({'email': f"user{next(ids)}@example.com", 'name': 'Benchmark'}).encode()
+            started = time.perf_counter()
+            writer.write(b"POST /api/register HTTP/1.1\r\nHost: localhost\r\n"
+                         b"Content-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            if status != 200:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - started)
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+        errors.append(repr(e))
+    finally:
+        writer.close()
+
+
+async def load(connections, seconds):
+    await wait_until_up()
+    ids = itertools.count()
+    stop = asyncio.Event()
+    latencies, errors = [], []
+    tasks = [asyncio.create_task(client(ids, stop, latencies, errors)) for _ in range(connections)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    if not latencies:
+        return 0.0, 0.0, 0.0, len(errors)
+    return (len(latencies) / seconds, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, len(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, nargs='+', default=[64, 512])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--commit-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    servers = (
+        ('flask', 'app:app', {}),
+        ('async', 'app_async:app', {'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker'}),
+    )
+    print(f"{'server':>8} {'connections':>12} {'signups/s':>12} {'p50 ms':>8} {'p99 ms':>8} {'errors':>8}")
+    for connections in args.connections:
+        for name, app, extra_env in servers:
+            with tempfile.TemporaryDirectory() as tmp:
+                # A scratch copy, so the benchmark's databases stay out of the tree
+                cwd = os.path.join(tmp, 'backend')
+                shutil.copytree(BACKEND, cwd, ignore=shutil.ignore_patterns('*.db', 'qr_cache', '__pycache__'))
+                env = dict(os.environ, PORT=str(PORT), WEB_CONCURRENCY='1', GUNICORN_THREADS=str(args.threads),
+                           GUNICORN_ACCESS_LOG='',
+                           # Every client shares 127.0.0.1; measure the server, not the limiter
+                           RATE_LIMIT_BACKEND='none', MAX_CONCURRENT_REQUESTS='0',
+                           REGISTER_BATCH_DELAY_MS=str(args.commit_ms),
+                           # Refused at once, so notification retries stay cheap
+                           SMTP_SERVER='127.0.0.1', SMTP_PORT='9', **extra_env)
+                server = subprocess.Popen([sys.executable, '-m', 'gunicorn', app], cwd=cwd, env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    rate, p50, p99, errors = asyncio.run(load(connections, args.seconds))
+                finally:
+                    server.terminate()
+                    server.wait()
+            print(f"{name:>8} {connections:>12} {rate:>12.0f} {p50:>8.1f} {p99:>8.1f} {errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
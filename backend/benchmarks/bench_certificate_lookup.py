@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Certificate lookups per second: database query vs in-memory index
+
+The query path is what get_certificate() did before the index: check out a
+pooled connection and SELECT the row by certificate number. The index path
+is certificate_index.get(), which only checks PRAGMA data_version once per
+CERTIFICATE_INDEX_CHECK_INTERVAL.
+Lookups cycle through random existing numbers with one unknown number in
+every ten.
+
+Usage:
+    python benchmarks/bench_certificate_lookup.py --certificates 10000 --lookups 50000 --threads 1 4
+
+Sample run (Linux container, 1 CPU, 10000 certificates, 50000 lookups):
+     threads      query/s      index/s  speedup
+           1        43964       306504     7.0x
+           4        48681       303224     6.2x
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import certificate_api  # noqa: E402
+from certificate_api import CERTIFICATE_FIELDS  # noqa: E402
+
+
+def query_lookup(certificate_number):
+    with certificate_api.db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(CERTIFICATE_FIELDS)}
+            FROM certificates
+            WHERE certificate_number = ?
+        """, (certificate_number,))
+        result = cursor.fetchone()
+    return dict(zip(CERTIFICATE_FIELDS, result)) if result else None
+
+
+def run(lookup, numbers, threads):
+    share = len(numbers) // threads
+    workers = [threading.Thread(target=lambda part: [lookup(n) for n in part],
+                                args=(numbers[i * share:(i + 1) * share],)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return share * threads / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--certificates', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=50000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        certificate_api.use_database(os.path.join(tmp, 'certificates.db'))
+        certificate_api.init_certificate_database()
+        with certificate_api.db_pool.connection() as conn:
+            conn.executemany(f"""
+                INSERT INTO certificates ({', '.join(CERTIFICATE_FIELDS)})
+                VALUES ({', '.join('?' * len(CERTIFICATE_FIELDS))})
+            """, [(f"B{i:07d}", 'Benchmark Certificate', 100, f"Owner {i}", 'Common Stock',
+                   '$0.001', '2024-01-01', 'valid', 1000, 100) for i in range(args.certificates)])
+            conn.commit()
+        certificate_api.certificate_index.load()
+
+        rng = random.Random(1)
+        numbers = [f"X{i:07d}" if i % 10 == 0 else f"B{rng.randrange(args.certificates):07d}"
+                   for i in range(args.lookups)]
+        assert query_lookup(numbers[1]) == certificate_api.get_certificate(numbers[1])
+
+        print(f"{'threads':>8} {'query/s':>12} {'index/s':>12} {'speedup':>8}")
+        for threads in args.threads:
+            query = run(query_lookup, numbers, threads)
+            index = run(certificate_api.get_certificate, numbers, threads)
+            print(f"{threads:>8} {query:>12.0f} {index:>12.0f} {index / query:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+QR verification latency as retired keys accumulate
+
+For each keyring size, a compact payload made by the oldest key is verified
+against a keyring whose current key is the newest. A tagged payload
+(SC2:KID:...) goes straight to its key; an untagged one (as printed before
+key ids existed) is trial-decrypted against every key, newest first.
+Keys are derived before timing, so only verification is measured.
+
+Usage:
+    python benchmarks/bench_keyring.py --keys 1 4 16 64 --verifications 10000
+
+Sample run (Linux container, 1 CPU, 10000 verifications, mean):
+        keys   tagged us   untagged us
+           1        92.8          94.2
+           4        68.3         103.9
+          16        82.8         201.7
+          64        93.8         740.5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from encryption_utils import CertificateEncryption  # noqa: E402
+
+CERTIFICATE = {
+    'certificate_number': '000001',
+    'certificate_name': 'Teknoledge Holdings Share Certificate',
+    'number_of_shares': 1000000,
+    'owner_name': 'Tim McGuckin',
+    'certificate_type': 'Common Stock',
+    'par_value': '$0.001',
+    'issue_date': '2024-01-01',
+    'status': 'valid',
+    'authorized_shares': 10000000,
+    'issued_shares': 1000000
+}
+
+
+def mean_us(encryption, qr_data, verifications):
+    encryption.parse_qr_data(qr_data)  # derive the key it needs
+    started = time.perf_counter()
+    for _ in range(verifications):
+        encryption.parse_qr_data(qr_data)
+    return (time.perf_counter() - started) / verifications * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--verifications', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'keys':>8} {'tagged us':>11} {'untagged us':>13}")
+    for keys in args.keys:
+        passwords = {f"K{i}": f"benchmark-password-{i}" for i in range(keys)}
+        oldest = CertificateEncryption(passwords['K0'], keyfile='', key_id='K0')
+        tagged = oldest.generate_compact_qr_data(CERTIFICATE)
+        untagged = CertificateEncryption(passwords['K0'], keyfile='').generate_compact_qr_data(CERTIFICATE)
+
+        newest = f"K{keys - 1}"
+        # Retired keys are listed newest first, so the oldest is tried last
+        previous = {key_id: password for key_id, password in reversed(passwords.items()) if key_id != newest}
+        keyring = CertificateEncryption(passwords[newest], keyfile='', key_id=newest, previous_keys=previous)
+        for keyholder in keyring._keyring():
+            keyholder.cipher
+
+        print(f"{keys:>8} {mean_us(keyring, tagged, args.verifications):>11.1f} "
+              f"{mean_us(keyring, untagged, args.verifications):>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
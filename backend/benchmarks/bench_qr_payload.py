@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+QR payload size, QR version and render time per payload format
+
+Encodes one certificate as a legacy SEC_CERT: payload, a compact SC2:
+payload and a signed SCR: reference, then renders each as a PNG (the
+render_certificate_qr defaults: error correction M, 10px modules).
+
+Usage:
+    python benchmarks/bench_qr_payload.py --renders 20
+
+Sample run (Linux container, 1 CPU, 20 renders, median):
+      format    chars  version  modules  render ms
+      legacy      825       23      109      140.3
+     compact      328       11       61       47.8
+   reference       29        2       25        7.4
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import qrcode  # noqa: E402
+
+from encryption_utils import encode_qr_payload, decrypt_qr_certificate, QR_PAYLOAD_FORMATS  # noqa: E402
+from certificate_api import render_certificate_qr  # noqa: E402
+
+CERTIFICATE = {
+    'certificate_number': '000001',
+    'certificate_name': 'Teknoledge Holdings Share Certificate',
+    'number_of_shares': 1000000,
+    'owner_name': 'Tim McGuckin',
+    'certificate_type': 'Common Stock',
+    'par_value': '$0.001',
+    'issue_date': '2024-01-01',
+    'status': 'valid',
+    'authorized_shares': 10000000,
+    'issued_shares': 1000000
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--renders', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'format':>12} {'chars':>8} {'version':>8} {'modules':>8} {'render ms':>10}")
+    for payload_format in ('legacy', 'compact', 'reference'):
+        assert payload_format in QR_PAYLOAD_FORMATS
+        data = encode_qr_payload(CERTIFICATE, payload_format)
+        assert decrypt_qr_certificate(data)['cert_number'] == CERTIFICATE['certificate_number']
+
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M)
+        qr.add_data(data)
+        qr.make(fit=True)
+
+        timings = []
+        for _ in range(args.renders):
+            started = time.perf_counter()
+            render_certificate_qr(CERTIFICATE, payload=payload_format)
+            timings.append(time.perf_counter() - started)
+        print(f"{payload_format:>12} {len(data):>8} {qr.version:>8} {qr.modules_count:>8} "
+              f"{statistics.median(timings) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Request throughput: Flask development server vs gunicorn
+
+Starts the certificate API the old way (python certificate_api.py, the
+threaded Werkzeug dev server) and under gunicorn with gunicorn.conf.py, then
+drives each with client threads over keep-alive connections for a fixed
+time. Requests rotate through the landing page (gzip), a certificate lookup
+and the cached QR image. The dev server speaks HTTP/1.0, so its clients
+reconnect for every request.
+
+Usage:
+    python benchmarks/bench_server.py --clients 16 --seconds 10
+
+Sample run (Linux container, 1 CPU shared by server and clients, 16 clients, 10 s):
+      server       req/s   p50 ms   p99 ms   errors
+         dev         495     30.7     58.8        0
+    gunicorn         830     19.5     37.8        0
+
+With one CPU the gain comes from keep-alive and lower per-request overhead;
+on more cores gunicorn also runs one worker per core, which the dev server
+(one process, one GIL) cannot.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PORT = 5099
+
+REQUESTS = (
+    ('GET', '/', None, {'Accept-Encoding': 'gzip'}),
+    ('POST', '/api/verify-certificate', json.dumps({'certificate_number': '000001'}),
+     {'Content-Type': 'application/json'}),
+    ('GET', '/api/qr/000001', None, {}),
+)
+
+
+def wait_until_up(deadline=30):
+    started = time.monotonic()
+    while time.monotonic() - started < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def client(stop, latencies, errors):
+    conn = None
+    i = 0
+    while not stop.is_set():
+        method, path, body, headers = REQUESTS[i % len(REQUESTS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=10)
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(repr(e))
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def measure(command, cwd, env, clients, seconds):
+    server = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up()
+        stop = threading.Event()
+        latencies, errors = [], []
+        threads = [threading.Thread(target=client, args=(stop, latencies, errors)) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    return (len(latencies) / seconds, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, len(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A scratch copy, so the benchmark's databases and caches stay out of the tree
+        site = os.path.join(tmp, 'site')
+        shutil.copytree(os.path.join(BACKEND, '..'), site,
+                        ignore=shutil.ignore_patterns('.git', '*.db', 'qr_cache', '*.tar.gz', '__pycache__'))
+        cwd = os.path.join(site, 'backend')
+        env = dict(os.environ, PORT=str(PORT), CERTIFICATE_KEYFILE='', GUNICORN_ACCESS_LOG='',
+                   # Every client shares 127.0.0.1; measure the server, not the limiter
+                   RATE_LIMIT_BACKEND='none')
+        env.pop('FLASK_ENV', None)
+
+        servers = (
+            ('dev', [sys.executable, 'certificate_api.py']),
+            ('gunicorn', [sys.executable, '-m', 'gunicorn', 'certificate_api:app']),
+        )
+        print(f"{'server':>8} {'req/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'errors':>8}")
+        for name, command in servers:
+            rate, p50, p99, errors = measure(command, cwd, env, args.clients, args.seconds)
+            print(f"{name:>8} {rate:>11.0f} {p50:>8.1f} {p99:>8.1f} {errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
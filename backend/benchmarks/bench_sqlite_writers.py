@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Registration write throughput with N concurrent writers
+
+Compares the original write path (a new connection per request, default
+rollback journal, one commit per insert) with the tuned path (WAL pragmas
+plus the SQLiteWriter group commit) and the batched path used by
+/api/register (group commit through executemany, with an optional linger
+window).
+Each writer thread inserts unique registrations as fast as it can.
+
+Usage:
+    python benchmarks/bench_sqlite_writers.py --writers 1 4 16 32 --inserts 200
+
+Sample run (Linux container, 200 inserts per writer, --delay-ms 0):
+     writers   baseline/s   locked      tuned/s   locked  avg batch    batched/s  avg batch  speedup
+           1         1098        0        12015        0        1.0        10205        1.0    10.9x
+           4          690        0        13309        0       3.38        10781       3.36    19.3x
+          16          667        0        15640        0      10.67        15694      11.64    23.5x
+          32          702        1        15001        0      16.41        20420      17.39    29.1x
+
+On storage where fsync is cheap, a linger window (--delay-ms 2) lowers
+closed-loop throughput; it pays off when each commit's sync is expensive.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlite_tuning import SQLiteWriter  # noqa: E402
+from registration_core import insert_registrations  # noqa: E402
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS registrations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL UNIQUE,
+        name TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        ip_address TEXT,
+        user_agent TEXT
+    )
+'''
+
+INSERT = '''
+    INSERT INTO registrations (email, name, ip_address, user_agent)
+    VALUES (?, ?, ?, ?)
+'''
+
+
+def baseline_insert(path, row):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(INSERT, row)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run(path, writers, inserts, insert_fn):
+    errors = []
+
+    def worker(worker_id):
+        for i in range(inserts):
+            row = (f"user{worker_id}_{i}@example.com", 'Bench', '127.0.0.1', 'bench')
+            try:
+                insert_fn(row)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return (writers * inserts - len(errors)) / elapsed, len(errors)
+
+
+def fresh_db(directory, name, wal):
+    path = os.path.join(directory, name)
+    conn = sqlite3.connect(path)
+    if wal:
+        conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 16, 32])
+    parser.add_argument('--inserts', type=int, default=200, help='inserts per writer')
+    parser.add_argument('--delay-ms', type=float, default=0, help='linger window for the batched path')
+    parser.add_argument('--synchronous', default='NORMAL', help='PRAGMA synchronous for the batched path')
+    args = parser.parse_args()
+
+    print(f"{'writers':>8} {'baseline/s':>12} {'locked':>8} {'tuned/s':>12} {'locked':>8} {'avg batch':>10} "
+          f"{'batched/s':>12} {'avg batch':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for writers in args.writers:
+            path = fresh_db(directory, f"baseline_{writers}.db", wal=False)
+            base_rate, base_errors = run(path, writers, args.inserts, lambda row: baseline_insert(path, row))
+
+            path = fresh_db(directory, f"tuned_{writers}.db", wal=True)
+            writer = SQLiteWriter(path)
+            tuned_rate, tuned_errors = run(
+                path, writers, args.inserts,
+                lambda row: writer.execute(lambda conn, r: conn.execute(INSERT, r).lastrowid, row)
+            )
+            batch = writer.stats()['avg_batch_size']
+
+            path = fresh_db(directory, f"batched_{writers}.db", wal=True)
+            batcher = SQLiteWriter(path, synchronous=args.synchronous, max_delay=args.delay_ms / 1000)
+            batched_rate, _ = run(
+                path, writers, args.inserts,
+                lambda row: batcher.execute_many(insert_registrations, row)
+            )
+            batched = batcher.stats()['avg_batch_size']
+
+            print(f"{writers:>8} {base_rate:>12.0f} {base_errors:>8} {tuned_rate:>12.0f} {tuned_errors:>8} "
+                  f"{batch:>10} {batched_rate:>12.0f} {batched:>10} {max(tuned_rate, batched_rate) / base_rate:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
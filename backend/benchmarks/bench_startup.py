@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Cold start-up time of the certificate API
+
+Each sample is a fresh interpreter that imports certificate_api and then
+asks for the encryption key, which is what the first QR render or
+verification does. Three cases:
+
+    eager     import, then derive the key straight away (what every import
+              cost before derivation became lazy)
+    lazy      import only; the key is derived on first use
+    keyfile   import, then load the key from a CERTIFICATE_KEYFILE written
+              by an earlier process
+
+Usage:
+    python benchmarks/bench_startup.py --runs 10
+
+Sample run (Linux container, 1 CPU, 20 runs, median):
+        case     import ms   first key ms    total ms
+       eager         348.0           27.9       376.2
+        lazy         340.2            0.0       340.2
+     keyfile         357.8            0.3       358.2
+
+Import times vary by tens of milliseconds between processes; the first key
+column is the part lazy derivation moves. PBKDF2 cost grows with the CPU's
+slowness, so on small instances the eager case pays far more. Compressing
+the static files (about 300 ms) is not part of the import either: init_app()
+does it once, or the first request that serves one.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import certificate_api
+imported = time.perf_counter()
+if sys.argv[1] != 'lazy':
+    import encryption_utils
+    encryption_utils.encryption.key
+done = time.perf_counter()
+print(json.dumps({'import': imported - started, 'key': done - imported}))
+'''
+
+
+def sample(case, env):
+    output = subprocess.run([sys.executable, '-c', CHILD, case], cwd=BACKEND, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, QR_CACHE_DIR=os.path.join(tmp, 'qr_cache'), CERTIFICATE_KEYFILE='')
+        keyfile_env = dict(env, CERTIFICATE_KEYFILE=os.path.join(tmp, 'certificate.key'))
+        sample('keyfile', keyfile_env)  # writes the keyfile
+
+        cases = (('eager', env), ('lazy', env), ('keyfile', keyfile_env))
+        # Interleave the cases, so drift in machine load hits all of them alike
+        samples = {case: [] for case, _ in cases}
+        for _ in range(args.runs):
+            for case, case_env in cases:
+                samples[case].append(sample(case, case_env))
+
+        print(f"{'case':>12} {'import ms':>13} {'first key ms':>14} {'total ms':>11}")
+        for case, runs in samples.items():
+            imported = statistics.median(r['import'] for r in runs) * 1000
+            key = statistics.median(r['key'] for r in runs) * 1000
+            total = statistics.median(r['import'] + r['key'] for r in runs) * 1000
+            print(f"{case:>12} {imported:>13.1f} {key:>14.1f} {total:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,16 +4,35 @@ Share Certificate Verification API
 Handles certificate validation and QR code generation
 """
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 from flask_cors import CORS
 import sqlite3
 import qrcode
+import qrcode.image.svg
+import hashlib
 import io
 import base64
 from datetime import datetime
 import os
 import logging
-from encryption_utils import encrypt_certificate_for_qr, decrypt_qr_certificate, verify_qr_certificate
+import json
+from functools import wraps
+from contextlib import ExitStack
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from encryption_utils import encode_qr_payload, check_qr_payload, verify_qr_certificate, key_fingerprint, QR_PAYLOAD_FORMATS
+from db_pool import SQLitePool, DB_POOL_SIZE
+from sqlite_tuning import apply_pragmas
+from migrations import migrate
+from response_cache import ResponseCache
+from qr_cache import QRCache
+from certificate_import import REQUIRED_FIELDS, parse_records, import_certificates, write_zip
+from certificate_index import CertificateIndex, CertificateRecord
+from pagination import encode_cursor, decode_cursor
+from exports import iter_chunks
+from static_assets import AssetStore
+from rate_limit import RateLimiter, client_ip, parse_limit
+from admin_auth import AdminAuthenticator, LoginThrottled, DEFAULT_PASSWORD_HASH
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,127 +43,214 @@ CORS(app)
 
 # Database configuration
 DB_PATH = 'certificates.db'
+db_pool = SQLitePool(DB_PATH, size=DB_POOL_SIZE, on_connect=apply_pragmas)
+# Lookups by certificate number are served from memory (see certificate_index.py)
+certificate_index = CertificateIndex(DB_PATH)
+
+def use_database(path):
+    """Point the API at another certificates database (used by the command-line tools)"""
+    global DB_PATH
+    DB_PATH = path
+    db_pool.path = path
+    certificate_index.path = path
+
+# Read endpoints are cached per process (or in Redis, see
+# RESPONSE_CACHE_BACKEND) and invalidated whenever a certificate is added. The
+# key includes the version of the certificate index they are read from, so a
+# write by another process (worker or import CLI) invalidates them as soon as
+# the index picks it up (CERTIFICATE_INDEX_CHECK_INTERVAL)
+VERIFY_CACHE_TTL = float(os.getenv('VERIFY_CACHE_TTL', 60))
+response_cache = ResponseCache(namespace='certificates', versions={'certificates': certificate_index.version})
+
+# Pages and static files, served from memory (see static_assets.py)
+static_assets = AssetStore(pages=('verify.html',))
+
+# Verification requests per client IP ('count/seconds', see rate_limit.py).
+# The batch limit counts QR codes, not requests: each one is a decryption
+VERIFY_RATE_LIMIT = os.getenv('VERIFY_RATE_LIMIT', '60/60')
+VERIFY_BATCH_RATE_LIMIT = os.getenv('VERIFY_BATCH_RATE_LIMIT', '10000/600')
+BULK_IMPORT_RATE_LIMIT = os.getenv('BULK_IMPORT_RATE_LIMIT', '5/60')
+rate_limiter = RateLimiter()
+
+# Admin credentials for the write endpoints, sent as HTTP Basic auth (see admin_auth.py)
+ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
+ADMIN_PASSWORD_HASH = os.getenv('ADMIN_PASSWORD_HASH', DEFAULT_PASSWORD_HASH)
+admin_auth = AdminAuthenticator(ADMIN_USERNAME, ADMIN_PASSWORD_HASH, rate_limiter)
 
 def init_certificate_database():
     """Initialize the certificate database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS certificates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            certificate_number TEXT NOT NULL UNIQUE,
-            certificate_name TEXT NOT NULL,
-            number_of_shares INTEGER NOT NULL,
-            owner_name TEXT NOT NULL,
-            certificate_type TEXT NOT NULL,
-            par_value TEXT NOT NULL,
-            issue_date DATE NOT NULL,
-            status TEXT DEFAULT 'valid',
-            authorized_shares INTEGER NOT NULL,
-            issued_shares INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Insert sample certificate
-    cursor.execute('''
-        INSERT OR IGNORE INTO certificates 
-        (certificate_number, certificate_name, number_of_shares, owner_name, 
-         certificate_type, par_value, issue_date, authorized_shares, issued_shares)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        '000001',
-        'Teknoledge Holdings Share Certificate',
-        1000000,
-        'Tim McGuckin',
-        'Common Stock',
-        '$0.001',
-        '2024-01-01',
-        10000000,
-        1000000
-    ))
-    
-    conn.commit()
-    conn.close()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        migrate(conn, 'certificates')
+        
+        # Insert sample certificate
+        cursor.execute('''
+            INSERT OR IGNORE INTO certificates 
+            (certificate_number, certificate_name, number_of_shares, owner_name, 
+             certificate_type, par_value, issue_date, authorized_shares, issued_shares)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            '000001',
+            'Teknoledge Holdings Share Certificate',
+            1000000,
+            'Tim McGuckin',
+            'Common Stock',
+            '$0.001',
+            '2024-01-01',
+            10000000,
+            1000000
+        ))
+        
+        conn.commit()
+    certificate_index.load()
     logger.info("Certificate database initialized")
 
-def generate_qr_code(certificate_number, certificate_data=None):
-    """Generate encrypted QR code for certificate"""
-    if certificate_data is None:
-        # Get certificate data from database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT certificate_number, certificate_name, number_of_shares, 
-                   owner_name, certificate_type, par_value, issue_date, 
-                   status, authorized_shares, issued_shares
-            FROM certificates 
-            WHERE certificate_number = ?
-        """, (certificate_number,))
+CERTIFICATE_FIELDS = CertificateRecord.__slots__
+
+def get_certificate(certificate_number):
+    """Fetch one certificate as a dict, or None if it doesn't exist"""
+    return certificate_index.get(certificate_number)
+
+def get_certificates(certificate_numbers) -> dict:
+    """Certificates by number for many numbers at once (missing ones are absent)"""
+    return certificate_index.get_many(certificate_numbers)
+
+def reject_unknown_certificates(view):
+    """
+    Answer 404 straight away for certificate numbers the index's Bloom
+    filter or negative cache rules out, before the response cache or the
+    view do any work (so scraped or mistyped numbers cannot crowd real
+    entries out of the response cache)
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        certificate_number = kwargs.get('certificate_number')
+        if certificate_number is None:
+            data = request.get_json(silent=True)
+            certificate_number = data.get('certificate_number') if isinstance(data, dict) else None
+            if isinstance(certificate_number, str):
+                certificate_number = certificate_number.strip()
         
-        result = cursor.fetchone()
-        conn.close()
+        if isinstance(certificate_number, str) and certificate_number \
+                and certificate_index.known_missing(certificate_number):
+            return jsonify({
+                'success': False,
+                'message': 'Certificate not found',
+                'certificate_number': certificate_number
+            }), 404
+        return view(*args, **kwargs)
+    return wrapper
+
+def admin_required(view):
+    """Require the admin credentials as HTTP Basic auth"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        auth = request.authorization
+        try:
+            authenticated = auth is not None and admin_auth.authenticate(
+                auth.username or '', auth.password or '', client_ip(request))
+        except LoginThrottled as e:
+            return jsonify({
+                'success': False,
+                'message': 'Too many login attempts, please try again later'
+            }), 429, {'Retry-After': str(e.retry_after)}
         
-        if not result:
-            raise Exception("Certificate not found")
+        if not authenticated:
+            return jsonify({
+                'success': False,
+                'message': 'Admin credentials required'
+            }), 401, {'WWW-Authenticate': 'Basic realm="Teknoledge admin"'}
+        return view(*args, **kwargs)
+    return wrapper
+
+def all_certificates():
+    """Fetch every certificate as a dict, ordered by number"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(CERTIFICATE_FIELDS)}
+            FROM certificates 
+            ORDER BY certificate_number
+        """)
         
-        certificate_data = {
-            'certificate_number': result[0],
-            'certificate_name': result[1],
-            'number_of_shares': result[2],
-            'owner_name': result[3],
-            'certificate_type': result[4],
-            'par_value': result[5],
-            'issue_date': result[6],
-            'status': result[7],
-            'authorized_shares': result[8],
-            'issued_shares': result[9]
-        }
-    
+        return [dict(zip(CERTIFICATE_FIELDS, row)) for row in cursor.fetchall()]
+
+# QR image options: box_size is pixels per module (PNG) or a tenth of a
+# millimetre (SVG), border is the quiet zone in modules (the spec asks for 4)
+QR_IMAGE_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+QR_BOX_SIZE_RANGE = (1, 40)
+QR_BORDER_RANGE = (0, 16)
+QR_HTTP_MAX_AGE = int(os.getenv('QR_HTTP_MAX_AGE', 86400))
+# compact (encrypted record, small QR), reference (signed certificate number,
+# smallest QR, verified against the database) or legacy (SEC_CERT: payload)
+QR_PAYLOAD_FORMAT = os.getenv('QR_PAYLOAD_FORMAT', 'compact')
+if QR_PAYLOAD_FORMAT not in QR_PAYLOAD_FORMATS:
+    raise ValueError(f"QR_PAYLOAD_FORMAT must be one of {', '.join(QR_PAYLOAD_FORMATS)}")
+
+def render_certificate_qr(certificate_data, box_size=10, border=4, image_format='png', payload=QR_PAYLOAD_FORMAT):
+    """Encrypt certificate data and render it as a PNG or SVG QR code"""
     # Generate encrypted QR data
-    encrypted_qr_data = encrypt_certificate_for_qr(certificate_data)
+    encrypted_qr_data = encode_qr_payload(certificate_data, payload)
     
     # Create QR code with encrypted data
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_M,  # Medium error correction for encrypted data
-        box_size=10,
-        border=4,
+        box_size=box_size,
+        border=border,
     )
     qr.add_data(encrypted_qr_data)
     qr.make(fit=True)
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
     buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
+    if image_format == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+# Rendered QR images are reused until the certificate row or the encryption
+# key changes (see qr_cache.py; `python qr_cache.py warm` pre-renders them)
+qr_cache = QRCache(render_certificate_qr, salt=key_fingerprint,
+                   defaults={'box_size': 10, 'border': 4, 'image_format': 'png', 'payload': QR_PAYLOAD_FORMAT})
+
+def generate_qr_code(certificate_number, certificate_data=None):
+    """Generate encrypted QR code for certificate"""
+    if certificate_data is None:
+        # Get certificate data from database
+        certificate_data = get_certificate(certificate_number)
+        
+        if not certificate_data:
+            raise Exception("Certificate not found")
     
-    return base64.b64encode(buffer.getvalue()).decode()
+    # Convert to base64
+    return base64.b64encode(qr_cache.get(certificate_data)).decode()
 
 @app.route('/')
 def serve_verify():
     """Serve the verification page"""
-    return send_from_directory('..', 'verify.html')
+    return static_assets.serve('verify.html')
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
     """Serve CSS files"""
-    return send_from_directory('../css', filename)
+    return static_assets.serve(f'css/{filename}')
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
     """Serve JavaScript files"""
-    return send_from_directory('../js', filename)
+    return static_assets.serve(f'js/{filename}')
 
 @app.route('/images/<path:filename>')
 def serve_images(filename):
     """Serve image files"""
-    return send_from_directory('../images', filename)
+    return static_assets.serve(f'images/{filename}')
 
 @app.route('/api/verify-certificate', methods=['POST'])
+@rate_limiter.limit('verify-certificate', VERIFY_RATE_LIMIT)
+@reject_unknown_certificates
+@response_cache.cached(ttl=VERIFY_CACHE_TTL, tags=('certificates',))
 def verify_certificate():
     """Verify a share certificate"""
     try:
@@ -157,36 +263,10 @@ def verify_certificate():
                 'message': 'Certificate number is required'
             }), 400
         
-        # Connect to database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Query certificate
-        cursor.execute("""
-            SELECT certificate_number, certificate_name, number_of_shares, 
-                   owner_name, certificate_type, par_value, issue_date, 
-                   status, authorized_shares, issued_shares
-            FROM certificates 
-            WHERE certificate_number = ?
-        """, (certificate_number,))
-        
-        result = cursor.fetchone()
-        conn.close()
+        # Look up the certificate (in memory, no database round trip)
+        certificate = get_certificate(certificate_number)
         
-        if result:
-            certificate = {
-                'certificate_number': result[0],
-                'certificate_name': result[1],
-                'number_of_shares': result[2],
-                'owner_name': result[3],
-                'certificate_type': result[4],
-                'par_value': result[5],
-                'issue_date': result[6],
-                'status': result[7],
-                'authorized_shares': result[8],
-                'issued_shares': result[9]
-            }
-            
+        if certificate:
             return jsonify({
                 'success': True,
                 'certificate': certificate,
@@ -207,6 +287,7 @@ def verify_certificate():
         }), 500
 
 @app.route('/api/verify-encrypted-qr', methods=['POST'])
+@rate_limiter.limit('verify-encrypted-qr', VERIFY_RATE_LIMIT)
 def verify_encrypted_qr():
     """Verify an encrypted QR code"""
     try:
@@ -219,8 +300,8 @@ def verify_encrypted_qr():
                 'message': 'QR code data is required'
             }), 400
         
-        # Decrypt and verify QR code
-        is_valid, certificate_data = verify_qr_certificate(qr_data, '')
+        # Decrypt and verify QR code (a signed reference is resolved from the database)
+        is_valid, certificate_data = verify_qr_certificate(qr_data, lookup=get_certificate)
         
         if is_valid and certificate_data:
             return jsonify({
@@ -243,26 +324,135 @@ def verify_encrypted_qr():
             'message': 'Error verifying encrypted QR code'
         }), 500
 
+# Batch QR verification: payloads are decrypted on a thread pool (the
+# cryptography primitives release the GIL) a chunk at a time, and the signed
+# references of each chunk are resolved with a single query
+VERIFY_WORKERS = int(os.getenv('VERIFY_WORKERS', min(8, 2 * (os.cpu_count() or 1))))
+# Neither may exceed the VERIFY_BATCH_RATE_LIMIT burst, or the request could never be admitted
+VERIFY_BATCH_LIMIT = parse_limit(VERIFY_BATCH_RATE_LIMIT)
+VERIFY_BATCH_MAX_ITEMS = min(int(os.getenv('VERIFY_BATCH_MAX_ITEMS', 1000)), int(VERIFY_BATCH_LIMIT[1]))
+VERIFY_STREAM_MAX_ITEMS = min(int(os.getenv('VERIFY_STREAM_MAX_ITEMS', 10000)), int(VERIFY_BATCH_LIMIT[1]))
+VERIFY_CHUNK_SIZE = 256
+# Largest payload a QR code can hold (version 40, alphanumeric mode)
+QR_MAX_CHARS = 4296
+verify_pool = ThreadPoolExecutor(VERIFY_WORKERS, thread_name_prefix='qr-verify')
+
+def _check_batch_item(qr_data):
+    if not isinstance(qr_data, str) or not qr_data.strip() or len(qr_data) > QR_MAX_CHARS:
+        return None
+    return check_qr_payload(qr_data.strip())
+
+def verify_qr_batch(payloads):
+    """Yield a result for each QR payload, in order"""
+    for start in range(0, len(payloads), VERIFY_CHUNK_SIZE):
+        chunk = payloads[start:start + VERIFY_CHUNK_SIZE]
+        decoded = list(verify_pool.map(_check_batch_item, chunk))
+        
+        references = {d['cert_number'] for d in decoded if d is not None and d.get('data') is None}
+        records = get_certificates(references) if references else {}
+        
+        for index, payload in enumerate(decoded, start):
+            certificate = None
+            if payload is not None:
+                certificate = payload.get('data', {})
+                if certificate is None:
+                    certificate = records.get(payload['cert_number'])
+            
+            if certificate:
+                yield {'index': index, 'valid': True, 'certificate': certificate}
+            else:
+                yield {'index': index, 'valid': False, 'message': 'Invalid or corrupted QR code'}
+
+def _ndjson_verify_stream(payloads):
+    valid = 0
+    for result in verify_qr_batch(payloads):
+        valid += result['valid']
+        yield json.dumps(result, separators=(',', ':')) + '\n'
+    yield json.dumps({'done': True, 'total': len(payloads), 'valid': valid,
+                      'invalid': len(payloads) - valid}, separators=(',', ':')) + '\n'
+
+@app.route('/api/verify-encrypted-qr/batch', methods=['POST'])
+def verify_encrypted_qr_batch():
+    """
+    Verify many encrypted QR codes at once. The body is {"qr_data": [...]},
+    a JSON array, or JSON lines (application/x-ndjson) of strings or
+    {"qr_data": ...} objects. Results come back in request order, as one
+    JSON document or, with ?format=ndjson or Accept: application/x-ndjson,
+    streamed one line per payload followed by a summary line. Each code
+    takes a token from the client's VERIFY_BATCH_RATE_LIMIT bucket.
+    """
+    stream = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.quality('application/x-ndjson') > request.accept_mimetypes.quality('application/json')
+    
+    try:
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            payloads = parse_records(request.get_data(as_text=True), 'jsonl')
+        else:
+            data = request.get_json(silent=True)
+            payloads = data.get('qr_data') if isinstance(data, dict) else data
+            if not isinstance(payloads, list):
+                raise ValueError('Expected {"qr_data": [...]}, a JSON array or JSON lines')
+        payloads = [item.get('qr_data') if isinstance(item, dict) else item for item in payloads]
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    limit = VERIFY_STREAM_MAX_ITEMS if stream else VERIFY_BATCH_MAX_ITEMS
+    if not payloads or len(payloads) > limit:
+        return jsonify({
+            'success': False,
+            'message': f'Send between 1 and {limit} QR codes'
+            + ('' if stream or VERIFY_STREAM_MAX_ITEMS <= limit else ' (use ?format=ndjson for larger batches)')
+        }), 400
+    
+    retry_after = rate_limiter.hit('verify-encrypted-qr-batch', client_ip(request), *VERIFY_BATCH_LIMIT,
+                                   cost=len(payloads))
+    if retry_after:
+        return jsonify({
+            'success': False,
+            'message': 'Too many QR codes verified, please try again later'
+        }), 429, {'Retry-After': str(retry_after)}
+    
+    if stream:
+        return Response(_ndjson_verify_stream(payloads), mimetype='application/x-ndjson')
+    
+    try:
+        results = list(verify_qr_batch(payloads))
+    except Exception as e:
+        logger.error(f"Batch QR verification error: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Error verifying encrypted QR codes'
+        }), 500
+    
+    valid = sum(result['valid'] for result in results)
+    return jsonify({
+        'success': True,
+        'total': len(results),
+        'valid': valid,
+        'invalid': len(results) - valid,
+        'results': results,
+        'encrypted': True
+    })
+
 @app.route('/api/generate-qr/<certificate_number>')
+@reject_unknown_certificates
 def generate_qr(certificate_number):
     """Generate QR code for certificate"""
     try:
         # Verify certificate exists
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT certificate_number FROM certificates WHERE certificate_number = ?", (certificate_number,))
+        certificate_data = get_certificate(certificate_number)
         
-        if not cursor.fetchone():
-            conn.close()
+        if not certificate_data:
             return jsonify({
                 'success': False,
                 'message': 'Certificate not found'
             }), 404
         
-        conn.close()
-        
-        # Generate QR code
-        qr_code = generate_qr_code(certificate_number)
+        # Generate QR code (served from the artifact cache after the first time)
+        qr_code = generate_qr_code(certificate_number, certificate_data)
         
         return jsonify({
             'success': True,
@@ -277,45 +467,216 @@ def generate_qr(certificate_number):
             'message': 'Error generating QR code'
         }), 500
 
+@app.route('/api/qr/<certificate_number>')
+@reject_unknown_certificates
+def qr_image(certificate_number):
+    """
+    QR code as a raw image. The format is ?format=png|svg or, without it,
+    negotiated from the Accept header (PNG unless only SVG is acceptable).
+    """
+    image_format = request.args.get('format')
+    if image_format is None:
+        # Browsers list image/svg+xml explicitly but PNG only via image/*, so
+        # compare qualities rather than taking the most specific match
+        accept = request.accept_mimetypes
+        image_format = 'svg' if accept.quality('image/svg+xml') > accept.quality('image/png') else 'png'
+    if image_format not in QR_IMAGE_FORMATS:
+        return jsonify({'success': False, 'message': 'format must be png or svg'}), 400
+    
+    box_size = request.args.get('box_size', 10, type=int)
+    border = request.args.get('border', 4, type=int)
+    if not QR_BOX_SIZE_RANGE[0] <= box_size <= QR_BOX_SIZE_RANGE[1] \
+            or not QR_BORDER_RANGE[0] <= border <= QR_BORDER_RANGE[1]:
+        return jsonify({
+            'success': False,
+            'message': f'box_size must be {QR_BOX_SIZE_RANGE[0]}-{QR_BOX_SIZE_RANGE[1]} '
+                       f'and border {QR_BORDER_RANGE[0]}-{QR_BORDER_RANGE[1]}'
+        }), 400
+    
+    try:
+        certificate_data = get_certificate(certificate_number)
+        if not certificate_data:
+            return jsonify({
+                'success': False,
+                'message': 'Certificate not found'
+            }), 404
+        
+        image = qr_cache.get(certificate_data, box_size=box_size, border=border, image_format=image_format)
+        
+    except Exception as e:
+        logger.error(f"QR image error: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Error generating QR code'
+        }), 500
+    
+    # The ETag hashes the stored bytes, so it changes whenever the image does
+    # (certificate edited, key rotated, artifact re-rendered after expiry)
+    response = Response(image, mimetype=QR_IMAGE_FORMATS[image_format])
+    response.set_etag(hashlib.sha256(image).hexdigest()[:32])
+    response.headers['Cache-Control'] = f'public, max-age={QR_HTTP_MAX_AGE}'
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+# /api/certificates paging, filters and projection
+CERTIFICATES_PAGE_SIZE = int(os.getenv('CERTIFICATES_PAGE_SIZE', 100))
+CERTIFICATES_MAX_PAGE_SIZE = int(os.getenv('CERTIFICATES_MAX_PAGE_SIZE', 1000))
+# Unfiltered ?total=1 counts above this many rows are estimated
+CERTIFICATES_APPROX_COUNT_THRESHOLD = int(os.getenv('CERTIFICATES_APPROX_COUNT_THRESHOLD', 100000))
+CERTIFICATE_LIST_FIELDS = (
+    'certificate_number', 'certificate_name', 'number_of_shares',
+    'owner_name', 'status', 'issue_date'
+)
+# Query parameter -> condition; each is backed by an index (migrations 3 and 4)
+CERTIFICATE_FILTERS = {
+    'status': 'status = ?',
+    'owner_name': 'owner_name = ?',
+    'certificate_type': 'certificate_type = ?',
+    'issue_date_from': 'issue_date >= ?',
+    'issue_date_to': 'issue_date <= ?',
+}
+
+def _certificate_list_query(args):
+    """
+    Build (sql, params, count sql, count params, columns, cursor key length,
+    fields, limit) from the query string, or raise ValueError
+    """
+    fields = tuple(f.strip() for f in args.get('fields', '').split(',') if f.strip()) or CERTIFICATE_LIST_FIELDS
+    unknown = [f for f in fields if f not in CERTIFICATE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    
+    limit = args.get('limit', CERTIFICATES_PAGE_SIZE, type=int)
+    if not limit or not 1 <= limit <= CERTIFICATES_MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be 1-{CERTIFICATES_MAX_PAGE_SIZE}')
+    
+    conditions, params = [], []
+    for name, condition in CERTIFICATE_FILTERS.items():
+        value = args.get(name)
+        if value is None:
+            continue
+        if name.startswith('issue_date'):
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f'{name} must be YYYY-MM-DD')
+        conditions.append(condition)
+        params.append(value)
+    count_conditions, count_params = list(conditions), list(params)
+    
+    # An issue_date range on its own is listed in (issue_date, certificate_number)
+    # order, a range scan of idx_certificates_issue_date_number; with an
+    # equality filter too, that filter's index keeps number order
+    if conditions and all(c.startswith('issue_date') for c in conditions):
+        key = ('issue_date', 'certificate_number')
+    else:
+        key = ('certificate_number',)
+    
+    if args.get('cursor'):
+        _, after = decode_cursor(args['cursor'], key_length=len(key))
+        if len(key) == 2:
+            # The row value alone is not used to seek the index; the plain
+            # bound on issue_date starts the range scan at the cursor's date
+            conditions += ['issue_date >= ?', '(issue_date, certificate_number) > (?, ?)']
+            params += [after[0], *after]
+        else:
+            conditions.append('certificate_number > ?')
+            params += after
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    # The sort key always comes first: it is the cursor
+    columns = key + tuple(f for f in fields if f not in key)
+    sql = f"SELECT {', '.join(columns)} FROM certificates {where} ORDER BY {', '.join(key)} LIMIT ?"
+    count_sql = f"SELECT COUNT(*) FROM certificates {'WHERE ' + ' AND '.join(count_conditions) if count_conditions else ''}"
+    return sql, params + [limit + 1], count_sql, count_params, columns, len(key), fields, limit
+
+def _count_certificates(cursor, threshold=CERTIFICATES_APPROX_COUNT_THRESHOLD):
+    """
+    (count, is_approximate) for the whole table. Large tables are estimated
+    from the span of the AUTOINCREMENT id (two b-tree seeks; over-counts
+    deleted rows) instead of a full COUNT(*).
+    """
+    # Separate subqueries so each aggregate is a single b-tree seek
+    cursor.execute('SELECT (SELECT MAX(id) FROM certificates) - (SELECT MIN(id) FROM certificates) + 1')
+    estimate = cursor.fetchone()[0] or 0
+    if estimate >= threshold:
+        return estimate, True
+    cursor.execute('SELECT COUNT(*) FROM certificates')
+    return cursor.fetchone()[0], False
+
+def _stream_certificate_page(cursor, columns, key_length, fields, limit, total):
+    """The page as a JSON document, one fetchmany() chunk at a time"""
+    yield '{"success":true,"certificates":['
+    count, last, has_more = 0, None, False
+    for rows in iter_chunks(cursor):
+        items = []
+        for row in rows:
+            if count == limit:
+                has_more = True
+                break
+            record = dict(zip(columns, row))
+            items.append(json.dumps({field: record[field] for field in fields}, separators=(',', ':')))
+            last = row[:key_length]
+            count += 1
+        if items:
+            yield (',' if count > len(items) else '') + ','.join(items)
+        if has_more:
+            break
+    
+    trailer = {'count': count, 'next_cursor': encode_cursor('next', *last) if has_more else None}
+    if total is not None:
+        trailer['total'], trailer['total_is_approximate'] = total
+    yield '],' + json.dumps(trailer, separators=(',', ':'))[1:]
+
 @app.route('/api/certificates')
 def list_certificates():
-    """List all certificates"""
+    """
+    List certificates in certificate number order (issue date, then number,
+    when the only filters are ?issue_date_from= / ?issue_date_to=), a page
+    at a time.
+    
+    ?limit= (default CERTIFICATES_PAGE_SIZE), ?cursor= (next_cursor of the
+    previous page), filters ?status= ?owner_name= ?certificate_type=
+    ?issue_date_from= ?issue_date_to=, ?fields= (comma-separated columns)
+    and ?total=1 to include the number of matching certificates. The JSON is
+    streamed, so memory use does not grow with the page size.
+    """
+    try:
+        sql, params, count_sql, count_params, columns, key_length, fields, limit = \
+            _certificate_list_query(request.args)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    stack = ExitStack()
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = stack.enter_context(db_pool.connection())
         cursor = conn.cursor()
+        stack.callback(cursor.close)
         
-        cursor.execute("""
-            SELECT certificate_number, certificate_name, number_of_shares, 
-                   owner_name, status, issue_date
-            FROM certificates 
-            ORDER BY certificate_number
-        """)
-        
-        certificates = []
-        for row in cursor.fetchall():
-            certificates.append({
-                'certificate_number': row[0],
-                'certificate_name': row[1],
-                'number_of_shares': row[2],
-                'owner_name': row[3],
-                'status': row[4],
-                'issue_date': row[5]
-            })
-        
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'certificates': certificates,
-            'total': len(certificates)
-        })
+        total = None
+        if request.args.get('total') == '1':
+            if count_params:
+                cursor.execute(count_sql, count_params)
+                total = (cursor.fetchone()[0], False)
+            else:
+                total = _count_certificates(cursor)
         
+        cursor.execute(sql, params)
     except Exception as e:
+        stack.close()
         logger.error(f"List certificates error: {e}")
         return jsonify({
             'success': False,
             'message': 'Error retrieving certificates'
         }), 500
+    
+    response = Response(_stream_certificate_page(cursor, columns, key_length, fields, limit, total),
+                        mimetype='application/json')
+    response.call_on_close(stack.close)
+    return response
 
 @app.route('/api/add-certificate', methods=['POST'])
 def add_certificate():
@@ -323,41 +684,36 @@ def add_certificate():
     try:
         data = request.get_json()
         
-        required_fields = [
-            'certificate_number', 'certificate_name', 'number_of_shares',
-            'owner_name', 'certificate_type', 'par_value', 'issue_date',
-            'authorized_shares', 'issued_shares'
-        ]
-        
-        for field in required_fields:
+        for field in REQUIRED_FIELDS:
             if field not in data:
                 return jsonify({
                     'success': False,
                     'message': f'Missing required field: {field}'
                 }), 400
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO certificates 
-            (certificate_number, certificate_name, number_of_shares, owner_name,
-             certificate_type, par_value, issue_date, authorized_shares, issued_shares)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data['certificate_number'],
-            data['certificate_name'],
-            data['number_of_shares'],
-            data['owner_name'],
-            data['certificate_type'],
-            data['par_value'],
-            data['issue_date'],
-            data['authorized_shares'],
-            data['issued_shares']
-        ))
-        
-        conn.commit()
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO certificates 
+                (certificate_number, certificate_name, number_of_shares, owner_name,
+                 certificate_type, par_value, issue_date, authorized_shares, issued_shares)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                data['certificate_number'],
+                data['certificate_name'],
+                data['number_of_shares'],
+                data['owner_name'],
+                data['certificate_type'],
+                data['par_value'],
+                data['issue_date'],
+                data['authorized_shares'],
+                data['issued_shares']
+            ))
+            
+            conn.commit()
+        certificate_index.refresh([data['certificate_number']])
+        response_cache.invalidate('certificates')
         
         return jsonify({
             'success': True,
@@ -376,9 +732,97 @@ def add_certificate():
             'message': 'Error adding certificate'
         }), 500
 
-if __name__ == '__main__':
-    # Initialize database
+@app.route('/api/certificates/bulk', methods=['POST'])
+@rate_limiter.limit('certificates-bulk', BULK_IMPORT_RATE_LIMIT)
+@admin_required
+def bulk_add_certificates():
+    """
+    Import a batch of certificates in one transaction (admin only, HTTP
+    Basic auth). The body is CSV
+    (text/csv), JSON lines (application/x-ndjson) or a JSON array. ?atomic=1
+    imports nothing if any row is rejected, ?dry_run=1 only validates, and
+    ?qr=zip returns the imported certificates' QR codes (?format=png|svg)
+    as a ZIP that also contains report.json.
+    """
+    try:
+        if request.mimetype == 'text/csv':
+            records = parse_records(request.get_data(as_text=True), 'csv')
+        elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            records = parse_records(request.get_data(as_text=True), 'jsonl')
+        else:
+            data = request.get_json(silent=True)
+            records = data.get('certificates') if isinstance(data, dict) else data
+            if not isinstance(records, list):
+                raise ValueError('Expected CSV, JSON lines or a JSON array of certificates')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    image_format = request.args.get('format', 'png')
+    if image_format not in QR_IMAGE_FORMATS:
+        return jsonify({'success': False, 'message': 'format must be png or svg'}), 400
+    
+    try:
+        with db_pool.connection() as conn:
+            report = import_certificates(conn, records,
+                                         atomic=request.args.get('atomic') == '1',
+                                         dry_run=request.args.get('dry_run') == '1')
+        if report['inserted']:
+            certificate_index.refresh(c['certificate_number'] for c in report['inserted'])
+            response_cache.invalidate('certificates')
+        
+        summary = {
+            'success': report['committed'] and not report['errors'],
+            'committed': report['committed'],
+            'imported': len(report['inserted']),
+            'rejected': len(report['errors']),
+            'errors': report['errors']
+        }
+        
+        if request.args.get('qr') != 'zip' or not report['inserted']:
+            return jsonify(summary)
+        
+        images = qr_cache.render_many(report['inserted'], image_format=image_format)
+        archive = io.BytesIO()
+        write_zip(archive, report['inserted'], images, image_format, report=summary)
+        return Response(
+            archive.getvalue(),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=certificates_qr.zip'}
+        )
+        
+    except Exception as e:
+        logger.error(f"Bulk import error: {e}")
+        return jsonify({
+            'success': False,
+            'message': 'Error importing certificates'
+        }), 500
+
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Connection pool, certificate index, cache and rate limit metrics (admin only, HTTP Basic auth)"""
+    return jsonify({
+        'db_pool': db_pool.stats(),
+        'certificate_index': certificate_index.stats(),
+        'response_cache': response_cache.stats(),
+        'qr_cache': qr_cache.stats(),
+        'rate_limit': rate_limiter.stats()
+    })
+
+def init_app():
+    """One-time setup, run before any worker starts (see gunicorn.conf.py)"""
     init_certificate_database()
+    # Derive the encryption key and compress the static files now, so forked
+    # workers inherit them
+    key_fingerprint()
+    static_assets.load()
+
+if __name__ == '__main__':
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
+    init_app()
     
     # Run the app
     port = int(os.getenv('PORT', 5001))
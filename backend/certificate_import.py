@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Bulk certificate import
+Parses CSV or JSON-lines certificate batches, validates every row, inserts
+them in one transaction and renders their QR codes in parallel
+
+Usage:
+    python certificate_import.py round_a.csv --zip round_a_qr.zip
+    python certificate_import.py round_a.jsonl --out qr/ --format svg --workers 8
+    python certificate_import.py round_a.csv --dry-run
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sqlite3
+import sys
+import zipfile
+from datetime import date
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = (
+    'certificate_number', 'certificate_name', 'number_of_shares',
+    'owner_name', 'certificate_type', 'par_value', 'issue_date',
+    'authorized_shares', 'issued_shares'
+)
+INTEGER_FIELDS = ('number_of_shares', 'authorized_shares', 'issued_shares')
+
+INSERT_CERTIFICATE = '''
+    INSERT INTO certificates
+    (certificate_number, certificate_name, number_of_shares, owner_name,
+     certificate_type, par_value, issue_date, authorized_shares, issued_shares, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def parse_records(text, fmt):
+    """Split a CSV or JSON-lines document into a list of dicts"""
+    if fmt == 'csv':
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+    if fmt == 'jsonl':
+        records = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    raise ValueError(f"line {number}: invalid JSON ({e})")
+        return records
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def validate_certificate(record) -> tuple:
+    """Normalize one record; returns (certificate, None) or (None, error message)"""
+    if not isinstance(record, dict):
+        return None, 'Record must be an object'
+
+    certificate = {}
+    for field in REQUIRED_FIELDS:
+        value = record.get(field)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return None, f'Missing required field: {field}'
+        certificate[field] = value.strip() if isinstance(value, str) else value
+
+    for field in INTEGER_FIELDS:
+        try:
+            certificate[field] = int(certificate[field])
+        except (TypeError, ValueError):
+            return None, f'{field} must be an integer'
+        if certificate[field] < 0:
+            return None, f'{field} must not be negative'
+
+    try:
+        date.fromisoformat(str(certificate['issue_date']))
+    except ValueError:
+        return None, 'issue_date must be YYYY-MM-DD'
+
+    if certificate['issued_shares'] > certificate['authorized_shares']:
+        return None, 'issued_shares exceeds authorized_shares'
+
+    # Store text columns as text, so the row reads back exactly as validated
+    for field in REQUIRED_FIELDS:
+        if field not in INTEGER_FIELDS:
+            certificate[field] = str(certificate[field])
+    certificate['status'] = str(record.get('status') or 'valid')
+    return certificate, None
+
+
+def import_certificates(conn, records, atomic=False, dry_run=False) -> dict:
+    """
+    Validate and insert a batch in a single transaction.
+
+    Each row is inserted under its own SAVEPOINT, so a duplicate certificate
+    number fails only that row. With atomic=True any error rolls back the
+    whole batch; dry_run=True validates and inserts but never commits.
+    Returns {'inserted': [certificate, ...], 'errors': [{row, certificate_number, message}]}.
+    """
+    inserted, errors, seen = [], [], set()
+
+    def reject(row, record, message):
+        number = record.get('certificate_number') if isinstance(record, dict) else None
+        errors.append({'row': row, 'certificate_number': number, 'message': message})
+
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for row, record in enumerate(records, 1):
+            certificate, error = validate_certificate(record)
+            if error:
+                reject(row, record, error)
+                continue
+            if certificate['certificate_number'] in seen:
+                reject(row, record, 'Duplicate certificate number in this batch')
+                continue
+            seen.add(certificate['certificate_number'])
+
+            cursor.execute('SAVEPOINT import_row')
+            try:
+                cursor.execute(INSERT_CERTIFICATE, tuple(certificate[f] for f in REQUIRED_FIELDS + ('status',)))
+                cursor.execute('RELEASE import_row')
+                inserted.append(certificate)
+            except sqlite3.IntegrityError:
+                cursor.execute('ROLLBACK TO import_row')
+                cursor.execute('RELEASE import_row')
+                reject(row, record, 'Certificate number already exists')
+
+        if dry_run or (atomic and errors):
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    committed = not dry_run and not (atomic and errors)
+    logger.info(f"Certificate import: {len(inserted)} valid, {len(errors)} rejected, "
+                f"{'committed' if committed else 'rolled back'}")
+    return {'inserted': inserted if committed else [], 'validated': len(inserted), 'errors': errors,
+            'committed': committed}
+
+
+def image_filenames(certificates, image_format):
+    """
+    One file name per certificate. Numbers that sanitize to the same name
+    (A/1 and A_1, or A1 and a1 on a case-insensitive filesystem) get -2,
+    -3, ... suffixes instead of overwriting each other.
+    """
+    names, taken = [], set()
+    for certificate in certificates:
+        stem = secure_filename(str(certificate['certificate_number'])) or 'certificate'
+        name, n = f"{stem}.{image_format}", 1
+        while name.lower() in taken:
+            n += 1
+            name = f"{stem}-{n}.{image_format}"
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def write_zip(target, certificates, images, image_format, report=None):
+    """Write images (and an optional report.json) to a ZIP path or file object"""
+    # PNG data is already deflated; SVG text compresses well
+    compression = zipfile.ZIP_DEFLATED if image_format == 'svg' else zipfile.ZIP_STORED
+    with zipfile.ZipFile(target, 'w', compression=compression) as archive:
+        for name, image in zip(image_filenames(certificates, image_format), images):
+            archive.writestr(name, image)
+        if report is not None:
+            archive.writestr('report.json', json.dumps(report, indent=2, default=str))
+
+
+def write_directory(directory, certificates, images, image_format):
+    os.makedirs(directory, exist_ok=True)
+    for name, image in zip(image_filenames(certificates, image_format), images):
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(image)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import certificates and render their QR codes')
+    parser.add_argument('file', help='CSV or JSON-lines file (format from the extension unless --input-format)')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'])
+    parser.add_argument('--db', help='certificates database (default: certificate_api.DB_PATH)')
+    parser.add_argument('--atomic', action='store_true', help='import nothing if any row is rejected')
+    parser.add_argument('--dry-run', action='store_true', help='validate only, never commit')
+    parser.add_argument('--zip', help='write the QR images to this ZIP file')
+    parser.add_argument('--out', help='write the QR images to this directory')
+    parser.add_argument('--format', default='png', choices=['png', 'svg'], help='QR image format')
+    parser.add_argument('--workers', type=int, help='QR render processes (default: QR_RENDER_WORKERS)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import certificate_api
+
+    if args.db:
+        certificate_api.use_database(args.db)
+    certificate_api.init_certificate_database()
+
+    fmt = args.input_format or ('jsonl' if args.file.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(args.file, encoding='utf-8-sig') as f:
+        records = parse_records(f.read(), fmt)
+
+    with certificate_api.db_pool.connection() as conn:
+        report = import_certificates(conn, records, atomic=args.atomic, dry_run=args.dry_run)
+    certificate_api.response_cache.invalidate('certificates')
+
+    for error in report['errors']:
+        print(f"row {error['row']} ({error['certificate_number']}): {error['message']}")
+    print(f"{len(records)} row(s): {report['validated']} valid, {len(report['errors'])} rejected, "
+          f"{len(report['inserted'])} imported")
+
+    if report['inserted'] and (args.zip or args.out):
+        images = certificate_api.qr_cache.render_many(report['inserted'], workers=args.workers,
+                                                      image_format=args.format)
+        if args.zip:
+            write_zip(args.zip, report['inserted'], images, args.format)
+            print(f"{len(images)} QR code(s) written to {args.zip}")
+        if args.out:
+            write_directory(args.out, report['inserted'], images, args.format)
+            print(f"{len(images)} QR code(s) written to {args.out}")
+
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+In-memory certificate index
+Every certificate held in a dict keyed by certificate number, so lookups are
+answered without a database round trip, plus a Bloom filter and a negative
+cache that turn unknown numbers away before any other work
+"""
+
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for writes made through other connections or by
+# other processes (0 checks on every lookup)
+CERTIFICATE_INDEX_CHECK_INTERVAL = float(os.getenv('CERTIFICATE_INDEX_CHECK_INTERVAL', 1.0))
+# Target false-positive rate of the Bloom filter over known certificate numbers
+CERTIFICATE_BLOOM_ERROR_RATE = float(os.getenv('CERTIFICATE_BLOOM_ERROR_RATE', 0.01))
+# Unknown numbers that got past the Bloom filter, remembered until the next reload
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv('NEGATIVE_CACHE_MAX_ENTRIES', 10000))
+
+
+class CertificateRecord:
+    """One certificate row; slots keep each record far smaller than a dict"""
+
+    __slots__ = (
+        'certificate_number', 'certificate_name', 'number_of_shares',
+        'owner_name', 'certificate_type', 'par_value', 'issue_date',
+        'status', 'authorized_shares', 'issued_shares'
+    )
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives: `x in bloom` is False only for
+    values never added. Sized for `capacity` values at `error_rate`.
+    """
+
+    def __init__(self, capacity, error_rate=CERTIFICATE_BLOOM_ERROR_RATE):
+        self.capacity = max(1, capacity)
+        self.bits = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def expected_error_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class CertificateIndex:
+    """
+    All certificates in memory, loaded on first use.
+
+    Writes made by this process are applied with refresh(numbers). Writes
+    from anywhere else (another worker, the import CLI, a manual UPDATE) are
+    noticed through PRAGMA data_version on a connection of the index's own,
+    checked at most every check_interval seconds, and trigger a full reload;
+    the table is small, so reloading beats tracking individual changes.
+
+    known_missing(number) answers "certainly not a certificate" from a
+    Bloom filter over every number, then from a bounded cache of numbers
+    that passed the filter but turned out not to exist (its false
+    positives). Both are rebuilt on reload, and refresh() adds new numbers
+    to the filter and drops them from the negative cache.
+    """
+
+    def __init__(self, path, check_interval=CERTIFICATE_INDEX_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+
+        self._records = None
+        self._conn = None
+        self._pid = None
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+        self._bloom = None
+        self._missing = OrderedDict()
+
+        self.lookups = 0
+        self.reloads = 0
+        self.refreshes = 0
+        self.bloom_rejections = 0
+        self.negative_hits = 0
+        self.false_positives = 0
+
+    def _connection(self):
+        # A connection inherited across fork() must not be used by the child
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _select(self, where='', params=()) -> dict:
+        cursor = self._connection().execute(
+            f"SELECT {', '.join(CertificateRecord.__slots__)} FROM certificates {where}", params)
+        return {row[0]: CertificateRecord(*row) for row in cursor}
+
+    def load(self):
+        """(Re)load every certificate"""
+        started = time.perf_counter()
+        with self._lock:
+            # Read the version first: a write landing between the two makes
+            # the next check reload again, never miss a change
+            version = self._connection().execute('PRAGMA data_version').fetchone()[0]
+            self._records = self._select()
+            self._version = version
+            self._rebuild_filter()
+            self._checked = time.monotonic()
+            self.reloads += 1
+        logger.info(f"Certificate index loaded {len(self._records)} certificate(s) "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _rebuild_filter(self):
+        # Room to grow, so numbers added before the next reload keep the rate
+        bloom = BloomFilter(max(1024, 2 * len(self._records)))
+        for number in self._records:
+            bloom.add(number)
+        self._bloom = bloom
+        self._missing = OrderedDict()
+
+    def _check(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            changed = self._connection().execute('PRAGMA data_version').fetchone()[0] != self._version
+        if changed:
+            self.load()
+
+    def refresh(self, certificate_numbers):
+        """Re-read the given certificates after this process wrote them"""
+        certificate_numbers = list(certificate_numbers)
+        if self._records is None or not certificate_numbers:
+            return
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(certificate_numbers), 500):
+                chunk = certificate_numbers[start:start + 500]
+                records = self._select(f"WHERE certificate_number IN ({', '.join('?' * len(chunk))})", chunk)
+                for number in chunk:
+                    if number in records:
+                        if number not in self._records:
+                            self._bloom.add(number)
+                            self._missing.pop(number, None)
+                        self._records[number] = records[number]
+                    else:
+                        self._records.pop(number, None)
+            if self._bloom.count > self._bloom.capacity:
+                self._rebuild_filter()
+            self.refreshes += 1
+
+    def _ensure_fresh(self):
+        if self._records is None:
+            self.load()
+        else:
+            self._check()
+
+    def version(self) -> int:
+        """
+        The data_version the loaded certificates reflect. It changes when a
+        write from another connection is picked up, so caches of lookups can
+        key on it and never outlive the index's own view.
+        """
+        self._ensure_fresh()
+        return self._version
+
+    def get(self, certificate_number):
+        """The certificate as a dict, or None if it doesn't exist"""
+        self._ensure_fresh()
+        self.lookups += 1
+        record = self._records.get(certificate_number)
+        if record is None:
+            self._remember_missing(certificate_number)
+            return None
+        return record.as_dict()
+
+    def _remember_missing(self, certificate_number):
+        if certificate_number not in self._bloom:
+            return
+        with self._lock:
+            # A reload may have added it since the lookup
+            if certificate_number in self._records:
+                return
+            self.false_positives += 1
+            self._missing[certificate_number] = True
+            self._missing.move_to_end(certificate_number)
+            while len(self._missing) > NEGATIVE_CACHE_MAX_ENTRIES:
+                self._missing.popitem(last=False)
+
+    def known_missing(self, certificate_number) -> bool:
+        """True if the number is certainly not a certificate (no false negatives)"""
+        self._ensure_fresh()
+        if certificate_number not in self._bloom:
+            self.bloom_rejections += 1
+            return True
+        if certificate_number in self._missing:
+            self.negative_hits += 1
+            return True
+        return False
+
+    def get_many(self, certificate_numbers) -> dict:
+        """Certificates by number (missing ones are absent)"""
+        certificates = {}
+        for number in certificate_numbers:
+            certificate = self.get(number)
+            if certificate is not None:
+                certificates[number] = certificate
+        return certificates
+
+    def stats(self) -> dict:
+        # Of the lookups for unknown numbers, the share the Bloom filter let
+        # through (a negative cache hit is a false positive caught later)
+        passed = self.false_positives + self.negative_hits
+        unknown = self.bloom_rejections + passed
+        return {
+            'certificates': len(self._records) if self._records is not None else 0,
+            'lookups': self.lookups,
+            'reloads': self.reloads,
+            'refreshes': self.refreshes,
+            'bloom_rejections': self.bloom_rejections,
+            'negative_cache_hits': self.negative_hits,
+            'negative_cache_entries': len(self._missing),
+            'false_positives': self.false_positives,
+            'false_positive_rate': round(passed / unknown, 4) if unknown else 0.0,
+            'expected_false_positive_rate': round(self._bloom.expected_error_rate(), 4) if self._bloom else 0.0
+        }
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Database connection pooling
+Bounded, thread-safe connection pools shared by the Flask backends
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))  # seconds idle
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when no healthy connection can be checked out of a pool"""
+
+
+class PoolMetrics:
+    """Checkout and wait-time counters for a pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.created = 0
+        self.reused = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+        self.in_use = 0
+
+    def record_checkout(self, waited, reused):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            if reused:
+                self.reused += 1
+            if waited > 0.001:
+                self.waits += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def record_release(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'connections_created': self.created,
+                'reused': self.reused,
+                'in_use': self.in_use,
+                'waits': self.waits,
+                'wait_time_avg_ms': round(1000 * self.wait_time_total / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_time_max_ms': round(1000 * self.wait_time_max, 3),
+                'timeouts': self.timeouts,
+                'health_check_failures': self.health_check_failures
+            }
+
+
+class _PooledSQLiteConnection:
+    __slots__ = ('conn', 'owner', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.owner = None
+        self.last_used = time.monotonic()
+
+
+class SQLitePool:
+    """
+    A bounded pool of SQLite connections with per-thread affinity.
+
+    A thread gets back the connection it used last whenever that connection is
+    idle, so steady-state requests reuse a warm connection (and its page cache
+    and prepared statements) instead of opening the file again. At most `size`
+    connections exist; when all are busy, callers wait up to `timeout` seconds.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL, on_connect=None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.on_connect = on_connect
+        self.metrics = PoolMetrics()
+
+        self._cond = threading.Condition()
+        self._all = []
+        self._idle = []
+        self._pid = os.getpid()
+
+    def _create(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        if self.on_connect:
+            self.on_connect(conn)
+        self.metrics.increment('created')
+        return _PooledSQLiteConnection(conn)
+
+    def _is_healthy(self, entry) -> bool:
+        if time.monotonic() - entry.last_used < self.health_check_interval:
+            return True
+        try:
+            entry.conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            self.metrics.increment('health_check_failures')
+            return False
+
+    def _reset_after_fork(self):
+        # Connections inherited from the parent must not be used by the child
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._all = []
+            self._idle = []
+            self.metrics = PoolMetrics()
+
+    def _checkout(self):
+        me = threading.get_ident()
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        with self._cond:
+            self._reset_after_fork()
+            while True:
+                entry = next((e for e in self._idle if e.owner == me), None)
+                reused = entry is not None
+                if entry is None and len(self._all) < self.size:
+                    entry = self._create()
+                    self._all.append(entry)
+                elif entry is None and self._idle:
+                    entry = self._idle[-1]
+                if entry is not None:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics.increment('timeouts')
+                    raise DatabaseUnavailable(f"Timed out waiting for a connection to {self.path}")
+                self._cond.wait(remaining)
+
+            if entry in self._idle:
+                self._idle.remove(entry)
+
+            if not self._is_healthy(entry):
+                self._all.remove(entry)
+                try:
+                    entry.conn.close()
+                except sqlite3.Error:
+                    pass
+                entry = self._create()
+                self._all.append(entry)
+                reused = False
+
+            entry.owner = me
+
+        self.metrics.record_checkout(time.monotonic() - started, reused)
+        return entry
+
+    def _release(self, entry):
+        if entry.conn.in_transaction:
+            entry.conn.rollback()
+        entry.last_used = time.monotonic()
+
+        with self._cond:
+            if entry in self._all:
+                self._idle.append(entry)
+                self._cond.notify()
+        self.metrics.record_release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with-block"""
+        entry = self._checkout()
+        try:
+            yield entry.conn
+        finally:
+            self._release(entry)
+
+    def close_all(self):
+        """Close idle connections and forget busy ones (used at shutdown)"""
+        with self._cond:
+            for entry in self._idle:
+                entry.conn.close()
+            self._all = []
+            self._idle = []
+
+    def stats(self) -> dict:
+        stats = self.metrics.snapshot()
+        with self._cond:
+            stats.update({'size': self.size, 'open': len(self._all), 'idle': len(self._idle)})
+        return stats
+
+
+class MySQLPool:
+    """
+    A bounded MySQL pool built on mysql.connector.pooling.
+
+    The underlying MySQLConnectionPool is created lazily (and again after a
+    fork), so importing the app doesn't require the database to be reachable.
+    A semaphore sized to the pool turns "pool exhausted" errors into a bounded
+    wait, and connections idle longer than the health-check interval are
+    pinged (and reconnected) before being handed out.
+    """
+
+    # mysql.connector caps pool_size at 32
+    MAX_SIZE = 32
+
+    def __init__(self, config, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL, name='teknoledg_pool'):
+        self.config = config
+        self.size = min(size, self.MAX_SIZE)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.name = name
+        self.metrics = PoolMetrics()
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._last_used = {}
+        self._pid = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                from mysql.connector import pooling
+
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name=f"{self.name}_{os.getpid()}",
+                    pool_size=self.size,
+                    pool_reset_session=True,
+                    **self.config
+                )
+                self._pid = os.getpid()
+                self._slots = threading.BoundedSemaphore(self.size)
+                self._last_used = {}
+                self.metrics.increment('created', self.size)
+            return self._pool
+
+    def _checkout(self):
+        import mysql.connector
+
+        started = time.monotonic()
+        try:
+            pool = self._get_pool()
+        except mysql.connector.Error as e:
+            raise DatabaseUnavailable(f"Database connection error: {e}")
+
+        if not self._slots.acquire(timeout=self.timeout):
+            self.metrics.increment('timeouts')
+            raise DatabaseUnavailable("Timed out waiting for a database connection")
+
+        try:
+            conn = pool.get_connection()
+            key = id(getattr(conn, '_cnx', conn))
+            last_used = self._last_used.get(key)
+            if last_used is not None and time.monotonic() - last_used > self.health_check_interval:
+                try:
+                    conn.ping(reconnect=True, attempts=2, delay=0)
+                except mysql.connector.Error:
+                    self.metrics.increment('health_check_failures')
+                    conn.close()
+                    raise
+        except mysql.connector.Error as e:
+            self._slots.release()
+            raise DatabaseUnavailable(f"Database connection error: {e}")
+
+        self.metrics.record_checkout(time.monotonic() - started, last_used is not None)
+        return conn, key
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with-block"""
+        conn, key = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._last_used[key] = time.monotonic()
+            try:
+                # Returns the connection to the pool (and rolls back anything uncommitted)
+                conn.close()
+            finally:
+                self._slots.release()
+                self.metrics.record_release()
+
+    def stats(self) -> dict:
+        stats = self.metrics.snapshot()
+        stats.update({'size': self.size})
+        return stats
@@ -5,42 +5,218 @@ Implements AES encryption for certificate data
 """
 
 import base64
+import hashlib
+import hmac
 import json
-from cryptography.fernet import Fernet
+import logging
+from cryptography.fernet import Fernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import os
+import re
 import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Key derivation parameters
+KDF_SALT = b'teknoledg_cert_salt_2024'  # fixed for consistency (in production, store salt separately)
+KDF_ITERATIONS = 100000
+
+# QR payload formats. SEC_CERT: is the original base64 of a Fernet token of
+# nested JSON; SC2:[KID:] carries the certificate values in COMPACT_FIELDS
+# order, encrypted once and base32-encoded, which QR codes store in
+# alphanumeric mode; SCR:[KID:] is only the certificate number plus a
+# truncated HMAC, and the record is read from the database when it is
+# verified. KID names the key that produced the payload.
+LEGACY_PREFIX = 'SEC_CERT:'
+COMPACT_PREFIX = 'SC2:'
+REFERENCE_PREFIX = 'SCR:'
+QR_PAYLOAD_FORMATS = ('compact', 'reference', 'legacy')
+# Field order of SC2 payloads; never reorder, only introduce a new prefix
+COMPACT_FIELDS = (
+    'certificate_number', 'certificate_name', 'number_of_shares',
+    'owner_name', 'certificate_type', 'par_value', 'issue_date',
+    'status', 'authorized_shares', 'issued_shares'
+)
+REFERENCE_MAC_BYTES = 10
+# QR payloads older than this are rejected
+QR_PAYLOAD_MAX_AGE = 31536000  # 1 year in seconds
+
+# Key rotation: new payloads are made with the current key and tagged with
+# CERTIFICATE_KEY_ID; retired keys stay usable for verification, listed as
+# "id:password" pairs separated by commas (ids are 1-8 characters, 0-9 A-Z,
+# so they stay in the QR alphanumeric set)
+CERTIFICATE_KEY_ID = os.getenv('CERTIFICATE_KEY_ID', '1')
+CERTIFICATE_PREVIOUS_KEYS = os.getenv('CERTIFICATE_PREVIOUS_KEYS', '')
+KEY_ID_PATTERN = re.compile(r'[0-9A-Z]{1,8}')
+
+# Optional file that stores the derived key, so a new process can skip the
+# PBKDF2 run. It holds the key itself: keep it as private as the password
+# (it is created 0600 and ignored if group or others can read it).
+CERTIFICATE_KEYFILE = os.getenv('CERTIFICATE_KEYFILE', '')
+
+_derived_keys = {}
+_derive_lock = threading.Lock()
+
+def _b32encode(data: bytes) -> str:
+    return base64.b32encode(data).decode().rstrip('=')
+
+def _b32decode(text: str) -> bytes:
+    return base64.b32decode(text + '=' * (-len(text) % 8))
+
+def parse_previous_keys(spec: str) -> dict:
+    """
+    Parse "id:password,id:password" into {id: password}
+    """
+    keys = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        key_id, _, password = entry.partition(':')
+        if not KEY_ID_PATTERN.fullmatch(key_id) or not password:
+            raise ValueError(f"CERTIFICATE_PREVIOUS_KEYS entries must be id:password (id 1-8 of 0-9 A-Z), got {key_id!r}")
+        keys[key_id] = password
+    return keys
+
+def _keyfile_verifier(key: bytes, password: str) -> str:
+    return hmac.new(key, password.encode(), hashlib.sha256).hexdigest()
+
+def _read_keyfile(path, password, salt, iterations):
+    """Return the key stored in `path` if it was derived from these inputs"""
+    try:
+        if os.stat(path).st_mode & 0o077:
+            logger.warning(f"Ignoring keyfile {path}: it is readable by group or others (chmod 600 it)")
+            return None
+        with open(path) as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable keyfile {path}: {e}")
+        return None
+    
+    key = stored.get('key', '').encode()
+    if stored.get('kdf') != 'pbkdf2-sha256' or stored.get('iterations') != iterations \
+            or stored.get('salt') != base64.b64encode(salt).decode() \
+            or not hmac.compare_digest(stored.get('verifier', ''), _keyfile_verifier(key, password)):
+        logger.warning(f"Keyfile {path} was derived from a different password or parameters; re-deriving")
+        return None
+    return key
+
+def _write_keyfile(path, key, password, salt, iterations):
+    record = {
+        'kdf': 'pbkdf2-sha256',
+        'iterations': iterations,
+        'salt': base64.b64encode(salt).decode(),
+        'verifier': _keyfile_verifier(key, password),
+        'key': key.decode()
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not write keyfile {path}: {e}")
+
+def derive_key(password: str, salt: bytes = KDF_SALT, iterations: int = KDF_ITERATIONS,
+               keyfile: str = CERTIFICATE_KEYFILE) -> bytes:
+    """
+    Derive a Fernet key from a password with PBKDF2-SHA256.
+
+    Results are cached per (password, salt, iterations) for the life of the
+    process, and read from / written to `keyfile` when one is configured.
+    """
+    cache_key = hashlib.sha256(b'\0'.join([password.encode(), salt, str(iterations).encode()])).digest()
+    with _derive_lock:
+        key = _derived_keys.get(cache_key)
+        if key is not None:
+            return key
+        
+        key = _read_keyfile(keyfile, password, salt, iterations) if keyfile else None
+        if key is None:
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=salt,
+                iterations=iterations,
+            )
+            key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+            if keyfile:
+                _write_keyfile(keyfile, key, password, salt, iterations)
+        
+        _derived_keys[cache_key] = key
+        return key
 
 class CertificateEncryption:
-    def __init__(self, password=None):
+    def __init__(self, password=None, keyfile=CERTIFICATE_KEYFILE, key_id=None, previous_keys=None):
         """
-        Initialize encryption with password or generate new key
+        Initialize encryption with password or generate new key.
+        A password-based key is derived on first use, not here.
+        
+        key_id tags the payloads this key makes; previous_keys maps the ids
+        of retired keys to their passwords, which are only used to decrypt
+        (each is derived the first time a payload needs it).
         """
+        if key_id is not None and not KEY_ID_PATTERN.fullmatch(key_id):
+            raise ValueError(f"Key id must be 1-8 characters of 0-9 A-Z, got {key_id!r}")
+        
+        self._password = password
+        self._keyfile = keyfile
+        self._cipher = None
+        self.key_id = key_id
+        self._previous = {
+            previous_id: CertificateEncryption(previous_password, keyfile='')
+            for previous_id, previous_password in (previous_keys or {}).items()
+            if previous_id != key_id
+        }
+        
         if password:
-            self.key = self._derive_key(password)
+            self._key = None
         else:
             # Generate a new key (for development)
-            self.key = Fernet.generate_key()
-        
-        self.cipher = Fernet(self.key)
+            self._key = Fernet.generate_key()
+    
+    @property
+    def key(self) -> bytes:
+        if self._key is None:
+            self._key = self._derive_key(self._password)
+        return self._key
+    
+    @property
+    def cipher(self) -> Fernet:
+        if self._cipher is None:
+            self._cipher = Fernet(self.key)
+        return self._cipher
+    
+    def _keyring(self, key_id=None) -> list:
+        """
+        Keys that may have made a payload: just the one named by key_id, or
+        (for payloads without an id) the current key and then every retired one
+        """
+        if key_id is None:
+            return [self] + list(self._previous.values())
+        if key_id == self.key_id:
+            return [self]
+        if key_id in self._previous:
+            return [self._previous[key_id]]
+        raise Exception(f"Unknown key id: {key_id}")
+    
+    def _decrypt_token(self, token: bytes, key_id=None) -> tuple:
+        """Decrypt a Fernet token; returns (plaintext, timestamp, key that decrypted it)"""
+        for keyholder in self._keyring(key_id):
+            try:
+                return keyholder.cipher.decrypt(token), keyholder.cipher.extract_timestamp(token), keyholder
+            except InvalidToken:
+                continue
+        raise InvalidToken()
     
     def _derive_key(self, password: str) -> bytes:
         """
         Derive encryption key from password using PBKDF2
         """
-        # Use a fixed salt for consistency (in production, store salt separately)
-        salt = b'teknoledg_cert_salt_2024'
-        
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        
-        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-        return key
+        return derive_key(password, keyfile=self._keyfile)
     
     def encrypt_certificate_data(self, certificate_data: dict) -> str:
         """
@@ -69,8 +245,8 @@ class CertificateEncryption:
             # Decode from base64
             encrypted_bytes = base64.urlsafe_b64decode(encrypted_data.encode())
             
-            # Decrypt the data
-            decrypted_data = self.cipher.decrypt(encrypted_bytes)
+            # Decrypt the data (these payloads name no key, so try each)
+            decrypted_data, _, _ = self._decrypt_token(encrypted_bytes)
             
             # Parse JSON
             certificate_data = json.loads(decrypted_data.decode())
@@ -88,7 +264,7 @@ class CertificateEncryption:
         secure_data = {
             'cert_number': certificate_number,
             'data': certificate_data,
-            'timestamp': int(os.time()),
+            'timestamp': int(time.time()),
             'nonce': secrets.token_hex(16)
         }
         
@@ -113,21 +289,88 @@ class CertificateEncryption:
         
         return decrypted_data
     
-    def verify_certificate_integrity(self, decrypted_data: dict, expected_cert_number: str) -> bool:
+    def generate_compact_qr_data(self, certificate_data: dict) -> str:
+        """
+        Generate a compact QR payload: the certificate values without field
+        names, in one Fernet token (which carries its own timestamp and IV)
+        """
+        values = [certificate_data.get(field) for field in COMPACT_FIELDS]
+        token = self.cipher.encrypt(json.dumps(values, separators=(',', ':')).encode())
+        return self._compact_qr_data(token)
+    
+    def _key_header(self) -> str:
+        return f"{self.key_id}:" if self.key_id else ''
+    
+    def _compact_qr_data(self, token: bytes) -> str:
+        return COMPACT_PREFIX + self._key_header() + _b32encode(base64.urlsafe_b64decode(token))
+    
+    def _reference_mac(self, certificate_number: str) -> str:
+        mac = hmac.new(self.key, b'certificate-reference:' + certificate_number.encode(), hashlib.sha256)
+        return _b32encode(mac.digest()[:REFERENCE_MAC_BYTES])
+    
+    def generate_reference_qr_data(self, certificate_number: str) -> str:
+        """
+        Generate a signed reference: the certificate number and its MAC
+        """
+        return f"{REFERENCE_PREFIX}{self._key_header()}{self._reference_mac(certificate_number)}:{certificate_number}"
+    
+    @staticmethod
+    def _split_compact(qr_data: str) -> tuple:
+        """SC2:[KID:]DATA -> (key id or None, token)"""
+        key_id, _, data = qr_data[len(COMPACT_PREFIX):].rpartition(':')
+        return key_id or None, base64.urlsafe_b64encode(_b32decode(data))
+    
+    @staticmethod
+    def _split_reference(qr_data: str) -> tuple:
+        """SCR:[KID:]MAC:NUMBER -> (key id or None, mac, certificate number)"""
+        first, _, rest = qr_data[len(REFERENCE_PREFIX):].partition(':')
+        # A MAC is longer than any key id
+        if len(first) == len(_b32encode(bytes(REFERENCE_MAC_BYTES))):
+            return None, first, rest
+        mac, _, certificate_number = rest.partition(':')
+        return first, mac, certificate_number
+    
+    def parse_qr_data(self, qr_data: str) -> dict:
+        """
+        Parse any supported QR payload into {'cert_number', 'data', 'timestamp'};
+        'data' is None for a reference, whose record lives in the database
+        """
+        if qr_data.startswith(COMPACT_PREFIX):
+            try:
+                key_id, token = self._split_compact(qr_data)
+                plaintext, timestamp, _ = self._decrypt_token(token, key_id)
+                values = json.loads(plaintext.decode())
+            except Exception as e:
+                raise Exception(f"Decryption failed: {str(e)}")
+            data = dict(zip(COMPACT_FIELDS, values))
+            return {'cert_number': data['certificate_number'], 'data': data, 'timestamp': timestamp}
+        
+        if qr_data.startswith(REFERENCE_PREFIX):
+            key_id, mac, certificate_number = self._split_reference(qr_data)
+            if not certificate_number or not any(
+                    hmac.compare_digest(mac, keyholder._reference_mac(certificate_number))
+                    for keyholder in self._keyring(key_id)):
+                raise Exception("Invalid QR code signature")
+            return {'cert_number': certificate_number, 'data': None, 'timestamp': None}
+        
+        return self.parse_secure_qr_data(qr_data)
+    
+    def verify_certificate_integrity(self, decrypted_data: dict, expected_cert_number: str = None) -> bool:
         """
         Verify certificate integrity and authenticity
         """
         try:
-            # Check if certificate number matches
-            if decrypted_data.get('cert_number') != expected_cert_number:
+            # Check if certificate number matches (when the caller expects one)
+            if expected_cert_number is not None and decrypted_data.get('cert_number') != expected_cert_number:
                 return False
             
-            # Check timestamp (optional - certificates shouldn't be too old)
+            # Check timestamp (optional - certificates shouldn't be too old);
+            # a signed reference has none, its record is checked live instead
             timestamp = decrypted_data.get('timestamp', 0)
-            current_time = int(os.time())
+            current_time = int(time.time())
             
             # Allow certificates up to 1 year old
-            if current_time - timestamp > 31536000:  # 1 year in seconds
+            if timestamp is not None and current_time - timestamp > QR_PAYLOAD_MAX_AGE:
                 return False
             
             return True
@@ -138,7 +381,8 @@ class CertificateEncryption:
 # Global encryption instance
 # In production, use a secure password from environment variables
 ENCRYPTION_PASSWORD = os.getenv('CERTIFICATE_ENCRYPTION_PASSWORD', 'teknoledg_secure_2024')
-encryption = CertificateEncryption(ENCRYPTION_PASSWORD)
+encryption = CertificateEncryption(ENCRYPTION_PASSWORD, key_id=CERTIFICATE_KEY_ID,
+                                  previous_keys=parse_previous_keys(CERTIFICATE_PREVIOUS_KEYS))
 
 def encrypt_certificate_for_qr(certificate_data: dict) -> str:
     """
@@ -149,23 +393,57 @@ def encrypt_certificate_for_qr(certificate_data: dict) -> str:
         certificate_data
     )
 
+def key_fingerprint() -> str:
+    """
+    Short, non-reversible identifier of the current encryption key (and its id)
+    """
+    return hashlib.sha256(f"{encryption.key_id or ''}:".encode() + encryption.key).hexdigest()[:16]
+
+def encode_qr_payload(certificate_data: dict, payload_format: str = 'compact') -> str:
+    """
+    QR code contents for a certificate in one of QR_PAYLOAD_FORMATS
+    """
+    if payload_format == 'compact':
+        return encryption.generate_compact_qr_data(certificate_data)
+    if payload_format == 'reference':
+        return encryption.generate_reference_qr_data(certificate_data['certificate_number'])
+    if payload_format == 'legacy':
+        return encrypt_certificate_for_qr(certificate_data)
+    raise ValueError(f"Unknown QR payload format: {payload_format}")
+
 def decrypt_qr_certificate(qr_data: str) -> dict:
     """
-    Decrypt certificate data from QR code
+    Decrypt certificate data from QR code (any supported payload format)
     """
-    return encryption.parse_secure_qr_data(qr_data)
+    return encryption.parse_qr_data(qr_data)
 
-def verify_qr_certificate(qr_data: str, expected_cert_number: str) -> tuple:
+def check_qr_payload(qr_data: str, expected_cert_number: str = None) -> dict:
     """
-    Verify QR code certificate and return (is_valid, certificate_data)
+    Decrypt and check a QR payload; returns the parsed payload, or None if it
+    is corrupted, forged, expired or for another certificate
     """
     try:
         decrypted_data = decrypt_qr_certificate(qr_data)
-        
-        if encryption.verify_certificate_integrity(decrypted_data, expected_cert_number):
-            return True, decrypted_data.get('data', {})
-        else:
+    except Exception:
+        return None
+    if not encryption.verify_certificate_integrity(decrypted_data, expected_cert_number):
+        return None
+    return decrypted_data
+
+def verify_qr_certificate(qr_data: str, expected_cert_number: str = None, lookup=None) -> tuple:
+    """
+    Verify QR code certificate and return (is_valid, certificate_data).
+    A signed reference carries no record; lookup(certificate_number) supplies it.
+    """
+    try:
+        decrypted_data = check_qr_payload(qr_data, expected_cert_number)
+        if decrypted_data is None:
             return False, None
+        
+        certificate_data = decrypted_data.get('data', {})
+        if certificate_data is None:
+            certificate_data = lookup(decrypted_data['cert_number']) if lookup else None
+        return (True, certificate_data) if certificate_data is not None else (False, None)
             
     except Exception as e:
         return False, None
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Streaming data exports
+Chunked CSV and JSON-lines responses with optional on-the-fly gzip, so an
+export uses the same memory for ten rows or ten million
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import zlib
+from contextlib import ExitStack
+
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+# Export configuration
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 1000))  # rows per fetchmany()
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', 6))
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+
+def iter_chunks(cursor, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of rows from an executed cursor, chunk_size at a time"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def csv_lines(chunks, header):
+    """Encode row chunks as CSV text, one string per chunk, quoting as needed"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def jsonl_lines(chunks, fields):
+    """Encode row chunks as JSON lines, one string per chunk"""
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(fields, row)), default=str) + '\n' for row in rows)
+
+
+def gzip_stream(chunks, level=EXPORT_GZIP_LEVEL):
+    """Compress an iterable of bytes into a gzip stream (wbits=31 writes the gzip header)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(connection, query, params, fields, header, filename, fmt='csv', gzip=False,
+                  cleanup=None):
+    """
+    Build a streaming Response for `query`.
+
+    `connection` is a pool's connection() context manager. It is entered
+    here, so checkout and query errors are raised to the caller before any
+    bytes are sent, and it is released when the response is closed (after
+    the last chunk, or when the client disconnects). `cleanup(conn)` runs
+    before the cursor is closed, e.g. to drain an unread result set.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    mimetype, extension = FORMATS[fmt]
+
+    stack = ExitStack()
+    try:
+        conn = stack.enter_context(connection)
+        cursor = conn.cursor()
+        stack.callback(cursor.close)
+        if cleanup:
+            stack.callback(cleanup, conn)
+        cursor.execute(query, params)
+    except Exception:
+        stack.close()
+        raise
+
+    chunks = iter_chunks(cursor)
+    if fmt == 'csv':
+        lines = csv_lines(chunks, header)
+    else:
+        lines = jsonl_lines(chunks, fields)
+    body = (text.encode('utf-8') for text in lines)
+
+    filename = f"{filename}.{extension}"
+    if gzip:
+        body = gzip_stream(body)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+
+    response = Response(body, mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    response.call_on_close(stack.close)
+    return response
+
+
+async def export_body_async(cursor, fields, header, fmt='csv', gzip=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    stream_export()'s body for an executed async cursor (aiosqlite), as an
+    async generator of bytes for an ASGI response. The caller closes the
+    cursor when the response ends.
+    """
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(header)
+
+    while True:
+        rows = await cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        if fmt == 'csv':
+            writer.writerows(rows)
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            text = next(jsonl_lines([rows], fields))
+        data = text.encode('utf-8')
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    tail = buffer.getvalue().encode('utf-8')  # the CSV header of an empty export
+    if compressor:
+        tail = compressor.compress(tail) + compressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Gunicorn configuration for the production backends
+Run from this directory (gunicorn picks this file up automatically):
+
+    gunicorn app:app                # registrations (SQLite)
+    gunicorn app_existing_db:app    # registrations (MySQL)
+    gunicorn certificate_api:app    # certificate verification
+
+The app is imported once in the master (preload_app), which runs its
+init_app() (database migrations, key derivation, static assets) before
+forking; each worker then starts its own background threads. Every setting
+can be overridden with the environment variables below or on the command line.
+"""
+
+import importlib
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+
+# Processes for CPU-bound work (QR rendering, crypto), threads to overlap I/O
+# (SQLite, MySQL, SMTP). WEB_CONCURRENCY is what Heroku/Render/Railway set.
+CPU_COUNT = multiprocessing.cpu_count()
+workers = int(os.getenv('WEB_CONCURRENCY', min(2 * CPU_COUNT + 1, 8)))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Admission control. A gthread worker runs at most `threads` requests at a
+# time, so the queue in front of them is bounded here: each worker holds at
+# most worker_connections connections (running, waiting for a thread or idle
+# keep-alive) and stops accepting beyond that, leaving new connections in a
+# listen backlog of `backlog`; past that the kernel turns them away
+# (immediately, with net.ipv4.tcp_abort_on_overflow=1). Under uvicorn workers
+# (app_async) only the backlog applies, and the app's ConcurrencyGate
+# (rate_limit.py, MAX_CONCURRENT_REQUESTS) sheds with 503s.
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', threads * 2))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 64))
+
+preload_app = True
+
+# Keep-alive must outlast the request gaps of a browser loading a page and
+# its assets; behind a load balancer, set it above the balancer's idle timeout
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+# On SIGHUP/SIGTERM, workers finish their in-flight requests for up to this long
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Recycle workers after this many requests (0 = never), staggered by the jitter
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+# Access log to stdout by default; set GUNICORN_ACCESS_LOG= (empty) to turn it off
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def _app_module(server):
+    return importlib.import_module(server.app.app_uri.split(':')[0])
+
+
+def when_ready(server):
+    """In the master, after the preload and before the first fork"""
+    module = _app_module(server)
+    if hasattr(module, 'init_app'):
+        module.init_app()
+    # server.cfg, not this file's globals: -w/--threads on the command line win
+    server.log.info(f"{module.__name__} ready: {server.cfg.workers} worker(s) x {server.cfg.threads} thread(s)")
+
+
+def post_fork(server, worker):
+    """In each new worker: threads don't survive fork(), so start them here"""
+    module = _app_module(server)
+    if hasattr(module, 'start_workers'):
+        module.start_workers()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Schema migrations
+Versioned schema changes for the registration and certificate databases,
+applied at startup or from the command line
+
+Usage:
+    python migrations.py registrations --db registrations.db
+    python migrations.py certificates --db certificates.db --status
+    python migrations.py registrations_mysql --check-plans
+"""
+
+import argparse
+import logging
+import re
+import sqlite3
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def mysql_create_index(name, table, columns):
+    """MySQL has no CREATE INDEX IF NOT EXISTS, so check information_schema first"""
+    def step(conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """, (table, name))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"CREATE INDEX {name} ON {table}({columns})")
+        cursor.close()
+    return step
+
+
+# Each schema is an ordered list of (version, description, steps). A step is
+# either an SQL string or a callable taking the connection. Never edit a
+# migration that has shipped; add a new version instead.
+MIGRATIONS = {
+    'registrations': [
+        (1, 'create registrations table', [
+            '''
+            CREATE TABLE IF NOT EXISTS registrations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT NOT NULL UNIQUE,
+                name TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                ip_address TEXT,
+                user_agent TEXT
+            )
+            ''',
+        ]),
+        (2, 'index registrations by timestamp', [
+            # id is the rowid, so this index also orders ties by id
+            'CREATE INDEX IF NOT EXISTS idx_registrations_timestamp ON registrations(timestamp)',
+        ]),
+        (3, 'hourly registration counters maintained by triggers', [
+            '''
+            CREATE TABLE IF NOT EXISTS registration_stats_hourly (
+                hour TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS registration_stats_totals (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS registrations_stats_insert AFTER INSERT ON registrations
+            BEGIN
+                INSERT INTO registration_stats_hourly (hour, count)
+                VALUES (strftime('%Y-%m-%d %H:00:00', NEW.timestamp), 1)
+                ON CONFLICT(hour) DO UPDATE SET count = count + 1;
+                UPDATE registration_stats_totals SET value = value + 1 WHERE name = 'registrations';
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS registrations_stats_delete AFTER DELETE ON registrations
+            BEGIN
+                UPDATE registration_stats_hourly SET count = count - 1
+                WHERE hour = strftime('%Y-%m-%d %H:00:00', OLD.timestamp);
+                UPDATE registration_stats_totals SET value = value - 1 WHERE name = 'registrations';
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS registrations_stats_update AFTER UPDATE OF timestamp ON registrations
+            BEGIN
+                UPDATE registration_stats_hourly SET count = count - 1
+                WHERE hour = strftime('%Y-%m-%d %H:00:00', OLD.timestamp);
+                INSERT INTO registration_stats_hourly (hour, count)
+                VALUES (strftime('%Y-%m-%d %H:00:00', NEW.timestamp), 1)
+                ON CONFLICT(hour) DO UPDATE SET count = count + 1;
+            END
+            ''',
+            # Backfill; the migration runs under BEGIN IMMEDIATE, so no insert
+            # can slip in between the snapshot and the triggers
+            '''
+            INSERT OR REPLACE INTO registration_stats_hourly (hour, count)
+            SELECT strftime('%Y-%m-%d %H:00:00', timestamp), COUNT(*)
+            FROM registrations GROUP BY 1
+            ''',
+            '''
+            INSERT OR REPLACE INTO registration_stats_totals (name, value)
+            SELECT 'registrations', COUNT(*) FROM registrations
+            ''',
+        ]),
+    ],
+    'certificates': [
+        (1, 'create certificates table', [
+            '''
+            CREATE TABLE IF NOT EXISTS certificates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                certificate_number TEXT NOT NULL UNIQUE,
+                certificate_name TEXT NOT NULL,
+                number_of_shares INTEGER NOT NULL,
+                owner_name TEXT NOT NULL,
+                certificate_type TEXT NOT NULL,
+                par_value TEXT NOT NULL,
+                issue_date DATE NOT NULL,
+                status TEXT DEFAULT 'valid',
+                authorized_shares INTEGER NOT NULL,
+                issued_shares INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+        ]),
+        (2, 'index certificates by status and owner', [
+            'CREATE INDEX IF NOT EXISTS idx_certificates_status ON certificates(status)',
+            'CREATE INDEX IF NOT EXISTS idx_certificates_owner_name ON certificates(owner_name)',
+        ]),
+        (3, 'index certificate list filters in keyset order', [
+            # Equality filter then certificate_number, so a filtered page is a
+            # single range scan already in list order
+            'CREATE INDEX IF NOT EXISTS idx_certificates_status_number ON certificates(status, certificate_number)',
+            'CREATE INDEX IF NOT EXISTS idx_certificates_owner_number ON certificates(owner_name, certificate_number)',
+            'CREATE INDEX IF NOT EXISTS idx_certificates_type_number '
+            'ON certificates(certificate_type, certificate_number)',
+            'CREATE INDEX IF NOT EXISTS idx_certificates_issue_date ON certificates(issue_date)',
+            'DROP INDEX IF EXISTS idx_certificates_status',
+            'DROP INDEX IF EXISTS idx_certificates_owner_name',
+        ]),
+        (4, 'index issue date ranges in listing order', [
+            # A date-range listing is ordered by (issue_date, certificate_number);
+            # this index replaces the issue_date one, which left that order to a sort
+            'CREATE INDEX IF NOT EXISTS idx_certificates_issue_date_number '
+            'ON certificates(issue_date, certificate_number)',
+            'DROP INDEX IF EXISTS idx_certificates_issue_date',
+        ]),
+    ],
+    'registrations_mysql': [
+        (1, 'create registrations table', [
+            '''
+            CREATE TABLE IF NOT EXISTS registrations (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                email VARCHAR(255) NOT NULL UNIQUE,
+                name VARCHAR(255),
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                ip_address VARCHAR(45),
+                user_agent TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+        ]),
+        (2, 'index registrations by timestamp', [
+            # The UNIQUE constraint already indexes email; InnoDB appends the
+            # primary key, so this index also orders ties by id
+            mysql_create_index('idx_timestamp', 'registrations', 'timestamp'),
+        ]),
+        (3, 'hourly registration counters maintained by triggers', [
+            '''
+            CREATE TABLE IF NOT EXISTS registration_stats_hourly (
+                hour DATETIME PRIMARY KEY,
+                count INT NOT NULL DEFAULT 0
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS registration_stats_totals (
+                name VARCHAR(64) PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0
+            )
+            ''',
+            # Triggers first, then the backfill replaces every bucket, so a
+            # registration arriving mid-migration is at worst counted twice
+            # in its hour; `registration_stats.py check` will report it
+            'DROP TRIGGER IF EXISTS registrations_stats_insert',
+            '''
+            CREATE TRIGGER registrations_stats_insert AFTER INSERT ON registrations
+            FOR EACH ROW BEGIN
+                INSERT INTO registration_stats_hourly (hour, count)
+                VALUES (DATE_FORMAT(NEW.timestamp, '%Y-%m-%d %H:00:00'), 1)
+                ON DUPLICATE KEY UPDATE count = count + 1;
+                UPDATE registration_stats_totals SET value = value + 1 WHERE name = 'registrations';
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS registrations_stats_delete',
+            '''
+            CREATE TRIGGER registrations_stats_delete AFTER DELETE ON registrations
+            FOR EACH ROW BEGIN
+                UPDATE registration_stats_hourly SET count = count - 1
+                WHERE hour = DATE_FORMAT(OLD.timestamp, '%Y-%m-%d %H:00:00');
+                UPDATE registration_stats_totals SET value = value - 1 WHERE name = 'registrations';
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS registrations_stats_update',
+            '''
+            CREATE TRIGGER registrations_stats_update AFTER UPDATE ON registrations
+            FOR EACH ROW BEGIN
+                IF NOT (OLD.timestamp <=> NEW.timestamp) THEN
+                    UPDATE registration_stats_hourly SET count = count - 1
+                    WHERE hour = DATE_FORMAT(OLD.timestamp, '%Y-%m-%d %H:00:00');
+                    INSERT INTO registration_stats_hourly (hour, count)
+                    VALUES (DATE_FORMAT(NEW.timestamp, '%Y-%m-%d %H:00:00'), 1)
+                    ON DUPLICATE KEY UPDATE count = count + 1;
+                END IF;
+            END
+            ''',
+            '''
+            REPLACE INTO registration_stats_hourly (hour, count)
+            SELECT DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), COUNT(*)
+            FROM registrations GROUP BY 1
+            ''',
+            '''
+            REPLACE INTO registration_stats_totals (name, value)
+            SELECT 'registrations', COUNT(*) FROM registrations
+            ''',
+        ]),
+    ],
+}
+
+DIALECTS = {
+    'registrations': 'sqlite',
+    'certificates': 'sqlite',
+    'registrations_mysql': 'mysql',
+}
+
+# Queries on the request path, by schema. check_query_plans() fails if any
+# of them reads a whole table or sorts without an index.
+HOT_QUERIES = {
+    'registrations': [
+        ('stats: whole hours',
+         'SELECT COALESCE(SUM(count), 0) FROM registration_stats_hourly WHERE hour >= ?',
+         ('2024-01-01 01:00:00',)),
+        ('stats: boundary hour',
+         'SELECT COUNT(*) FROM registrations WHERE timestamp > ? AND timestamp < ?',
+         ('2024-01-01 00:30:00', '2024-01-01 01:00:00')),
+        ('dashboard: first page',
+         'SELECT id, email, name, timestamp, ip_address, user_agent FROM registrations '
+         'ORDER BY timestamp DESC, id DESC LIMIT ?', (21,)),
+        ('dashboard: older page',
+         'SELECT id, email, name, timestamp, ip_address, user_agent FROM registrations '
+         'WHERE (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?',
+         ('2024-01-01 00:00:00', 1, 21)),
+        ('dashboard: newer page',
+         'SELECT id, email, name, timestamp, ip_address, user_agent FROM registrations '
+         'WHERE (timestamp, id) > (?, ?) ORDER BY timestamp ASC, id ASC LIMIT ?',
+         ('2024-01-01 00:00:00', 1, 21)),
+        ('register: duplicate check',
+         'SELECT email FROM registrations WHERE email IN (?)', ('a@example.com',)),
+    ],
+    'certificates': [
+        ('verify: lookup by number',
+         'SELECT certificate_number FROM certificates WHERE certificate_number = ?', ('000001',)),
+        ('list: first page',
+         'SELECT certificate_number, status FROM certificates ORDER BY certificate_number LIMIT ?', (101,)),
+        ('list: next page',
+         'SELECT certificate_number, status FROM certificates WHERE certificate_number > ? '
+         'ORDER BY certificate_number LIMIT ?', ('000001', 101)),
+        ('list: by status',
+         'SELECT certificate_number, status FROM certificates WHERE status = ? AND certificate_number > ? '
+         'ORDER BY certificate_number LIMIT ?', ('valid', '000001', 101)),
+        ('list: by owner',
+         'SELECT certificate_number, status FROM certificates WHERE owner_name = ? AND certificate_number > ? '
+         'ORDER BY certificate_number LIMIT ?', ('Tim McGuckin', '000001', 101)),
+        ('list: by type',
+         'SELECT certificate_number, status FROM certificates WHERE certificate_type = ? '
+         'AND certificate_number > ? ORDER BY certificate_number LIMIT ?', ('Common Stock', '000001', 101)),
+        ('list: by issue date',
+         'SELECT issue_date, certificate_number, status FROM certificates WHERE issue_date >= ? '
+         'AND issue_date <= ? ORDER BY issue_date, certificate_number LIMIT ?', ('2024-01-01', '2024-12-31', 101)),
+        ('list: by issue date, next page',
+         'SELECT issue_date, certificate_number, status FROM certificates WHERE issue_date >= ? '
+         'AND issue_date <= ? AND issue_date >= ? AND (issue_date, certificate_number) > (?, ?) '
+         'ORDER BY issue_date, certificate_number LIMIT ?',
+         ('2024-01-01', '2024-12-31', '2024-03-01', '2024-03-01', '000001', 101)),
+    ],
+    'registrations_mysql': [
+        ('stats: whole hours',
+         'SELECT COALESCE(SUM(count), 0) FROM registration_stats_hourly WHERE hour >= %s',
+         ('2024-01-01 01:00:00',)),
+        ('stats: boundary hour',
+         'SELECT COUNT(*) FROM registrations WHERE timestamp >= %s AND timestamp < %s',
+         ('2024-01-01 00:30:00', '2024-01-01 01:00:00')),
+        ('dashboard: first page',
+         'SELECT id, email, name, timestamp, ip_address FROM registrations '
+         'ORDER BY timestamp DESC, id DESC LIMIT %s', (21,)),
+        ('dashboard: older page',
+         'SELECT id, email, name, timestamp, ip_address FROM registrations '
+         'WHERE (timestamp, id) < (%s, %s) ORDER BY timestamp DESC, id DESC LIMIT %s',
+         ('2024-01-01 00:00:00', 1, 21)),
+        ('register: duplicate check',
+         'SELECT id FROM registrations WHERE email = %s', ('a@example.com',)),
+    ],
+}
+
+
+def _ensure_version_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def applied_versions(conn) -> set:
+    cursor = conn.cursor()
+    _ensure_version_table(cursor)
+    cursor.execute('SELECT version FROM schema_migrations')
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def _run_step(conn, cursor, step):
+    if callable(step):
+        step(conn)
+    else:
+        cursor.execute(step)
+
+
+def _migrate_sqlite(conn, migrations):
+    applied = []
+    for version, description, steps in migrations:
+        # BEGIN IMMEDIATE serializes concurrent migrators (e.g. several workers
+        # starting at once); the version check is repeated inside the lock
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.cursor()
+            _ensure_version_table(cursor)
+            if cursor.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                conn.execute('COMMIT')
+                continue
+            for step in steps:
+                _run_step(conn, cursor, step)
+            cursor.execute('INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                           (version, description))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        applied.append(version)
+    return applied
+
+
+def _migrate_mysql(conn, migrations):
+    # DDL auto-commits in MySQL, so concurrent migrators are kept apart with
+    # an advisory lock instead of a transaction
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK('teknoledg_schema_migrations', 60)")
+    if cursor.fetchone()[0] != 1:
+        raise Exception("Could not acquire the migration lock")
+
+    applied = []
+    try:
+        done = applied_versions(conn)
+        for version, description, steps in migrations:
+            if version in done:
+                continue
+            for step in steps:
+                _run_step(conn, cursor, step)
+            cursor.execute('INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+                           (version, description))
+            conn.commit()
+            applied.append(version)
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('teknoledg_schema_migrations')")
+        cursor.fetchone()
+        cursor.close()
+    return applied
+
+
+def migrate(conn, schema) -> list:
+    """Apply pending migrations for a schema; returns the versions applied"""
+    migrations = MIGRATIONS[schema]
+    if DIALECTS[schema] == 'mysql':
+        applied = _migrate_mysql(conn, migrations)
+    else:
+        applied = _migrate_sqlite(conn, migrations)
+
+    for version in applied:
+        description = next(d for v, d, _ in migrations if v == version)
+        logger.info(f"Applied {schema} migration {version}: {description}")
+    return applied
+
+
+def pending(conn, schema) -> list:
+    done = applied_versions(conn)
+    return [(v, d) for v, d, _ in MIGRATIONS[schema] if v not in done]
+
+
+def _sqlite_plan_problems(conn, sql, params):
+    problems = []
+    for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+        detail = row[-1]
+        if re.match(r'^SCAN (TABLE )?\w+$', detail) or 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+
+def _mysql_plan_problems(conn, sql, params):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(f'EXPLAIN {sql}', params)
+    problems = []
+    for row in cursor.fetchall():
+        if row.get('type') == 'ALL':
+            problems.append(f"full table scan on {row.get('table')}")
+        if 'filesort' in (row.get('Extra') or ''):
+            problems.append(f"filesort on {row.get('table')}")
+    cursor.close()
+    return problems
+
+
+def check_query_plans(conn, schema) -> dict:
+    """EXPLAIN every hot query; returns {query name: [problems]} for the bad ones"""
+    explain = _mysql_plan_problems if DIALECTS[schema] == 'mysql' else _sqlite_plan_problems
+    failures = {}
+    for name, sql, params in HOT_QUERIES[schema]:
+        problems = explain(conn, sql, params)
+        if problems:
+            failures[name] = problems
+    return failures
+
+
+def connect(schema, db_path):
+    """Open a connection for a schema (SQLite in autocommit mode, or the MySQL DB_CONFIG)"""
+    if DIALECTS[schema] == 'mysql':
+        import mysql.connector
+        from app_existing_db import DB_CONFIG
+        return mysql.connector.connect(**DB_CONFIG)
+    return sqlite3.connect(db_path, isolation_level=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply schema migrations')
+    parser.add_argument('schema', choices=sorted(MIGRATIONS))
+    parser.add_argument('--db', help='SQLite database file (default: <schema>.db)')
+    parser.add_argument('--status', action='store_true', help='list pending migrations without applying them')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='after migrating, fail if a hot query needs a full table scan')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    conn = connect(args.schema, args.db or f"{args.schema}.db")
+    try:
+        if args.status:
+            todo = pending(conn, args.schema)
+            for version, description in todo:
+                print(f"pending {version}: {description}")
+            print(f"{len(todo)} pending migration(s)")
+            return 0
+
+        applied = migrate(conn, args.schema)
+        print(f"{len(applied)} migration(s) applied")
+
+        if args.check_plans:
+            failures = check_query_plans(conn, args.schema)
+            for name, problems in failures.items():
+                print(f"FAIL {name}: {'; '.join(problems)}")
+            if failures:
+                return 1
+            print(f"All {len(HOT_QUERIES[args.schema])} hot queries use an index")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+"""
+Outbound notification queue
+Persists notification emails in SQLite and delivers them from background
+workers that reuse an authenticated SMTP session, optionally batching
+registrations into periodic digest emails
+"""
+
+import asyncio
+import html
+import logging
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from sqlite_tuning import apply_pragmas
+
+logger = logging.getLogger(__name__)
+
+# Queue configuration
+NOTIFY_QUEUE_PATH = os.getenv('NOTIFY_QUEUE_PATH', 'notifications.db')
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', 2))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 6))
+NOTIFY_BACKOFF_BASE = float(os.getenv('NOTIFY_BACKOFF_BASE', 5))  # seconds
+NOTIFY_BACKOFF_MAX = float(os.getenv('NOTIFY_BACKOFF_MAX', 900))  # seconds
+NOTIFY_POLL_INTERVAL = float(os.getenv('NOTIFY_POLL_INTERVAL', 2))  # seconds
+NOTIFY_LEASE_SECONDS = 120  # a claimed message is retried if its worker dies
+
+# Digest configuration
+DIGEST_WINDOW_SECONDS = float(os.getenv('DIGEST_WINDOW_SECONDS', 3600))
+DIGEST_MAX_COUNT = int(os.getenv('DIGEST_MAX_COUNT', 100))
+
+
+class SMTPSession:
+    """
+    A long-lived SMTP connection that is opened, upgraded with STARTTLS and
+    authenticated once, then reused for every message a worker sends.
+    Not thread-safe: each worker owns its own session.
+    """
+
+    def __init__(self, host, port, username, password, use_tls=True,
+                 timeout=30, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.password:
+            server.login(self.username, self.password)
+        self._server = server
+        logger.info(f"SMTP session opened to {self.host}:{self.port}")
+
+    def _is_alive(self) -> bool:
+        """Cheap liveness probe, only used after the session sat idle"""
+        try:
+            return self._server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, msg):
+        """Send a message, (re)connecting only when the session is gone or stale"""
+        if self._server is None or (
+                time.monotonic() - self._last_used > self.idle_timeout and not self._is_alive()):
+            self.close()
+            self._connect()
+
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Server dropped us between messages; retry once on a fresh session
+            self.close()
+            self._connect()
+            self._server.send_message(msg)
+
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        """Release the connection when the queue has been quiet for a while"""
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+
+class AsyncSMTPSession:
+    """
+    SMTPSession for the asyncio app (app_async.py), on aiosmtplib: the same
+    long-lived, lazily reconnected session, but sending never blocks the
+    event loop. Not task-safe: each delivery task owns its own session.
+    """
+
+    def __init__(self, host, port, username, password, use_tls=True,
+                 timeout=30, idle_timeout=60):
+        import aiosmtplib
+
+        self._smtp = aiosmtplib
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._server = None
+        self._last_used = 0.0
+
+    async def _connect(self):
+        server = self._smtp.SMTP(hostname=self.host, port=self.port, timeout=self.timeout, start_tls=False)
+        await server.connect()
+        if self.use_tls:
+            await server.starttls()
+        if self.password:
+            await server.login(self.username, self.password)
+        self._server = server
+        logger.info(f"SMTP session opened to {self.host}:{self.port}")
+
+    async def _is_alive(self) -> bool:
+        try:
+            return (await self._server.noop()).code == 250
+        except (self._smtp.SMTPException, OSError):
+            return False
+
+    async def send(self, msg):
+        """Send a message, (re)connecting only when the session is gone or stale"""
+        if self._server is None or (
+                time.monotonic() - self._last_used > self.idle_timeout and not await self._is_alive()):
+            await self.close()
+            await self._connect()
+
+        try:
+            await self._server.send_message(msg)
+        except self._smtp.SMTPServerDisconnected:
+            # Server dropped us between messages; retry once on a fresh session
+            await self.close()
+            await self._connect()
+            await self._server.send_message(msg)
+
+        self._last_used = time.monotonic()
+
+    async def close_if_idle(self):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            await self.close()
+
+    async def close(self):
+        if self._server is None:
+            return
+        try:
+            await self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+
+def build_message(sender, recipient, subject, body, html_body=None):
+    """Build the MIME message for a queued notification"""
+    msg = MIMEMultipart('alternative') if html_body else MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+
+    msg.attach(MIMEText(body, 'plain'))
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html'))
+
+    return msg
+
+
+class NotificationQueue:
+    """
+    Persistent outbox for notification emails.
+
+    enqueue() only writes a row, so the request path never waits on the mail
+    server. A pool of worker threads claims due rows, sends them over a reused
+    SMTPSession and retries failures with exponential backoff. Rows are claimed
+    with BEGIN IMMEDIATE, so several processes can safely drain the same file.
+
+    Under asyncio, deliver_async() drains the queue with tasks on the running
+    loop instead, over sessions from async_smtp_factory (AsyncSMTPSession).
+    """
+
+    def __init__(self, path, smtp_factory, sender, workers=NOTIFY_WORKERS,
+                 max_attempts=NOTIFY_MAX_ATTEMPTS, backoff_base=NOTIFY_BACKOFF_BASE,
+                 backoff_max=NOTIFY_BACKOFF_MAX, poll_interval=NOTIFY_POLL_INTERVAL,
+                 async_smtp_factory=None):
+        self.path = path
+        self.smtp_factory = smtp_factory
+        self.async_smtp_factory = async_smtp_factory
+        self.sender = sender
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._initialized = False
+        # Set while deliver_async() runs: wake() then nudges its tasks instead
+        self._loop = None
+        self._async_wake = None
+
+    def _connect(self):
+        conn = apply_pragmas(sqlite3.connect(self.path, timeout=30))
+        if not self._initialized:
+            self.init_queue(conn)
+        return conn
+
+    def init_queue(self, conn=None):
+        """Create the outbox and digest tables if they don't exist"""
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.path, timeout=30)
+
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    html_body TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    locked_until REAL,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_due
+                ON outbox(status, next_attempt_at)
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS digest_entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT NOT NULL,
+                    name TEXT,
+                    ip_address TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._initialized = True
+        finally:
+            if own_conn:
+                conn.close()
+
+    def enqueue(self, recipient, subject, body, html_body=None):
+        """Persist a message for delivery and wake a worker; returns the row id"""
+        conn = self._connect()
+        try:
+            message_id = self.insert_message(conn, recipient, subject, body, html_body)
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.wake()
+        return message_id
+
+    def insert_message(self, conn, recipient, subject, body, html_body=None):
+        """Add a message inside the caller's transaction; call wake() after commit"""
+        cursor = conn.execute('''
+            INSERT INTO outbox (recipient, subject, body, html_body, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (recipient, subject, body, html_body, time.time()))
+        return cursor.lastrowid
+
+    def wake(self):
+        """Make sure workers are running and nudge one to look for work"""
+        if self._loop is not None:
+            # Safe from any thread (request handlers, the digest flusher)
+            self._loop.call_soon_threadsafe(self._async_wake.set)
+            return
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        """Start the worker pool in this process (idempotent, fork-aware)"""
+        with self._lock:
+            if self._pid == os.getpid() and any(t.is_alive() for t in self._threads):
+                return
+
+            # Threads don't survive fork(); a child process starts its own pool
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(max(1, self.workers)):
+                thread = threading.Thread(target=self._worker_loop,
+                                          name=f"notify-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+            logger.info(f"Notification queue started with {len(self._threads)} workers")
+
+    def stop(self, timeout=10):
+        """Signal the workers to finish their current message and exit"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self, conn):
+        """Atomically claim the next due message, or return None"""
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('''
+                SELECT id, recipient, subject, body, html_body, attempts
+                FROM outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND locked_until < ?)
+                ORDER BY next_attempt_at
+                LIMIT 1
+            ''', (now, now)).fetchone()
+
+            if row:
+                conn.execute('''
+                    UPDATE outbox SET status = 'sending', locked_until = ?
+                    WHERE id = ?
+                ''', (now + NOTIFY_LEASE_SECONDS, row[0]))
+
+            conn.execute('COMMIT')
+            return row
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _backoff(self, attempts):
+        """Exponential backoff with jitter so retries don't arrive in lockstep"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _record_failure(self, conn, message_id, attempts, error):
+        if attempts >= self.max_attempts:
+            conn.execute('''
+                UPDATE outbox SET status = 'failed', attempts = ?, last_error = ?, locked_until = NULL
+                WHERE id = ?
+            ''', (attempts, error, message_id))
+            logger.error(f"Notification {message_id} failed permanently after {attempts} attempts: {error}")
+        else:
+            conn.execute('''
+                UPDATE outbox SET status = 'pending', attempts = ?, last_error = ?,
+                       next_attempt_at = ?, locked_until = NULL
+                WHERE id = ?
+            ''', (attempts, error, time.time() + self._backoff(attempts), message_id))
+            logger.warning(f"Notification {message_id} attempt {attempts} failed, will retry: {error}")
+        conn.commit()
+
+    def _worker_loop(self):
+        if not self._initialized:
+            self.init_queue()
+        conn = apply_pragmas(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+        session = self.smtp_factory()
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    job = self._claim(conn)
+                except sqlite3.Error as e:
+                    logger.error(f"Notification queue error: {e}")
+                    job = None
+
+                if job is None:
+                    session.close_if_idle()
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+
+                message_id, recipient, subject, body, html_body, attempts = job
+                try:
+                    session.send(build_message(self.sender, recipient, subject, body, html_body))
+                except Exception as e:
+                    session.close()
+                    self._record_failure(conn, message_id, attempts + 1, str(e))
+                    continue
+
+                conn.execute('DELETE FROM outbox WHERE id = ?', (message_id,))
+                logger.info(f"Notification {message_id} sent to {recipient}")
+        finally:
+            session.close()
+            conn.close()
+
+    async def deliver_async(self):
+        """Drain the queue from the running event loop until cancelled"""
+        self._loop = asyncio.get_running_loop()
+        self._async_wake = asyncio.Event()
+        try:
+            await asyncio.gather(*(self._async_worker_loop() for _ in range(max(1, self.workers))))
+        finally:
+            self._loop = None
+            self._async_wake = None
+
+    async def _async_worker_loop(self):
+        # SMTP is awaited; the short SQLite claims and updates run on a thread
+        if not self._initialized:
+            await asyncio.to_thread(self.init_queue)
+        conn = apply_pragmas(sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                             check_same_thread=False))
+        session = self.async_smtp_factory()
+
+        try:
+            while True:
+                try:
+                    job = await asyncio.to_thread(self._claim, conn)
+                except sqlite3.Error as e:
+                    logger.error(f"Notification queue error: {e}")
+                    job = None
+
+                if job is None:
+                    await session.close_if_idle()
+                    try:
+                        await asyncio.wait_for(self._async_wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._async_wake.clear()
+                    continue
+
+                message_id, recipient, subject, body, html_body, attempts = job
+                try:
+                    await session.send(build_message(self.sender, recipient, subject, body, html_body))
+                except Exception as e:
+                    await session.close()
+                    await asyncio.to_thread(self._record_failure, conn, message_id, attempts + 1, str(e))
+                    continue
+
+                await asyncio.to_thread(conn.execute, 'DELETE FROM outbox WHERE id = ?', (message_id,))
+                logger.info(f"Notification {message_id} sent to {recipient}")
+        finally:
+            await session.close()
+            conn.close()
+
+    def stats(self) -> dict:
+        """Queue depth by status"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
+
+
+class RegistrationDigest:
+    """
+    Collects registrations and sends them to the admin as one summary email.
+
+    Entries are stored next to the outbox, so a restart doesn't lose them. A
+    window is flushed when its oldest entry is window_seconds old or when it
+    holds max_count entries, whichever comes first. Flushing renders the
+    digest and moves it into the outbox in a single transaction, after which
+    the normal queue workers deliver it.
+    """
+
+    def __init__(self, queue, recipient, subject_prefix='New Registrations',
+                 window_seconds=DIGEST_WINDOW_SECONDS, max_count=DIGEST_MAX_COUNT,
+                 check_interval=5):
+        self.queue = queue
+        self.recipient = recipient
+        self.subject_prefix = subject_prefix
+        self.window_seconds = window_seconds
+        self.max_count = max_count
+        self.check_interval = min(check_interval, window_seconds)
+
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def add(self, email, name, ip_address):
+        """Record a registration for the current digest window"""
+        conn = self.queue._connect()
+        try:
+            conn.execute('''
+                INSERT INTO digest_entries (email, name, ip_address, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (email, name, ip_address, time.time()))
+            count = conn.execute('SELECT COUNT(*) FROM digest_entries').fetchone()[0]
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.start()
+        if count >= self.max_count:
+            self._wake.set()
+        return count
+
+    def start(self):
+        """Start the flusher thread in this process (idempotent, fork-aware)"""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._flush_loop, name="notify-digest", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Digest flush error: {e}")
+
+    def flush(self, force=False):
+        """Move the current window into the outbox if it is due; returns the entry count sent"""
+        conn = apply_pragmas(sqlite3.connect(self.queue.path, timeout=30, isolation_level=None))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                count, oldest = conn.execute(
+                    'SELECT COUNT(*), MIN(created_at) FROM digest_entries'
+                ).fetchone()
+
+                due = count and (force or count >= self.max_count
+                                 or time.time() - oldest >= self.window_seconds)
+                if not due:
+                    conn.execute('ROLLBACK')
+                    return 0
+
+                entries = conn.execute('''
+                    SELECT id, email, name, ip_address, created_at
+                    FROM digest_entries
+                    ORDER BY id
+                    LIMIT ?
+                ''', (self.max_count,)).fetchall()
+
+                subject, body, html_body = self.render(entries)
+                self.queue.insert_message(conn, self.recipient, subject, body, html_body)
+                conn.execute('DELETE FROM digest_entries WHERE id <= ?', (entries[-1][0],))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+        self.queue.wake()
+        logger.info(f"Registration digest with {len(entries)} entries queued for {self.recipient}")
+        return len(entries)
+
+    def render(self, entries):
+        """Render (subject, text body, html body) for a digest window"""
+        start = datetime.fromtimestamp(entries[0][4]).strftime('%Y-%m-%d %H:%M')
+        end = datetime.fromtimestamp(entries[-1][4]).strftime('%Y-%m-%d %H:%M')
+        count = len(entries)
+        subject = f"{self.subject_prefix} - {count} between {start} and {end}"
+
+        lines = [f"{count} new registrations between {start} and {end}:", ""]
+        rows = []
+        for _, email, name, ip_address, created_at in entries:
+            timestamp = datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M:%S')
+            lines.append(f"{timestamp}  {email}  {name or 'Not provided'}  {ip_address or ''}")
+            rows.append(
+                "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>".format(
+                    timestamp, html.escape(email), html.escape(name or 'Not provided'),
+                    html.escape(ip_address or ''))
+            )
+        body = "\n".join(lines) + "\n"
+
+        html_body = f"""<html><body>
+<p><strong>{count}</strong> new registrations between {start} and {end}.</p>
+<table border="1" cellpadding="4" cellspacing="0">
+<tr><th>Timestamp</th><th>Email</th><th>Name</th><th>IP Address</th></tr>
+{"".join(rows)}
+</table>
+</body></html>"""
+
+        return subject, body, html_body
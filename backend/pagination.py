@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Keyset pagination helpers
+Opaque cursor tokens and page assembly for keyset-paged views
+"""
+
+import base64
+import json
+
+
+def encode_cursor(direction, *key) -> str:
+    """Encode a sort key and direction ('next' or 'prev') as an opaque URL-safe token"""
+    payload = json.dumps([direction] + [str(k) if not isinstance(k, (int, float)) else k for k in key],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, key_length=2):
+    """Decode a token from encode_cursor(); returns (direction, key) or raises ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+    if not isinstance(payload, list) or len(payload) != key_length + 1 or payload[0] not in ('next', 'prev'):
+        raise ValueError("Invalid cursor")
+    return payload[0], tuple(payload[1:])
+
+
+def keyset_page(rows, per_page, direction, key):
+    """
+    Turn a LIMIT per_page + 1 result into a page.
+
+    `direction` is None for the first page. `rows` must be in display order
+    for 'next' and reversed for 'prev' (the query walks backwards from the
+    cursor). `key` maps a row to its sort key. Returns
+    (rows, next_cursor, prev_cursor); a cursor is None at either end.
+    """
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows = rows[::-1]
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = direction == 'next', has_more
+
+    next_cursor = encode_cursor('next', *key(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_cursor('prev', *key(rows[0])) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+QR code artifact cache
+Rendered certificate QR images kept in an in-memory LRU backed by a disk
+store, keyed by a hash of the certificate data, plus a command that
+pre-renders every certificate
+
+Usage:
+    python qr_cache.py warm --db certificates.db
+    python qr_cache.py warm --prune --workers 4
+    python qr_cache.py rotate --batch-size 100 --pause 1
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+QR_CACHE_DIR = os.getenv('QR_CACHE_DIR', 'qr_cache')
+QR_CACHE_MAX_ENTRIES = int(os.getenv('QR_CACHE_MAX_ENTRIES', 256))
+# Each QR payload embeds its creation time and verification rejects payloads
+# older than a year, so stored images are re-rendered well before that
+QR_CACHE_MAX_AGE_DAYS = float(os.getenv('QR_CACHE_MAX_AGE_DAYS', 30))
+# Processes used to render batches; spawned rather than forked, so a worker
+# never inherits locks held by the threads of a running server
+QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', os.cpu_count() or 1))
+
+
+class QRCache:
+    """
+    Content-addressed store for rendered QR images.
+
+    The key is a SHA-256 of the certificate row, the render options (merged
+    over `defaults`, so an explicit default and an omitted one share an
+    entry) and a salt (the encryption key fingerprint, or a callable that
+    returns it, so the key need not exist yet), so editing a
+    certificate or rotating the key simply produces a new key and the old
+    artifact is never served again. Lookups go memory LRU -> disk ->
+    render(certificate, **options), and a render is written to both.
+    """
+
+    def __init__(self, render, directory=QR_CACHE_DIR, max_entries=QR_CACHE_MAX_ENTRIES,
+                 max_age=QR_CACHE_MAX_AGE_DAYS * 86400, salt='', defaults=None):
+        self.render = render
+        self.defaults = defaults or {}
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.salt = salt
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        self.render_time_total = 0.0
+
+    def key(self, certificate, **options) -> str:
+        options = {**self.defaults, **options}
+        salt = self.salt() if callable(self.salt) else self.salt
+        material = json.dumps([salt, certificate, options], sort_keys=True, default=str)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.qr")
+
+    def _remember(self, key, data, created):
+        with self._lock:
+            self._memory[key] = (created, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _from_memory(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            created, data = entry
+            if time.time() - created > self.max_age:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+
+    def _from_disk(self, key):
+        path = self._path(key)
+        try:
+            created = os.path.getmtime(path)
+            if time.time() - created > self.max_age:
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, data, created)
+        with self._lock:
+            self.disk_hits += 1
+        return data
+
+    def _store(self, key, data):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a concurrent reader never sees half a file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not store QR artifact {key}: {e}")
+
+    def get(self, certificate, **options) -> bytes:
+        """Image bytes for a certificate, rendering only on a cache miss"""
+        key = self.key(certificate, **options)
+        data = self._from_memory(key)
+        if data is None:
+            data = self._from_disk(key)
+        if data is None:
+            started = time.perf_counter()
+            data = self.render(certificate, **{**self.defaults, **options})
+            elapsed = time.perf_counter() - started
+            self._store(key, data)
+            self._remember(key, data, time.time())
+            with self._lock:
+                self.renders += 1
+                self.render_time_total += elapsed
+        return data
+
+    def render_many(self, certificates, workers=None, **options) -> list:
+        """
+        Image bytes for each certificate, in order. Cache misses are rendered
+        in parallel across a process pool (render must be a module-level
+        function so it can be sent to the workers).
+        """
+        certificates = list(certificates)
+        keys = [self.key(certificate, **options) for certificate in certificates]
+        images = [self._from_memory(key) or self._from_disk(key) for key in keys]
+        missing = [i for i, image in enumerate(images) if image is None]
+
+        workers = min(workers or QR_RENDER_WORKERS, len(missing))
+        if workers > 1:
+            started = time.perf_counter()
+            render_options = {**self.defaults, **options}
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = [pool.submit(self.render, certificates[i], **render_options) for i in missing]
+                for i, future in zip(missing, futures):
+                    images[i] = future.result()
+                    self._store(keys[i], images[i])
+                    self._remember(keys[i], images[i], time.time())
+            with self._lock:
+                self.renders += len(missing)
+                self.render_time_total += time.perf_counter() - started
+        else:
+            for i in missing:
+                images[i] = self.get(certificates[i], **options)
+        return images
+
+    def warm(self, certificates, workers=None, **options) -> int:
+        """Render every certificate not yet cached; returns how many were rendered"""
+        renders = self.renders
+        self.render_many(certificates, workers=workers, **options)
+        return self.renders - renders
+
+    def prune(self, keep) -> int:
+        """Delete stored artifacts whose key is not in `keep`; returns how many"""
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.split('.')[0] not in keep:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'memory_entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'renders': self.renders,
+                'render_time_avg_ms': round(1000 * self.render_time_total / self.renders, 3) if self.renders else 0.0
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-render certificate QR codes')
+    parser.add_argument('command', choices=['warm', 'rotate'],
+                        help='warm renders every missing artifact at once; rotate re-renders them under '
+                             'the current key in small batches, then deletes the ones made with older keys')
+    parser.add_argument('--db', help='certificates database (default: certificate_api.DB_PATH)')
+    parser.add_argument('--workers', type=int, help='render processes (default: QR_RENDER_WORKERS)')
+    parser.add_argument('--prune', action='store_true',
+                        help='also delete artifacts other than the default rendering of each certificate')
+    parser.add_argument('--batch-size', type=int, default=100, help='rotate: certificates per batch')
+    parser.add_argument('--pause', type=float, default=1.0,
+                        help='rotate: seconds to sleep between batches, leaving CPU to the server')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import certificate_api
+
+    if args.db:
+        certificate_api.use_database(args.db)
+
+    certificates = certificate_api.all_certificates()
+    started = time.perf_counter()
+    if args.command == 'rotate':
+        # Artifacts are keyed by the key fingerprint, so every image made with
+        # a retired key is a miss here and gets re-rendered
+        rendered = 0
+        for start in range(0, len(certificates), args.batch_size):
+            if start:
+                time.sleep(args.pause)
+            rendered += certificate_api.qr_cache.warm(certificates[start:start + args.batch_size],
+                                                      workers=args.workers)
+            logger.info(f"Rotated {min(start + args.batch_size, len(certificates))}/{len(certificates)}")
+    else:
+        rendered = certificate_api.qr_cache.warm(certificates, workers=args.workers)
+    print(f"{len(certificates)} certificate(s), {rendered} rendered in {time.perf_counter() - started:.2f}s")
+
+    if args.prune or args.command == 'rotate':
+        keep = {certificate_api.qr_cache.key(c) for c in certificates}
+        print(f"{certificate_api.qr_cache.prune(keep)} stale artifact(s) removed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Rate limiting and admission control
+Per-client token buckets for abuse-prone endpoints, and a cap on requests in
+flight that sheds the excess with 503s instead of letting it queue
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request as flask_request
+
+logger = logging.getLogger(__name__)
+
+# Rate limit configuration
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')  # memory, redis or none
+RATE_LIMIT_URL = os.getenv('RATE_LIMIT_URL', 'redis://localhost:6379/0')
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+# Proxies in front of the app that append to X-Forwarded-For (1 behind a load
+# balancer). 0 uses the socket address and ignores the header, which clients
+# can set to anything.
+RATE_LIMIT_PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', 0))
+
+# Admission control for the asyncio app: /api/ requests in flight per
+# process; 0 disables the cap. The WSGI apps rely on gunicorn.conf.py instead.
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 64))
+SHED_RETRY_AFTER = 1  # seconds
+
+
+def parse_limit(spec):
+    """'10/60' -> (rate per second, burst): 10 requests at once, refilled over 60 s"""
+    count, _, seconds = spec.partition('/')
+    count, seconds = float(count), float(seconds or 1)
+    if count <= 0 or seconds <= 0:
+        raise ValueError(f"Invalid rate limit: {spec}")
+    return count / seconds, count
+
+
+def client_ip(request, proxy_hops=RATE_LIMIT_PROXY_HOPS) -> str:
+    """The client address, taken from X-Forwarded-For only as far as proxies we trust added it"""
+    if proxy_hops > 0:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= proxy_hops:
+            return forwarded[-proxy_hops]
+    return request.remote_addr or ''
+
+
+class LimiterMetrics:
+    """Allowed and limited counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.backend_errors = 0
+
+    def increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'limited': self.limited,
+                'backend_errors': self.backend_errors
+            }
+
+
+class MemoryBuckets:
+    """Token buckets in an in-process LRU (each worker process has its own)"""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """(allowed, tokens left) after trying to take cost tokens"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            # An evicted client starts again with a full bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def stats(self) -> dict:
+        return {'backend': 'memory', 'keys': len(self._buckets)}
+
+
+# Refill, take and save a bucket atomically; keys expire once they would be full
+REDIS_TAKE = '''
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(tokens)}
+'''
+
+
+class RedisBuckets:
+    """
+    Token buckets in Redis, shared by every worker process and server.
+    Redis errors are logged and the request is let through; the limiter
+    must never take an endpoint down.
+    """
+
+    def __init__(self, url=RATE_LIMIT_URL, prefix='rate_limit'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._take = self._redis.register_script(REDIS_TAKE)
+        self._errors = redis.RedisError
+        self.prefix = prefix
+
+    def take(self, key, rate, burst, cost=1):
+        try:
+            allowed, tokens = self._take(keys=[f"{self.prefix}:{key}"], args=[rate, burst, time.time(), cost])
+        except self._errors as e:
+            logger.warning(f"Rate limit check failed: {e}")
+            return None, burst
+        return bool(allowed), float(tokens)
+
+    def stats(self) -> dict:
+        return {'backend': 'redis'}
+
+
+def make_buckets(name=RATE_LIMIT_BACKEND):
+    """Build the configured store; returns None when rate limiting is disabled"""
+    if name == 'none':
+        return None
+    if name == 'redis':
+        try:
+            return RedisBuckets()
+        except ImportError:
+            logger.warning("RATE_LIMIT_BACKEND=redis but the redis package is not installed; "
+                           "using in-process buckets")
+    return MemoryBuckets()
+
+
+def _json_response(status, message, retry_after):
+    return (json.dumps({'success': False, 'message': message}),
+            status, {'Content-Type': 'application/json', 'Retry-After': str(retry_after)})
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by scope (usually the route) and client IP.
+
+    A limit of '10/60' lets a client make 10 requests at once and then one
+    every 6 seconds. Requests over the limit get a 429 with Retry-After set
+    to when the next token arrives. With the memory store every worker
+    process counts separately; RATE_LIMIT_BACKEND=redis shares the buckets.
+    """
+
+    def __init__(self, buckets='default'):
+        self.buckets = make_buckets() if buckets == 'default' else buckets
+        self.metrics = LimiterMetrics()
+
+    def hit(self, scope, client, rate, burst, cost=1):
+        """Seconds until the client may retry, or 0 if the request is allowed"""
+        if self.buckets is None:
+            return 0
+        allowed, tokens = self.buckets.take(f"{scope}:{client}", rate, burst, cost)
+        if allowed is None:
+            self.metrics.increment('backend_errors')
+            return 0
+        if allowed:
+            self.metrics.increment('allowed')
+            return 0
+        self.metrics.increment('limited')
+        return max(1, math.ceil((cost - tokens) / rate))
+
+    def limit(self, scope, spec, request=flask_request):
+        """
+        Decorator: apply limit `spec` ('count/seconds') per client to a view.
+        Works on async views too; pass the framework's request proxy then.
+        """
+        rate, burst = parse_limit(spec)
+
+        def denied():
+            retry_after = self.hit(scope, client_ip(request), rate, burst)
+            if retry_after:
+                logger.debug(f"Rate limited {scope} for {client_ip(request)}")
+                return _json_response(429, 'Too many requests, please try again later', retry_after)
+            return None
+
+        def decorator(view):
+            if asyncio.iscoroutinefunction(view):
+                @wraps(view)
+                async def async_wrapper(*args, **kwargs):
+                    return denied() or await view(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                return denied() or view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        stats = self.metrics.snapshot()
+        stats.update(self.buckets.stats() if self.buckets is not None else {'backend': 'none'})
+        return stats
+
+
+class ConcurrencyGate:
+    """
+    Admission control: at most max_concurrent requests under the given path
+    prefixes run at once in this process. The next one is refused at once
+    with a 503 and Retry-After, so under overload clients back off while
+    admitted requests keep their normal latency, instead of every request
+    waiting in a growing queue. Installed as ASGI middleware, so a request
+    counts until its last byte is sent.
+
+    The gate only sees requests the server has handed to the app, which
+    under an ASGI server (app_async on uvicorn) is every open one. Under
+    gunicorn's gthread workers it would see at most `threads` per process
+    and never trip, so the WSGI apps don't install it; gunicorn.conf.py
+    bounds their queue (worker_connections, backlog) instead.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, prefixes=('/api/',)):
+        self.max_concurrent = max_concurrent
+        self.prefixes = tuple(prefixes)
+        self.in_flight = 0
+        self.peak = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self) -> bool:
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def asgi(self, asgi_app):
+        """Wrap an ASGI app (app.asgi_app = gate.asgi(app.asgi_app))"""
+        async def middleware(scope, receive, send):
+            if scope['type'] != 'http' or not scope['path'].startswith(self.prefixes):
+                return await asgi_app(scope, receive, send)
+            if not self.try_enter():
+                body, status, headers = _json_response(503, 'Server busy, please try again shortly',
+                                                       SHED_RETRY_AFTER)
+                await send({'type': 'http.response.start', 'status': status,
+                            'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+                await send({'type': 'http.response.body', 'body': body.encode()})
+                return
+            try:
+                await asgi_app(scope, receive, send)
+            finally:
+                self.leave()
+        return middleware
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self.in_flight,
+                'peak': self.peak,
+                'shed': self.shed
+            }
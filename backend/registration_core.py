@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Registration core
+Validation, storage, admin queries and notification plumbing shared by the
+Flask (app.py) and asyncio (app_async.py) registration APIs
+"""
+
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+from notifications import NotificationQueue, RegistrationDigest, SMTPSession, AsyncSMTPSession, NOTIFY_QUEUE_PATH
+from sqlite_tuning import SQLiteWriter
+from rate_limit import RateLimiter
+from admin_auth import AdminAuthenticator, DEFAULT_PASSWORD_HASH
+
+logger = logging.getLogger(__name__)
+
+# Database configuration
+DB_PATH = 'registrations.db'
+
+# Registration write pipeline: signups that queue up while a commit is in
+# flight are inserted together with executemany and committed once. Raising
+# REGISTER_BATCH_DELAY_MS holds each batch open a few ms longer to collect more
+# (worth it when fsync is slow, e.g. with FULL durability on network storage).
+# REGISTER_DURABILITY is the writer's PRAGMA synchronous: FULL syncs every
+# commit, NORMAL (default) may lose the last commits on power loss but never
+# corrupts, OFF leaves syncing to the OS.
+REGISTER_DURABILITY = os.getenv('REGISTER_DURABILITY', 'NORMAL').upper()
+REGISTER_BATCH_DELAY_MS = float(os.getenv('REGISTER_BATCH_DELAY_MS', 0))
+REGISTER_BATCH_MAX = int(os.getenv('REGISTER_BATCH_MAX', 256))
+db_writer = SQLiteWriter(DB_PATH, max_batch=REGISTER_BATCH_MAX, synchronous=REGISTER_DURABILITY,
+                         max_delay=REGISTER_BATCH_DELAY_MS / 1000)
+
+# Signups per client IP ('count/seconds': a burst of count, refilled over
+# seconds; see rate_limit.py)
+REGISTER_RATE_LIMIT = os.getenv('REGISTER_RATE_LIMIT', '5/60')
+rate_limiter = RateLimiter()
+
+# Admin credentials (in production, use environment variables; see admin_auth.py)
+ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
+ADMIN_PASSWORD_HASH = os.getenv('ADMIN_PASSWORD_HASH', DEFAULT_PASSWORD_HASH)
+admin_auth = AdminAuthenticator(ADMIN_USERNAME, ADMIN_PASSWORD_HASH, rate_limiter)
+
+# Email configuration
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'mail.teknoledg.com')  # Update with actual email server
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))  # or 465 for SSL
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'  # false for a local debugging server
+EMAIL_USER = 'noreply@teknoledg.com'  # Update with actual email
+EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', '')  # Set via environment variable
+ADMIN_EMAIL = 'tim@teknoledg.com'
+
+# Notification mode: 'immediate' sends one email per registration, 'digest'
+# collects registrations and sends one summary per window or count threshold
+NOTIFICATION_MODE = os.getenv('NOTIFICATION_MODE', 'immediate')
+DIGEST_WINDOW_SECONDS = float(os.getenv('DIGEST_WINDOW_SECONDS', 3600))
+DIGEST_MAX_COUNT = int(os.getenv('DIGEST_MAX_COUNT', 100))
+
+# Notification emails are queued and sent by background workers
+notification_queue = NotificationQueue(
+    NOTIFY_QUEUE_PATH,
+    smtp_factory=lambda: SMTPSession(SMTP_SERVER, SMTP_PORT, EMAIL_USER, EMAIL_PASSWORD, use_tls=SMTP_USE_TLS),
+    sender=EMAIL_USER,
+    async_smtp_factory=lambda: AsyncSMTPSession(SMTP_SERVER, SMTP_PORT, EMAIL_USER, EMAIL_PASSWORD,
+                                                use_tls=SMTP_USE_TLS)
+)
+registration_digest = RegistrationDigest(
+    notification_queue,
+    ADMIN_EMAIL,
+    subject_prefix='New Registrations - Teknoledge Updates',
+    window_seconds=DIGEST_WINDOW_SECONDS,
+    max_count=DIGEST_MAX_COUNT
+)
+
+# Admin dashboard page size and export columns
+ADMIN_PAGE_SIZE = 20
+EXPORT_QUERY = '''
+    SELECT email, name, timestamp, ip_address
+    FROM registrations
+    ORDER BY timestamp DESC
+'''
+EXPORT_FIELDS = ('email', 'name', 'timestamp', 'ip_address')
+EXPORT_HEADER = ('Email', 'Name', 'Timestamp', 'IP Address')
+
+REGISTERED_MESSAGE = 'Thank you for registering! We\'ll notify you when we launch.'
+
+
+def validate_registration(data):
+    """(email, name) from a registration payload; raises ValueError with the message for the client"""
+    if not isinstance(data, dict):
+        raise ValueError('Valid email is required')
+    email = str(data.get('email') or '').strip()
+    name = str(data.get('name') or '').strip()
+
+    if not email or '@' not in email:
+        raise ValueError('Valid email is required')
+    return email, name
+
+
+def client_info(headers, remote_addr):
+    """(ip_address, user_agent) of the request"""
+    return headers.get('X-Forwarded-For', remote_addr or ''), headers.get('User-Agent', '')
+
+
+def insert_registrations(conn, rows):
+    """
+    Insert a batch of (email, name, ip_address, user_agent) rows with one
+    executemany. Returns the new id for each row, or an IntegrityError for
+    rows whose email is already registered (including repeats in the batch).
+    """
+    emails = [row[0] for row in rows]
+    placeholders = ','.join('?' * len(emails))
+    existing = {r[0] for r in conn.execute(
+        f'SELECT email FROM registrations WHERE email IN ({placeholders})', emails)}
+
+    results = [None] * len(rows)
+    fresh = []
+    for i, row in enumerate(rows):
+        if row[0] in existing:
+            results[i] = sqlite3.IntegrityError('UNIQUE constraint failed: registrations.email')
+        else:
+            existing.add(row[0])
+            fresh.append(i)
+
+    if fresh:
+        conn.executemany('''
+            INSERT INTO registrations (email, name, ip_address, user_agent)
+            VALUES (?, ?, ?, ?)
+        ''', [rows[i] for i in fresh])
+
+        fresh_emails = [rows[i][0] for i in fresh]
+        placeholders = ','.join('?' * len(fresh_emails))
+        ids = dict(conn.execute(
+            f'SELECT email, id FROM registrations WHERE email IN ({placeholders})', fresh_emails))
+        for i in fresh:
+            results[i] = ids[rows[i][0]]
+
+    return results
+
+
+def delete_registration(conn, reg_id):
+    conn.execute('DELETE FROM registrations WHERE id = ?', (reg_id,))
+
+
+def dashboard_query(direction, key, per_page=ADMIN_PAGE_SIZE):
+    """
+    (sql, params) for one admin dashboard page. Keyset pagination on
+    (timestamp, id): each page is an index range scan from the cursor,
+    however deep it is. Fetches per_page + 1 rows for keyset_page().
+    """
+    columns = 'SELECT id, email, name, timestamp, ip_address, user_agent FROM registrations'
+    if direction == 'next':
+        return f'''
+            {columns}
+            WHERE (timestamp, id) < (?, ?)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', (*key, per_page + 1)
+    if direction == 'prev':
+        return f'''
+            {columns}
+            WHERE (timestamp, id) > (?, ?)
+            ORDER BY timestamp ASC, id ASC
+            LIMIT ?
+        ''', (*key, per_page + 1)
+    return f'''
+        {columns}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', (per_page + 1,)
+
+
+def send_notification_email(email, name, ip_address):
+    """Queue notification email to admin"""
+    try:
+        if NOTIFICATION_MODE == 'digest':
+            pending = registration_digest.add(email, name, ip_address)
+            logger.info(f"Registration {email} added to digest ({pending} pending)")
+            return True
+
+        # Email body
+        body = f"""
+        New user registration received:
+
+        Email: {email}
+        Name: {name if name else 'Not provided'}
+        IP Address: {ip_address}
+        Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+        This user has registered for product updates.
+        """
+
+        message_id = notification_queue.enqueue(ADMIN_EMAIL, 'New Registration - Teknoledge Updates', body)
+
+        logger.info(f"Notification email {message_id} queued for {ADMIN_EMAIL}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to queue notification email: {str(e)}")
+        return False
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Registration statistics
+Totals and rolling-window counts read from the hourly counters that the
+migration-installed triggers keep up to date, plus rebuild and consistency
+check commands
+
+Usage:
+    python registration_stats.py show
+    python registration_stats.py check --db registrations.db
+    python registration_stats.py rebuild --schema registrations_mysql
+"""
+
+import argparse
+import logging
+import sys
+
+from migrations import DIALECTS, connect
+
+logger = logging.getLogger(__name__)
+
+# A rolling window is the sum of the whole buckets after its start plus a
+# range count over the raw rows of the one bucket it starts in, so the result
+# is exact while reading O(buckets) counters and at most an hour of rows.
+SQLITE_WINDOW = '''
+    SELECT
+        (SELECT COALESCE(SUM(count), 0) FROM registration_stats_hourly
+         WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', '{span}', '+1 hour'))
+      + (SELECT COUNT(*) FROM registrations
+         WHERE timestamp > datetime('now', '{span}')
+           AND timestamp < strftime('%Y-%m-%d %H:00:00', 'now', '{span}', '+1 hour'))
+'''
+
+MYSQL_WINDOW = '''
+    SELECT
+        (SELECT COALESCE(SUM(count), 0) FROM registration_stats_hourly
+         WHERE hour >= DATE_FORMAT(NOW() - INTERVAL {span}, '%Y-%m-%d %H:00:00') + INTERVAL 1 HOUR)
+      + (SELECT COUNT(*) FROM registrations
+         WHERE timestamp >= NOW() - INTERVAL {span}
+           AND timestamp < DATE_FORMAT(NOW() - INTERVAL {span}, '%Y-%m-%d %H:00:00') + INTERVAL 1 HOUR)
+'''
+
+QUERIES = {
+    'sqlite': {
+        'total': "SELECT value FROM registration_stats_totals WHERE name = 'registrations'",
+        'last_24h': SQLITE_WINDOW.format(span='-1 day'),
+        'last_7d': SQLITE_WINDOW.format(span='-7 days'),
+        'today': "SELECT COALESCE(SUM(count), 0) FROM registration_stats_hourly WHERE hour >= date('now')",
+    },
+    'mysql': {
+        'total': "SELECT value FROM registration_stats_totals WHERE name = 'registrations'",
+        'last_24h': MYSQL_WINDOW.format(span='24 HOUR'),
+        'last_7d': MYSQL_WINDOW.format(span='7 DAY'),
+        'today': "SELECT COALESCE(SUM(count), 0) FROM registration_stats_hourly WHERE hour >= CURDATE()",
+    },
+}
+
+RAW_BUCKETS = {
+    'sqlite': "SELECT strftime('%Y-%m-%d %H:00:00', timestamp), COUNT(*) FROM registrations GROUP BY 1",
+    'mysql': "SELECT DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), COUNT(*) FROM registrations GROUP BY 1",
+}
+
+
+def summary(cursor, dialect='sqlite') -> dict:
+    """Total, last 24 hours, last 7 days and today's registrations"""
+    result = {}
+    for name, sql in QUERIES[dialect].items():
+        cursor.execute(sql)
+        row = cursor.fetchone()
+        result[name] = int(row[0]) if row and row[0] is not None else 0
+    return result
+
+
+async def summary_async(conn, dialect='sqlite') -> dict:
+    """summary() over an async connection (aiosqlite) whose execute() is awaitable"""
+    result = {}
+    for name, sql in QUERIES[dialect].items():
+        cursor = await conn.execute(sql)
+        row = await cursor.fetchone()
+        await cursor.close()
+        result[name] = int(row[0]) if row and row[0] is not None else 0
+    return result
+
+
+def check(conn, dialect='sqlite') -> list:
+    """Compare the counters with the raw table; returns a list of discrepancies"""
+    cursor = conn.cursor()
+    cursor.execute(RAW_BUCKETS[dialect])
+    raw = {str(hour): count for hour, count in cursor.fetchall()}
+    cursor.execute('SELECT hour, count FROM registration_stats_hourly WHERE count != 0')
+    buckets = {str(hour): count for hour, count in cursor.fetchall()}
+
+    problems = []
+    for hour in sorted(set(raw) | set(buckets)):
+        if raw.get(hour, 0) != buckets.get(hour, 0):
+            problems.append(f"hour {hour}: counter {buckets.get(hour, 0)}, table {raw.get(hour, 0)}")
+
+    cursor.execute('SELECT COUNT(*) FROM registrations')
+    actual = cursor.fetchone()[0]
+    cursor.execute(QUERIES[dialect]['total'])
+    row = cursor.fetchone()
+    total = row[0] if row else None
+    if total != actual:
+        problems.append(f"total: counter {total}, table {actual}")
+    cursor.close()
+    return problems
+
+
+def rebuild(conn, dialect='sqlite'):
+    """Recompute every counter from the raw table in one transaction"""
+    cursor = conn.cursor()
+    if dialect == 'mysql':
+        # INSERT ... SELECT takes shared locks on the rows it reads, so
+        # registrations wait for the rebuild instead of racing it
+        conn.start_transaction()
+        replace = 'REPLACE'
+    else:
+        cursor.execute('BEGIN IMMEDIATE')
+        replace = 'INSERT OR REPLACE'
+    try:
+        cursor.execute('DELETE FROM registration_stats_hourly')
+        cursor.execute(f'INSERT INTO registration_stats_hourly (hour, count) {RAW_BUCKETS[dialect]}')
+        cursor.execute(f"""
+            {replace} INTO registration_stats_totals (name, value)
+            SELECT 'registrations', COUNT(*) FROM registrations
+        """)
+        if dialect == 'mysql':
+            conn.commit()
+        else:
+            cursor.execute('COMMIT')
+    except Exception:
+        if dialect == 'mysql':
+            conn.rollback()
+        else:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+    logger.info("Rebuilt registration statistics")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Registration statistics counters')
+    parser.add_argument('command', choices=['show', 'check', 'rebuild'])
+    parser.add_argument('--schema', default='registrations', choices=['registrations', 'registrations_mysql'])
+    parser.add_argument('--db', default='registrations.db', help='SQLite database file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    dialect = DIALECTS[args.schema]
+    conn = connect(args.schema, args.db)
+    try:
+        if args.command == 'rebuild':
+            rebuild(conn, dialect)
+
+        if args.command == 'show':
+            cursor = conn.cursor()
+            for name, value in summary(cursor, dialect).items():
+                print(f"{name}: {value}")
+            cursor.close()
+            return 0
+
+        problems = check(conn, dialect)
+        for problem in problems:
+            print(f"MISMATCH {problem}")
+        if problems:
+            return 1
+        print("Counters match the registrations table")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
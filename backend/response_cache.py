@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Response caching for read endpoints
+A decorator that caches successful Flask responses with per-route TTLs,
+answers If-None-Match with 304, and drops entries by tag when the
+underlying data changes, in any process
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')  # memory, redis or none
+RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL', 'redis://localhost:6379/0')
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+RESPONSE_CACHE_DEFAULT_TTL = float(os.getenv('RESPONSE_CACHE_DEFAULT_TTL', 30))
+
+
+class CacheMetrics:
+    """Hit, miss and invalidation counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'not_modified': self.not_modified,
+                'stores': self.stores,
+                'invalidations': self.invalidations
+            }
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry expiry (each worker process has its own)"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, tag) -> int:
+        with self._lock:
+            return self._generations.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'evictions': self.evictions}
+
+
+class RedisBackend:
+    """
+    Shared cache in Redis, so every worker process sees the same entries and
+    invalidations. Redis errors are logged and treated as misses; the cache
+    must never take an endpoint down.
+    """
+
+    def __init__(self, url=RESPONSE_CACHE_URL, prefix='response_cache'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._errors = redis.RedisError
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            raw = self._redis.get(f"{self.prefix}:{key}")
+        except self._errors as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        body, mimetype, etag = json.loads(raw)
+        return base64.b64decode(body), mimetype, etag
+
+    def set(self, key, value, ttl):
+        body, mimetype, etag = value
+        payload = json.dumps([base64.b64encode(body).decode(), mimetype, etag])
+        try:
+            self._redis.set(f"{self.prefix}:{key}", payload, px=max(1, int(ttl * 1000)))
+        except self._errors as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def generation(self, tag) -> int:
+        try:
+            return int(self._redis.get(f"{self.prefix}:generation:{tag}") or 0)
+        except self._errors as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return 0
+
+    def bump(self, tag):
+        try:
+            self._redis.incr(f"{self.prefix}:generation:{tag}")
+        except self._errors as e:
+            logger.warning(f"Response cache invalidation failed: {e}")
+
+    def stats(self) -> dict:
+        return {'backend': 'redis'}
+
+
+class SQLiteDataVersion:
+    """
+    Callable returning PRAGMA data_version of a SQLite database, read on a
+    connection of its own. The value changes whenever any other connection
+    commits, in this process or another (a worker, the import CLI), so a
+    tag keyed on it is invalidated everywhere without a shared cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._owner = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> int:
+        with self._lock:
+            # A connection inherited across fork() must not be used by the
+            # child, and one to an earlier path is no longer the database
+            if self._conn is None or self._owner != (os.getpid(), self.path):
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                self._owner = (os.getpid(), self.path)
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+
+def make_backend(name=RESPONSE_CACHE_BACKEND):
+    """Build the configured backend; returns None when caching is disabled"""
+    if name == 'none':
+        return None
+    if name == 'redis':
+        try:
+            return RedisBackend()
+        except ImportError:
+            logger.warning("RESPONSE_CACHE_BACKEND=redis but the redis package is not installed; "
+                           "using the in-process cache")
+    return MemoryBackend()
+
+
+class ResponseCache:
+    """
+    Caches 200 responses of decorated views.
+
+    Entries are keyed by method, path, query string and (for POST) a hash of
+    the body, plus the current generation of each of the route's tags.
+    invalidate(tag) bumps the generation, so every entry built from the old
+    data stops matching at once and ages out of the LRU on its own.
+
+    The memory backend's generations are per process, so invalidate() only
+    reaches the process that calls it. `versions` maps a tag to a callable
+    (e.g. SQLiteDataVersion) whose value is part of the key too, which lets
+    writes made by other processes invalidate the tag as well.
+
+    Responses carry a content ETag and `Cache-Control: no-cache`, so clients
+    may keep a copy but revalidate it; a matching If-None-Match gets a 304
+    without a body, whether or not the entry was cached.
+    """
+
+    def __init__(self, backend='default', namespace='app', versions=None):
+        self.backend = make_backend() if backend == 'default' else backend
+        self.namespace = namespace
+        self.versions = versions or {}
+        self.metrics = CacheMetrics()
+
+    def _key(self, tags):
+        parts = [self.namespace, request.method, request.path]
+        if request.args:
+            parts.append(urlencode(sorted(request.args.items(multi=True))))
+        if request.method == 'POST':
+            parts.append(hashlib.sha256(request.get_data()).hexdigest())
+        for tag in tags:
+            version = self.versions.get(tag)
+            parts.append(f"{tag}@{self.backend.generation(tag)}"
+                         + (f".{version()}" if version is not None else ''))
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def _respond(self, entry, state):
+        body, mimetype, etag = entry
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Cache'] = state
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            self.metrics.increment('not_modified')
+        return response
+
+    def cached(self, ttl=RESPONSE_CACHE_DEFAULT_TTL, tags=()):
+        """Decorator: cache the view's successful responses for ttl seconds"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+
+                key = self._key(tags)
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.metrics.increment('hits')
+                    return self._respond(entry, 'HIT')
+
+                self.metrics.increment('misses')
+                response = view(*args, **kwargs)
+                # Never buffer a streamed body just to cache it
+                if not isinstance(response, Response) or response.status_code != 200 \
+                        or response.direct_passthrough or response.is_streamed:
+                    return response
+
+                body = response.get_data()
+                entry = (body, response.mimetype, hashlib.sha256(body).hexdigest()[:32])
+                self.backend.set(key, entry, ttl)
+                self.metrics.increment('stores')
+                return self._respond(entry, 'MISS')
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        """Drop every cached response built from data with these tags"""
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.bump(tag)
+            self.metrics.increment('invalidations')
+
+    def stats(self) -> dict:
+        stats = self.metrics.snapshot()
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        else:
+            stats['backend'] = 'none'
+        return stats
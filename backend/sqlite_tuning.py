@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+SQLite storage tuning
+Connection pragmas (WAL, synchronous, cache, mmap, busy timeout) and a
+single-writer commit path that groups concurrent writes into one transaction
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Storage configuration
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -16000))  # negative = KiB, so 16 MB
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))  # bytes
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_WRITER_MAX_BATCH = int(os.getenv('SQLITE_WRITER_MAX_BATCH', 256))
+SQLITE_WRITER_MAX_DELAY_MS = float(os.getenv('SQLITE_WRITER_MAX_DELAY_MS', 0))
+
+
+def apply_pragmas(conn, synchronous=None):
+    """
+    Tune a freshly opened connection.
+
+    WAL lets readers proceed while a write is in progress, and with
+    synchronous=NORMAL a commit only appends to the WAL instead of syncing
+    the main database file. busy_timeout makes concurrent writers wait for
+    the lock rather than failing immediately with "database is locked".
+    """
+    conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+    mode = conn.execute(f'PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}').fetchone()[0]
+    if mode.upper() != SQLITE_JOURNAL_MODE.upper():
+        logger.warning(f"SQLite journal_mode is {mode}, requested {SQLITE_JOURNAL_MODE}")
+    conn.execute(f'PRAGMA synchronous = {synchronous or SQLITE_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size = {SQLITE_CACHE_SIZE}')
+    conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+class SQLiteWriter:
+    """
+    Serializes all writes to a database through one thread and connection.
+
+    Callers submit a function that receives the writer's connection. The
+    writer takes everything that is queued, runs each function inside its own
+    SAVEPOINT (so one failure doesn't undo its neighbours) and commits the
+    whole group once. Under load this turns N transactions, and N syncs, into
+    one, and it removes lock contention between threads of the same process.
+
+    submit_many() queues a single item for a batch handler instead: all items
+    for the same handler in a group are passed to one handler(conn, items)
+    call, which returns one result (or Exception instance) per item. This is
+    what lets a handler use executemany() while every caller still gets its
+    own outcome.
+
+    Durability is explicit: `synchronous` sets the writer connection's
+    PRAGMA synchronous (FULL syncs the WAL on every commit, NORMAL only at
+    checkpoints, OFF never), and `max_delay` holds a group open for that many
+    seconds after its first write to collect more (0 commits immediately).
+    The window is only used while writes are actually concurrent (the last
+    group had more than one write), so a lone writer never waits for it.
+    """
+
+    def __init__(self, path, max_batch=SQLITE_WRITER_MAX_BATCH, synchronous=None,
+                 max_delay=SQLITE_WRITER_MAX_DELAY_MS / 1000):
+        if synchronous and synchronous.upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f"Invalid synchronous level: {synchronous}")
+
+        self.path = path
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self.max_delay = max_delay
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        self.batches = 0
+        self.writes = 0
+        self._last_batch_size = 0
+
+    def start(self):
+        """Start the writer thread in this process (idempotent, fork-aware)"""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, fn, *args) -> Future:
+        """Queue fn(conn, *args) for the next group commit"""
+        self.start()
+        future = Future()
+        self._queue.put((False, fn, args, future))
+        return future
+
+    def execute(self, fn, *args, timeout=None):
+        """Run fn(conn, *args) in the next group commit and return its result"""
+        return self.submit(fn, *args).result(timeout)
+
+    def submit_many(self, handler, item) -> Future:
+        """Queue one item for handler(conn, items) in the next group commit"""
+        self.start()
+        future = Future()
+        self._queue.put((True, handler, item, future))
+        return future
+
+    def execute_many(self, handler, item, timeout=None):
+        """Run item through a batch handler in the next group commit and return its result"""
+        return self.submit_many(handler, item).result(timeout)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        return apply_pragmas(conn, self.synchronous)
+
+    def _collect(self):
+        """Block for one write, then take whatever else arrives within max_delay"""
+        batch = [self._queue.get()]
+        linger = self.max_delay if self._last_batch_size > 1 else 0
+        deadline = time.monotonic() + linger
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = self._collect()
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error as e:
+                    logger.error(f"SQLite writer could not open {self.path}: {e}")
+                    for item in batch:
+                        item[3].set_exception(e)
+                    continue
+            self._commit_batch(conn, batch)
+
+    def _run_savepoint(self, conn, fn, *args):
+        """Run fn inside a SAVEPOINT; returns (result, error)"""
+        conn.execute('SAVEPOINT write_item')
+        try:
+            result = fn(conn, *args)
+            conn.execute('RELEASE write_item')
+            return result, None
+        except Exception as e:
+            conn.execute('ROLLBACK TO write_item')
+            conn.execute('RELEASE write_item')
+            return None, e
+
+    def _commit_batch(self, conn, batch):
+        results = []
+        grouped = {}
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for is_many, fn, args, future in batch:
+                if is_many:
+                    grouped.setdefault(fn, []).append((args, future))
+                    continue
+                result, error = self._run_savepoint(conn, fn, *args)
+                results.append((future, result, error))
+
+            for handler, entries in grouped.items():
+                items = [item for item, _ in entries]
+                outcomes, error = self._run_savepoint(conn, handler, items)
+                if error is not None:
+                    # The whole batch failed; retry item by item so only the bad ones fail
+                    outcomes = []
+                    for item in items:
+                        result, item_error = self._run_savepoint(conn, handler, [item])
+                        outcomes.append(item_error if item_error is not None else result[0])
+                for (_, future), outcome in zip(entries, outcomes):
+                    if isinstance(outcome, Exception):
+                        results.append((future, None, outcome))
+                    else:
+                        results.append((future, outcome, None))
+
+            conn.execute('COMMIT')
+        except Exception as e:
+            logger.error(f"SQLite group commit failed: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for item in batch:
+                if not item[3].done():
+                    item[3].set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        self._last_batch_size = len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'avg_batch_size': round(self.writes / self.batches, 2) if self.batches else 0.0,
+            'queued': self._queue.qsize()
+        }
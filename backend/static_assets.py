@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Static asset serving
+Pages, CSS, JavaScript and images loaded once (by init_app, or on first
+request), precompressed, fingerprinted by content hash and served from
+memory with conditional GETs
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, abort, request
+
+try:
+    import brotli  # optional: without it only gzip variants are built
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Site root (index.html, verify.html, css/, js/, images/) is the repository
+# root, one level above this file
+STATIC_ROOT = os.getenv('STATIC_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+STATIC_DIRECTORIES = ('css', 'js', 'images')
+STATIC_GZIP_LEVEL = int(os.getenv('STATIC_GZIP_LEVEL', 9))
+STATIC_BROTLI_QUALITY = int(os.getenv('STATIC_BROTLI_QUALITY', 11))
+# Quality 11 takes about a second on a 450 KB SVG for a 1% smaller file than
+# quality 5, so files above this size are compressed at STATIC_BROTLI_LARGE_QUALITY
+STATIC_BROTLI_LARGE_SIZE = int(os.getenv('STATIC_BROTLI_LARGE_SIZE', 65536))
+STATIC_BROTLI_LARGE_QUALITY = int(os.getenv('STATIC_BROTLI_LARGE_QUALITY', 5))
+# Fingerprinted URLs change whenever the content does, so they never go stale
+STATIC_IMMUTABLE_MAX_AGE = 31536000
+
+# Already-compressed formats (PNG, JPEG, fonts) gain nothing from gzip
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+COMPRESS_MIN_SIZE = 512
+
+# css/style.3f2a9c1b0d.css -> css/style.css
+FINGERPRINT = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{10})(?P<ext>\.[^./]+)$')
+# src="css/style.css", href="/js/script.js" in pages
+ASSET_REFERENCE = re.compile(r'''(?P<attr>(?:src|href)=["'])/?(?P<path>(?:%s)/[^"'?#]+)(?=["'])'''
+                             % '|'.join(STATIC_DIRECTORIES))
+
+
+class Asset:
+    """One file, with its encodings (identity, gzip, br) and content hash"""
+
+    __slots__ = ('path', 'mimetype', 'digest', 'variants')
+
+    def __init__(self, path, data, mimetype):
+        self.path = path
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.variants = {'identity': data}
+
+        if mimetype.startswith(COMPRESSIBLE_TYPES) and len(data) >= COMPRESS_MIN_SIZE:
+            compressed = gzip.compress(data, STATIC_GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(data):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                quality = STATIC_BROTLI_QUALITY if len(data) <= STATIC_BROTLI_LARGE_SIZE \
+                    else STATIC_BROTLI_LARGE_QUALITY
+                compressed = brotli.compress(data, quality=quality)
+                if len(compressed) < len(data):
+                    self.variants['br'] = compressed
+
+    @property
+    def fingerprint(self) -> str:
+        return self.digest[:10]
+
+    def fingerprinted_path(self) -> str:
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}.{self.fingerprint}{ext}"
+
+
+class AssetStore:
+    """
+    Every file under STATIC_DIRECTORIES plus the given pages, held in memory.
+
+    Pages have their asset references rewritten to fingerprinted URLs
+    (/css/style.<hash>.css), which are served with a year-long immutable
+    Cache-Control; pages and plain asset URLs are served with no-cache, so
+    browsers revalidate them and get a 304 while the ETag still matches.
+    Each response uses the smallest encoding the client accepts (br, then
+    gzip) and carries Vary: Accept-Encoding. Files changed on disk are
+    picked up on restart.
+
+    Nothing is read at construction: the apps call load() from init_app(),
+    so gunicorn's workers inherit the store, and otherwise the first lookup
+    loads it. Processes that only import the app (QR render workers, CLI
+    tools) never pay for the compression.
+    """
+
+    def __init__(self, pages=(), root=STATIC_ROOT, directories=STATIC_DIRECTORIES):
+        self.root = root
+        self.directories = directories
+        self.pages = pages
+        self._assets = None
+        self._lock = threading.Lock()
+
+    @property
+    def assets(self) -> dict:
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self.load()
+        return self._assets
+
+    def _read(self, path):
+        with open(os.path.join(self.root, path), 'rb') as f:
+            return f.read()
+
+    def load(self):
+        assets = {}
+        for directory in self.directories:
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, directory)):
+                for filename in filenames:
+                    path = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/')
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    assets[path] = Asset(path, self._read(path), mimetype)
+
+        def fingerprint(match):
+            asset = assets.get(match.group('path'))
+            if asset is None:
+                return match.group(0)
+            return f"{match.group('attr')}/{asset.fingerprinted_path()}"
+
+        for page in self.pages:
+            try:
+                html = self._read(page).decode('utf-8')
+            except FileNotFoundError:
+                logger.warning(f"Page {page} not found under {self.root}")
+                continue
+            assets[page] = Asset(page, ASSET_REFERENCE.sub(fingerprint, html).encode('utf-8'),
+                                 'text/html')
+
+        self._assets = assets
+        size = sum(len(v) for asset in assets.values() for v in asset.variants.values())
+        logger.info(f"Loaded {len(assets)} static asset(s), {size / 1024:.0f} KiB with compressed variants"
+                    f"{'' if brotli else ' (brotli not installed, gzip only)'}")
+
+    def url(self, path) -> str:
+        """Fingerprinted URL of an asset (the plain path if it is unknown)"""
+        asset = self.assets.get(path)
+        return f"/{asset.fingerprinted_path() if asset else path}"
+
+    def _lookup(self, path):
+        """(asset, immutable) for a plain or fingerprinted path"""
+        asset = self.assets.get(path)
+        if asset is not None:
+            return asset, False
+        directory, _, filename = path.rpartition('/')
+        match = FINGERPRINT.match(filename)
+        if match:
+            asset = self.assets.get(f"{directory}/{match.group('stem')}{match.group('ext')}".lstrip('/'))
+            if asset is not None:
+                # An outdated hash still gets the current file, just not cached for good
+                return asset, asset.fingerprint == match.group('hash')
+        return None, False
+
+    def serve(self, path):
+        asset, immutable = self._lookup(path)
+        if asset is None:
+            abort(404)
+
+        accept = request.accept_encodings
+        encoding = next((e for e in ('br', 'gzip') if e in asset.variants and accept.quality(e) > 0), 'identity')
+
+        response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        # Each encoding is a different representation, so it gets its own ETag
+        response.set_etag(asset.fingerprint if encoding == 'identity' else f"{asset.fingerprint}-{encoding}")
+        if immutable:
+            response.headers['Cache-Control'] = f'public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
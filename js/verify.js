@@ -132,9 +132,14 @@ class CertificateVerifier {
         }
     }
     
+    isSecureQR(qrData) {
+        // SEC_CERT: (original), SC2: (compact) and SCR: (signed reference)
+        return ['SEC_CERT:', 'SC2:', 'SCR:'].some(prefix => qrData.startsWith(prefix));
+    }
+    
     extractCertificateNumber(qrResult) {
         // Check for encrypted QR code first
-        if (qrResult.startsWith('SEC_CERT:')) {
+        if (this.isSecureQR(qrResult)) {
             return qrResult; // Return full encrypted data
         }
         
@@ -160,7 +165,7 @@ class CertificateVerifier {
             let response;
             
             // Check if it's an encrypted QR code
-            if (certNumber.startsWith('SEC_CERT:')) {
+            if (this.isSecureQR(certNumber)) {
                 response = await fetch('/api/verify-encrypted-qr', {
                     method: 'POST',
                     headers: {